@@ -0,0 +1,119 @@
+import collections
+import queue
+import threading
+import time
+
+
+class BatchRequest:
+    """One submitted item, filled in by the batcher once its batch has run."""
+
+    def __init__(self, key, item):
+        self.key = key
+        self.item = item
+        self.submitted = time.perf_counter()
+        self.started = None
+        self.finished = None
+        self.batch_size = 0
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError("Batched request did not finish in time")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    # Seconds spent waiting for a batch to form, and running the batch itself
+    @property
+    def queue_time(self):
+        return self.started - self.submitted
+
+    @property
+    def compute_time(self):
+        return self.finished - self.started
+
+
+class RequestBatcher:
+    """
+    Coalesces requests that share a key (e.g. the model name) and arrive within
+    `max_wait` seconds into a single `run_batch(key, items)` call, which must
+    return one result per item. Runs on its own thread so callers just block on
+    `submit(...).wait()`.
+    """
+
+    def __init__(self, run_batch, max_batch=4, max_wait=0.01):
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._pending = collections.deque()  # Requests for other keys seen while filling a batch
+        self._thread = threading.Thread(target=self._run, name="request-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, key, item):
+        request = BatchRequest(key, item)
+        self._queue.put(request)
+        return request
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _next_request(self):
+        if self._pending:
+            return self._pending.popleft()
+        return self._queue.get()
+
+    def _collect(self, first):
+        batch = [first]
+        # Requests already waiting for the same key join straight away
+        for request in list(self._pending):
+            if len(batch) == self.max_batch:
+                break
+            if request.key == first.key:
+                self._pending.remove(request)
+                batch.append(request)
+
+        deadline = first.submitted + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                self._queue.put(None)  # Finish this batch, then shut down
+                break
+            if request.key == first.key:
+                batch.append(request)
+            else:
+                self._pending.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._next_request()
+            if first is None:
+                break
+            batch = self._collect(first)
+            started = time.perf_counter()
+            try:
+                results = list(self.run_batch(first.key, [request.item for request in batch]))
+                if len(results) != len(batch):
+                    raise RuntimeError(f"Batch of {len(batch)} returned {len(results)} results")
+                error = None
+            except Exception as exc:  # Hand the failure to every waiting caller
+                results = [None] * len(batch)
+                error = exc
+            finished = time.perf_counter()
+            for request, result in zip(batch, results):
+                request.started = started
+                request.finished = finished
+                request.batch_size = len(batch)
+                request.result = result
+                request.error = error
+                request._done.set()
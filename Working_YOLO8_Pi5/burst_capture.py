@@ -0,0 +1,173 @@
+"""
+Burst capture: grab a few frames back to back into one preallocated stack,
+run them through the model as a single batch, and fuse the boxes found in
+most frames into one median box each. A hovering drone's motion blur and box
+jitter average out, for much less than N separate pictures cost.
+
+    python burst_capture.py pi --model yolov8n.pt --frames 5
+    python burst_capture.py c1.jpg --model yolov8n.pt --frames 5 --runs 5
+"""
+import argparse
+import math
+import time
+
+import cv2
+import numpy as np
+
+from detection_core import Detections, pairwise_iou
+
+
+# Variance of the Laplacian on a thumbnail: higher is sharper
+def sharpness(frame, size=(320, 320)):
+    gray = cv2.cvtColor(cv2.resize(frame, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+    return float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+
+class BurstBuffer:
+    """(frames, height, width, 3) uint8 stack reused from one burst to the next."""
+
+    def __init__(self, frames=5, frame_shape=(1280, 1280, 3)):
+        self.frames = frames
+        self._allocate(tuple(frame_shape))
+
+    def _allocate(self, frame_shape):
+        self.frame_shape = frame_shape
+        # np.ones touches every page now rather than during the first burst
+        self.stack = np.ones((self.frames,) + frame_shape, dtype=np.uint8)
+
+    def capture(self, capture):
+        """
+        Fill the stack from `capture()` as fast as it delivers frames; returns the
+        stack. The first frame sets its size; later frames of another size (the
+        capture scale changed mid-burst) are resized to it.
+        """
+        for index in range(self.frames):
+            frame = capture()
+            if frame.ndim == 3 and frame.shape[2] == 4:
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+            if frame.shape != self.frame_shape:
+                if index == 0:
+                    self._allocate(frame.shape)
+                else:  # Reallocating now would lose the frames already taken
+                    cv2.resize(frame, (self.frame_shape[1], self.frame_shape[0]), dst=self.stack[index],
+                               interpolation=cv2.INTER_AREA)
+                    continue
+            np.copyto(self.stack[index], frame)
+        return self.stack
+
+
+def fuse_detections(detections_list, iou=0.5, min_votes=None):
+    """
+    Fuse the detections of several frames of the same scene. Boxes of the same
+    class that overlap by `iou` across frames are one object; objects seen in at
+    least `min_votes` frames (a majority by default) are kept with the median of
+    their boxes, and a confidence of their mean confidence times the share of
+    frames they were seen in. Returns the fused Detections and the votes per box.
+    """
+    frames = len(detections_list)
+    min_votes = math.ceil(frames / 2) if min_votes is None else min_votes
+    names = detections_list[0].names
+    boxes, confs = [], []  # Per object: every frame's box and confidence
+    centers = np.empty((0, 4), dtype=np.float32)  # Running median box per object, to match the next frame against
+    object_cls = np.empty(0, dtype=np.int64)
+    for detections in detections_list:
+        matched = np.full(len(detections), -1)
+        if len(centers) and len(detections):
+            overlap = pairwise_iou(detections.xyxy, centers)
+            overlap[detections.cls[:, None] != object_cls[None]] = 0
+            for index in np.argsort(-overlap.max(axis=1)):
+                target = int(np.argmax(overlap[index]))
+                if overlap[index, target] >= iou:
+                    matched[index] = target
+                    overlap[:, target] = 0
+        for index, target in enumerate(matched.tolist()):
+            if target < 0:
+                boxes.append([])
+                confs.append([])
+                centers = np.vstack([centers, detections.xyxy[index:index + 1]])
+                object_cls = np.append(object_cls, detections.cls[index])
+                target = len(boxes) - 1
+            boxes[target].append(detections.xyxy[index])
+            confs[target].append(float(detections.conf[index]))
+            centers[target] = np.median(boxes[target], axis=0)
+    votes = np.array([len(object_boxes) for object_boxes in boxes], dtype=np.int64)
+    keep = np.flatnonzero(votes >= min_votes) if len(votes) else np.empty(0, dtype=np.int64)
+    fused = Detections(
+        centers[keep],
+        [np.mean(confs[index]) * votes[index] / frames for index in keep.tolist()],
+        object_cls[keep],
+        names,
+    )
+    return fused, votes[keep]
+
+
+class BurstCapture:
+    """
+    Burst of `frames` pictures from `capture()`, detected in one batch by the
+    backend of `core` (a DetectionCore), fused, then lens corrected by its
+    correction. `capture()` returns the sharpest frame of the burst, to show and
+    click on, with the fused detections. The cache is skipped: a burst is never
+    the same pixels twice.
+    """
+
+    def __init__(self, capture, core, frames=5, iou=0.5, min_votes=None):
+        self._capture = capture
+        self.core = core
+        self.iou = iou
+        self.min_votes = min_votes
+        self.buffer = BurstBuffer(frames)
+        self.votes = None
+        self.timings = {}
+
+    def capture(self):
+        start_time = time.perf_counter()
+        stack = self.buffer.capture(self._capture)
+        captured = time.perf_counter()
+        detections_list = self.core.backend.detect_batch(list(stack))
+        detected = time.perf_counter()
+        fused, self.votes = fuse_detections(detections_list, self.iou, self.min_votes)
+        if self.core.correction is not None:
+            fused = self.core.correction.correct_detections(fused, stack.shape[1:])
+        sharpest = int(np.argmax([sharpness(frame) for frame in stack]))
+        self.timings = {"capture": captured - start_time, "detect": detected - captured,
+                        "fuse": time.perf_counter() - detected}
+        return stack[sharpest].copy(), fused
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Burst capture with batched detection and box fusion")
+    parser.add_argument("source", help='"pi", "pi:N", or an image folder, glob or video to replay')
+    parser.add_argument("--model", default="yolov8n.pt", help="YOLO model to run")
+    parser.add_argument("--frames", type=int, default=5, help="Frames per burst")
+    parser.add_argument("--runs", type=int, default=3, help="Bursts to time")
+    parser.add_argument("--size", type=int, nargs=2, default=(1280, 1280), help="Frame width and height")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    from ultralytics import YOLO
+
+    from camera_source import open_source
+    from detection_core import DetectionCore, REFERENCE_POLICIES, UltralyticsBackend
+    from warmup import warm_up
+
+    model = YOLO(args.model)
+    warm_up(model, frame_shape=(args.size[1], args.size[0], 3))
+    backend = UltralyticsBackend(model, verbose=False)
+    camera = open_source(args.source, tuple(args.size))
+    core = DetectionCore(backend, REFERENCE_POLICIES["Real Car"])
+    burst = BurstCapture(camera.capture_array, core, args.frames)
+    try:
+        for _ in range(args.runs):
+            start_time = time.perf_counter()
+            single = backend.detect(camera.capture_array()[..., :3])
+            single_time = time.perf_counter() - start_time
+            frame, fused = burst.capture()
+            total = sum(burst.timings.values())
+            print(f"single: {len(single)} objects in {single_time * 1000:.0f} ms; "
+                  f"burst of {args.frames}: {len(fused)} objects in {total * 1000:.0f} ms "
+                  f"({total / single_time:.1f}x, capture {burst.timings['capture'] * 1000:.0f} ms, "
+                  f"detect {burst.timings['detect'] * 1000:.0f} ms), votes {burst.votes.tolist()}")
+    finally:
+        camera.stop()
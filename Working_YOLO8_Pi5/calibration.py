@@ -0,0 +1,265 @@
+"""
+Lens calibration and precomputed correction tables. Calibrate once per camera
+mode from chessboard pictures, then every frame is corrected with a single
+cv2.remap through lookup tables that are built once and cached on disk, or,
+when remapping whole frames costs too much, only the box corners and clicked
+points are corrected.
+
+    python calibration.py calibrate "chessboard/*.jpg" --pattern 9 6 --output calibration.json
+    python calibration.py benchmark calibration.json --size 1280 1280
+
+Scripts pick the calibration up from $CAMERA_CALIBRATION; $CAMERA_CORRECTION=points
+corrects detections instead of frames.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from camera_source import list_images
+from detection_core import Detections
+from ground_scale import CameraModel
+
+DEFAULT_REMAP_DIR = os.path.join(os.path.expanduser("~"), ".cache", "aerial_measurement", "remap")
+
+
+class Calibration:
+    """Camera matrix and distortion coefficients measured at `image_size` (width, height)."""
+
+    def __init__(self, camera_matrix, dist_coeffs, image_size, rms=None):
+        self.camera_matrix = np.asarray(camera_matrix, dtype=np.float64).reshape(3, 3)
+        self.dist_coeffs = np.asarray(dist_coeffs, dtype=np.float64).reshape(-1)
+        self.image_size = tuple(int(value) for value in image_size)
+        self.rms = rms
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({
+                "camera_matrix": self.camera_matrix.tolist(),
+                "dist_coeffs": self.dist_coeffs.tolist(),
+                "image_size": list(self.image_size),
+                "rms": self.rms,
+            }, f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["camera_matrix"], data["dist_coeffs"], data["image_size"], data.get("rms"))
+
+    def camera_model(self, corrected=False):
+        """CameraModel for ground_scale.py; `corrected` for frames that were already remapped."""
+        dist_coeffs = None if corrected else self.dist_coeffs
+        return CameraModel(None, None, None, self.image_size, self.camera_matrix, dist_coeffs)
+
+
+def find_chessboard(frame, pattern):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    found, corners = cv2.findChessboardCorners(gray, pattern, cv2.CALIB_CB_ADAPTIVE_THRESH | cv2.CALIB_CB_NORMALIZE_IMAGE)
+    if not found:
+        return None
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+    return cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), criteria)
+
+
+def calibrate(paths, pattern=(9, 6), square_size=1.0):
+    """Calibrate from chessboard pictures with `pattern` inner corners. Returns a Calibration."""
+    board = np.zeros((pattern[0] * pattern[1], 3), np.float32)
+    board[:, :2] = np.mgrid[0:pattern[0], 0:pattern[1]].T.reshape(-1, 2) * square_size
+    object_points, image_points, image_size = [], [], None
+    for path in paths:
+        frame = cv2.imread(path)
+        if frame is None:
+            continue
+        size = (frame.shape[1], frame.shape[0])
+        if image_size is not None and size != image_size:
+            raise ValueError(f"{path} is {size[0]}x{size[1]}, the other pictures are {image_size[0]}x{image_size[1]}")
+        image_size = size
+        corners = find_chessboard(frame, pattern)
+        if corners is not None:
+            object_points.append(board)
+            image_points.append(corners)
+    if len(image_points) < 3:
+        raise ValueError(f"Found the chessboard in {len(image_points)} pictures, need at least 3")
+    rms, camera_matrix, dist_coeffs, _, _ = cv2.calibrateCamera(object_points, image_points, image_size, None, None)
+    return Calibration(camera_matrix, dist_coeffs, image_size, rms)
+
+
+# Rotation that turns a camera tilted `tilt` degrees forward into one looking straight down
+def _level_rotation(tilt):
+    theta = np.radians(tilt)
+    return np.array([[1, 0, 0], [0, np.cos(theta), -np.sin(theta)], [0, np.sin(theta), np.cos(theta)]])
+
+
+class RemapTables:
+    """
+    Correction for frames of `size` from `camera`: lens distortion and, with a
+    `tilt`, the perspective of a camera that is not looking straight down. The
+    fixed-point tables are built once and saved in `directory` as .npy files,
+    so later runs memory-map them instead of building them again.
+    """
+
+    def __init__(self, camera, size, tilt=0.0, directory=DEFAULT_REMAP_DIR):
+        self.size = tuple(size)
+        self.matrix = camera.intrinsics(self.size)
+        self.dist_coeffs = camera.dist_coeffs
+        self.rotation = _level_rotation(tilt) if tilt else None
+        digest = hashlib.blake2b(digest_size=12)
+        for part in (self.matrix, self.dist_coeffs, np.array(self.size), np.array([tilt])):
+            digest.update(np.ascontiguousarray(part, dtype=np.float64).tobytes())
+        self.key = digest.hexdigest()
+        self.map1, self.map2 = self._load_or_build(directory)
+
+    def _load_or_build(self, directory):
+        paths = [] if directory is None else [os.path.join(directory, f"{self.key}.{name}.npy") for name in ("map1", "map2")]
+        if paths and all(os.path.exists(path) for path in paths):
+            try:
+                return tuple(np.load(path, mmap_mode="r") for path in paths)
+            except (OSError, ValueError):
+                pass  # Half-written, build them again
+        maps = cv2.initUndistortRectifyMap(self.matrix, self.dist_coeffs, self.rotation, self.matrix,
+                                           self.size, cv2.CV_16SC2)
+        if paths:
+            os.makedirs(directory, exist_ok=True)
+            for path, table in zip(paths, maps):
+                temporary_path = f"{path}.{os.getpid()}.tmp.npy"
+                np.save(temporary_path, table)
+                os.replace(temporary_path, path)
+        return maps
+
+    def remap(self, frame, dst=None):
+        """Corrected frame; pass `dst` to reuse a buffer instead of allocating one per frame."""
+        return cv2.remap(frame, self.map1, self.map2, cv2.INTER_LINEAR, dst=dst)
+
+    def correct_points(self, points):
+        """Where (N, 2) points of the raw frame land in the corrected frame."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+        if not len(points):
+            return points.reshape(0, 2)
+        return cv2.undistortPoints(points, self.matrix, self.dist_coeffs, R=self.rotation, P=self.matrix).reshape(-1, 2)
+
+    def correct_boxes(self, xyxy):
+        """Boxes that enclose the corrected corners of raw-frame boxes."""
+        xyxy = np.asarray(xyxy, dtype=np.float64).reshape(-1, 4)
+        corners = xyxy[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 2)
+        corrected = self.correct_points(corners).reshape(-1, 4, 2)
+        return np.concatenate([corrected.min(axis=1), corrected.max(axis=1)], axis=1)
+
+    def correct_detections(self, detections):
+        # Keep the raw result so plotting still draws on the uncorrected frame
+        return Detections(self.correct_boxes(detections.xyxy), detections.conf, detections.cls,
+                          detections.names, raw=detections.raw, frame_xyxy=detections.frame_xyxy)
+
+
+# Tables per camera, size and tilt, shared by everything in the process
+_TABLES = {}
+
+
+def remap_tables(camera, size, tilt=0.0, directory=DEFAULT_REMAP_DIR):
+    key = (camera.intrinsics(tuple(size)).tobytes(), camera.dist_coeffs.tobytes(), tuple(size), tilt)
+    if key not in _TABLES:
+        _TABLES[key] = RemapTables(camera, size, tilt, directory)
+    return _TABLES[key]
+
+
+class CorrectedCamera:
+    """Wraps a Picamera2 or ReplayCamera so every captured frame comes back corrected."""
+
+    def __init__(self, camera, calibration, tilt=0.0):
+        self.camera = camera
+        self.calibration = calibration
+        self.tilt = tilt
+        self._tables = None
+
+    def __getattr__(self, name):
+        return getattr(self.camera, name)
+
+    def capture_array(self):
+        frame = self.camera.capture_array()
+        if self._tables is None or self._tables.size != (frame.shape[1], frame.shape[0]):
+            self._tables = remap_tables(self.calibration.camera_model(), (frame.shape[1], frame.shape[0]), self.tilt)
+        # A new array per frame: callers keep frames around (annotated pictures, batches)
+        return self._tables.remap(frame)
+
+
+def correction_mode():
+    """'frames', 'points', or None when no $CAMERA_CALIBRATION is set."""
+    if not os.environ.get("CAMERA_CALIBRATION"):
+        return None
+    return "points" if os.environ.get("CAMERA_CORRECTION") == "points" else "frames"
+
+
+def load_env_calibration():
+    path = os.environ.get("CAMERA_CALIBRATION")
+    return Calibration.load(path) if path else None
+
+
+class PointCorrection:
+    """
+    Corrects detections and clicked points instead of whole frames, for
+    DetectionCore's `correction`. Costs a few corners per box instead of a remap.
+    """
+
+    def __init__(self, calibration, tilt=0.0):
+        self.calibration = calibration
+        self.tilt = tilt
+
+    def tables(self, frame_shape):
+        return remap_tables(self.calibration.camera_model(), (frame_shape[1], frame_shape[0]), self.tilt)
+
+    def correct_detections(self, detections, frame_shape):
+        return self.tables(frame_shape).correct_detections(detections)
+
+    def correct_point(self, point, frame_shape):
+        return tuple(self.tables(frame_shape).correct_points([point])[0].tolist())
+
+
+def benchmark(calibration, size, frames=100):
+    frame = np.random.default_rng(0).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    start_time = time.perf_counter()
+    tables = RemapTables(calibration.camera_model(), size, directory=None)
+    build_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    tables = RemapTables(calibration.camera_model(), size)
+    tables = RemapTables(calibration.camera_model(), size)
+    load_time = time.perf_counter() - start_time
+    dst = np.empty_like(frame)
+    start_time = time.perf_counter()
+    for _ in range(frames):
+        tables.remap(frame, dst)
+    remap_time = (time.perf_counter() - start_time) / frames
+    boxes = np.tile([100.0, 100.0, 300.0, 250.0], (20, 1))
+    start_time = time.perf_counter()
+    for _ in range(frames):
+        tables.correct_boxes(boxes)
+    points_time = (time.perf_counter() - start_time) / frames
+    print(f"{size[0]}x{size[1]}: build tables {build_time * 1000:.1f} ms, load from disk {load_time * 1000:.1f} ms")
+    print(f"  remap frame {remap_time * 1000:.2f} ms, correct 20 boxes {points_time * 1000:.3f} ms")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Camera calibration and correction tables")
+    commands = parser.add_subparsers(dest="command", required=True)
+    calibrate_parser = commands.add_parser("calibrate", help="Calibrate from chessboard pictures")
+    calibrate_parser.add_argument("source", help="Folder or glob of chessboard pictures")
+    calibrate_parser.add_argument("--pattern", type=int, nargs=2, default=(9, 6), help="Inner corners per row and column")
+    calibrate_parser.add_argument("--square-size", type=float, default=1.0, help="Chessboard square size")
+    calibrate_parser.add_argument("--output", default="calibration.json", help="Where to save the calibration")
+    benchmark_parser = commands.add_parser("benchmark", help="Time table building, remap and point correction")
+    benchmark_parser.add_argument("calibration", help="Calibration JSON")
+    benchmark_parser.add_argument("--size", type=int, nargs=2, default=(1280, 1280), help="Frame width and height")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "calibrate":
+        calibration = calibrate(list_images(args.source), tuple(args.pattern), args.square_size)
+        calibration.save(args.output)
+        print(f"Saved {args.output}: {calibration.image_size[0]}x{calibration.image_size[1]}, RMS error {calibration.rms:.3f} pixels")
+    else:
+        benchmark(Calibration.load(args.calibration), tuple(args.size))
@@ -0,0 +1,248 @@
+"""
+Camera sources. `open_camera()` returns the Pi camera, or a ReplayCamera when a
+source is given or the CAMERA_SOURCE environment variable is set, so every script
+can run and be benchmarked off the Pi:
+
+    CAMERA_SOURCE=. python yolo8_GUI_select_model.py          # bundled c*.jpg / gw.jpg
+    CAMERA_SOURCE=flight.mp4 python yolo8.py
+    python camera_source.py "c*.jpg" --fps 30 --model yolov8n.pt
+"""
+import argparse
+import glob
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tiff")
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".h264")
+
+
+# Set up the Pi camera the same way every script in this folder does; the Pi 5 has two camera ports
+def open_picamera(size=(1280, 1280), format="RGB888", camera_num=0):
+    from picamera2 import Picamera2
+
+    picam2 = Picamera2(camera_num)
+    picam2.preview_configuration.main.size = size
+    picam2.preview_configuration.main.format = format
+    picam2.preview_configuration.align()
+    picam2.configure("preview")
+    picam2.start()
+    return picam2
+
+
+def list_images(source):
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in sorted(os.listdir(source))]
+    else:
+        paths = sorted(glob.glob(source))
+    return [path for path in paths if path.lower().endswith(IMAGE_EXTENSIONS)]
+
+
+def is_video(source):
+    return source.lower().endswith(VIDEO_EXTENSIONS) or "://" in source
+
+
+# Picamera2 "RGB888" frames are 3 channels in BGR order; the 4 channel formats are
+# named by their little-endian words, so "XBGR8888" is R, G, B, X in memory and "XRGB8888" B, G, R, X
+def _to_format(frame, format):
+    if format == "XBGR8888":
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA)
+    if format == "XRGB8888":
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA)
+    return frame
+
+
+class ReplayCamera:
+    """
+    Stands in for Picamera2 by replaying image files or a video. Frames come back
+    from `capture_array()` with the same shape and channel order as the preview
+    configuration, paced to `fps` or as fast as they can be produced when `fps`
+    is None. Images are decoded once and cached, so a folder replays at memory speed.
+    """
+
+    def __init__(self, source, size=(1280, 1280), format="RGB888", fps=None, loop=True):
+        self.source = source
+        self.size = size
+        self.format = format
+        self.fps = fps
+        self.loop = loop
+        self._next_time = None
+        self._index = 0
+        if is_video(source):
+            self.paths = []
+            self._video = cv2.VideoCapture(source)
+            if not self._video.isOpened():
+                raise ValueError(f"Could not open video {source}")
+        else:
+            self.paths = list_images(source)
+            if not self.paths:
+                raise ValueError(f"No images found in {source}")
+            self._video = None
+        self._frames = {}
+
+    def start(self):
+        self._next_time = None
+
+    def stop(self):
+        if self._video is not None:
+            self._video.release()
+
+    def _load(self, path):
+        if path not in self._frames:
+            frame = cv2.imread(path)
+            if frame is None:
+                raise ValueError(f"Could not read {path}")
+            self._frames[path] = _to_format(cv2.resize(frame, self.size), self.format)
+        return self._frames[path]
+
+    def _read_video(self):
+        ok, frame = self._video.read()
+        if not ok and self.loop:
+            self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self._video.read()
+        if not ok:
+            raise EOFError(f"End of {self.source}")
+        if (frame.shape[1], frame.shape[0]) != tuple(self.size):
+            frame = cv2.resize(frame, self.size)
+        return _to_format(frame, self.format)
+
+    def _wait_for_next_frame(self):
+        if self.fps is None:
+            return
+        now = time.perf_counter()
+        if self._next_time is None or self._next_time < now - 1:
+            self._next_time = now  # First frame, or we fell far behind
+        elif self._next_time > now:
+            time.sleep(self._next_time - now)
+        self._next_time += 1 / self.fps
+
+    def capture_array(self):
+        self._wait_for_next_frame()
+        if self._video is not None:
+            return self._read_video()
+        if self._index >= len(self.paths) and not self.loop:
+            raise EOFError(f"End of {self.source}")
+        path = self.paths[self._index % len(self.paths)]
+        self._index += 1
+        return self._load(path).copy()
+
+
+class ReplayStream:
+    """
+    Drop-in for rpi_vision's PiCameraStream: a background thread keeps `frame`
+    updated from a ReplayCamera, with the same `resolution`, `read()` and `stopped`.
+    Frames are RGB, like PiCameraStream's.
+    """
+
+    def __init__(self, source, resolution=(320, 240), fps=30):
+        self.resolution = resolution
+        self.camera = ReplayCamera(source, size=resolution, fps=fps)
+        self.frame = None
+        self.stopped = False
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._update, name="replay-stream", daemon=True)
+        self._thread.start()
+        return self
+
+    def _update(self):
+        while not self.stopped:
+            try:
+                frame = self.camera.capture_array()
+            except EOFError:
+                self.stopped = True
+                break
+            self.frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    def read(self):
+        return self.frame
+
+    def stop(self):
+        self.stopped = True
+        if self._thread is not None:
+            self._thread.join()
+        self.camera.stop()
+
+
+# Open the Pi camera, or replay `source` (falling back to $CAMERA_SOURCE) when one is given.
+# With $CAMERA_CALIBRATION set, frames come back lens corrected (see calibration.py).
+def open_camera(source=None, size=(1280, 1280), format="RGB888", fps=None):
+    source = source or os.environ.get("CAMERA_SOURCE")
+    if source is None:
+        camera = open_picamera(size, format)
+    else:
+        camera = ReplayCamera(source, size, format, fps=fps or _env_fps())
+        camera.start()
+    from calibration import CorrectedCamera, correction_mode, load_env_calibration
+
+    if correction_mode() == "frames":
+        camera = CorrectedCamera(camera, load_env_calibration())
+    return camera
+
+
+# Open one of several sources: "pi" or "pi:1" for a Pi camera port, anything else is replayed
+def open_source(source, size=(1280, 1280), format="RGB888", fps=None):
+    if source == "pi" or source.startswith("pi:"):
+        return open_picamera(size, format, int(source.partition(":")[2] or 0))
+    camera = ReplayCamera(source, size, format, fps=fps)
+    camera.start()
+    return camera
+
+
+def _env_fps():
+    fps = os.environ.get("CAMERA_FPS")
+    return float(fps) if fps else None
+
+
+# Measure capture throughput, and detection throughput when a model is given
+def benchmark(source, frames=200, fps=None, model_name=None, size=(1280, 1280)):
+    camera = ReplayCamera(source, size=size, fps=fps)
+    backend = None
+    if model_name is not None:
+        from ultralytics import YOLO
+
+        from detection_core import UltralyticsBackend
+        from warmup import warm_up
+
+        model = YOLO(model_name)
+        warm_up(model, frame_shape=(size[1], size[0], 3))
+        backend = UltralyticsBackend(model, verbose=False)
+
+    capture_times = np.empty(frames)
+    detect_times = np.empty(frames)
+    start_time = time.perf_counter()
+    for index in range(frames):
+        step = time.perf_counter()
+        frame = camera.capture_array()
+        capture_times[index] = time.perf_counter() - step
+        step = time.perf_counter()
+        if backend is not None:
+            backend.detect(frame)
+        detect_times[index] = time.perf_counter() - step
+    total = time.perf_counter() - start_time
+    camera.stop()
+
+    print(f"{frames} frames from {source} at {size[0]}x{size[1]} in {total:.2f} s ({frames / total:.1f} FPS)")
+    print(f"capture: mean {capture_times.mean() * 1000:.2f} ms, p95 {np.percentile(capture_times, 95) * 1000:.2f} ms")
+    if backend is not None:
+        print(f"detect ({model_name}): mean {detect_times.mean() * 1000:.1f} ms, "
+              f"p95 {np.percentile(detect_times, 95) * 1000:.1f} ms")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay-camera throughput benchmark")
+    parser.add_argument("source", help="Image file, folder, glob or video file")
+    parser.add_argument("--frames", type=int, default=200, help="Number of frames to capture")
+    parser.add_argument("--fps", type=float, default=None, help="Pace the replay, default is as fast as possible")
+    parser.add_argument("--model", default=None, help="Also run this YOLO model on every frame")
+    parser.add_argument("--size", type=int, nargs=2, default=(1280, 1280), help="Frame width and height")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    benchmark(args.source, args.frames, args.fps, args.model, tuple(args.size))
@@ -0,0 +1,87 @@
+"""
+Class allow-lists, so models only do the work for the classes a GUI uses.
+At export time the Detect head's class convolutions are cut down to the kept
+classes (fewer output channels and a smaller out0 to decode); at run time
+UltralyticsBackend(model, classes=...) and ncnn_decode.decode(classes=...)
+drop the other classes before NMS.
+
+    python class_filter.py yolov8x.pt --classes car truck "cell phone"    # writes yolov8x_car_truck_cell_phone.pt
+    python class_filter.py yolov8x.pt --classes car truck --ncnn          # and exports it to ncnn
+
+Scripts take an allow-list from $DETECT_CLASSES ("car,truck,cell phone").
+"""
+import argparse
+import os
+
+from detection_core import class_ids
+
+
+def allowed_classes(default=None):
+    """Class names from $DETECT_CLASSES, or `default` when it is not set."""
+    value = os.environ.get("DETECT_CLASSES")
+    if not value:
+        return default
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def _slice_conv(conv, keep):
+    import torch
+
+    conv.weight = torch.nn.Parameter(conv.weight.data[keep].clone())
+    if conv.bias is not None:
+        conv.bias = torch.nn.Parameter(conv.bias.data[keep].clone())
+    conv.out_channels = len(keep)
+
+
+def prune_detect_head(model, classes):
+    """
+    Cut an Ultralytics YOLO model's Detect head down to `classes` (names or ids)
+    in place. The kept classes are renumbered from 0 in their original order and
+    `model.names` follows. Returns the original ids of the kept classes.
+    """
+    keep = class_ids(model.names, classes)
+    if not len(keep):
+        raise ValueError("None of the classes are known to this model")
+    network = model.model
+    head = network.model[-1]
+    if not hasattr(head, "cv3"):
+        raise ValueError(f"{type(head).__name__} head has no class branch to prune")
+    for branches in (head.cv3, getattr(head, "one2one_cv3", None) or []):
+        for branch in branches:
+            _slice_conv(branch[-1], keep.tolist())
+    names = model.names
+    head.nc = len(keep)
+    head.no = head.nc + head.reg_max * 4
+    network.names = {index: names[int(class_id)] for index, class_id in enumerate(keep)}
+    if isinstance(getattr(network, "yaml", None), dict):
+        network.yaml["nc"] = head.nc
+    return keep
+
+
+def export_pruned(weights, classes, ncnn=False, imgsz=640):
+    """Save a pruned copy of `weights` (and export it to ncnn). Returns the saved .pt path."""
+    from ultralytics import YOLO
+
+    model = YOLO(weights)
+    prune_detect_head(model, classes)
+    suffix = "_".join(name.replace(" ", "_") for name in model.names.values())
+    path = f"{os.path.splitext(os.path.basename(weights))[0]}_{suffix}.pt"
+    model.save(path)
+    if ncnn:
+        YOLO(path).export(format="ncnn", imgsz=imgsz)
+    return path
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Prune a YOLOv8 detection head to a few classes")
+    parser.add_argument("weights", help="YOLOv8 .pt weights")
+    parser.add_argument("--classes", nargs="+", required=True, help="Class names (or ids) to keep")
+    parser.add_argument("--ncnn", action="store_true", help="Also export the pruned model to ncnn")
+    parser.add_argument("--imgsz", type=int, default=640, help="Export image size")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    path = export_pruned(args.weights, args.classes, args.ncnn, args.imgsz)
+    print(f"Saved {path}")
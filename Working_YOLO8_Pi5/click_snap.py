@@ -0,0 +1,138 @@
+import math
+import threading
+
+import cv2
+import numpy as np
+
+
+# Vertex of the parabola through (-1, left), (0, center), (1, right), clipped to half a pixel
+def parabola_offset(left, center, right):
+    curvature = left - 2 * center + right
+    if curvature >= 0:
+        return 0.0  # Not a peak
+    return float(np.clip(0.5 * (left - right) / curvature, -0.5, 0.5))
+
+
+# Levels EdgePyramid.snap looks at for `radius`: coarser ones keep the search window within `window` pixels
+def pyramid_levels(radius, window=16):
+    return 1 + max(0, math.ceil(math.log2(radius / window)))
+
+
+class EdgePyramid:
+    """
+    Gradient magnitude and Canny edges of a frame at full, half, quarter...
+    resolution, so a click can be matched against the nearest edge without
+    filtering the picture at click time. Canny thresholds follow the picture's
+    own gradient strength (the top 10% of gradients count as strong).
+    """
+
+    def __init__(self, frame, levels=3):
+        image = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY if frame.shape[2] == 3 else cv2.COLOR_BGRA2GRAY) \
+            if frame.ndim == 3 else frame
+        self.magnitudes = []
+        self.edges = []
+        for level in range(levels):
+            gx = cv2.Sobel(image, cv2.CV_32F, 1, 0, ksize=3)
+            gy = cv2.Sobel(image, cv2.CV_32F, 0, 1, ksize=3)
+            magnitude = cv2.magnitude(gx, gy)
+            high = max(float(np.percentile(magnitude[::4, ::4], 90)), 1.0)
+            self.magnitudes.append(magnitude)
+            self.edges.append(cv2.Canny(image, high / 2, high, L2gradient=True))
+            if level == 0:
+                # Only which way the gradient points is needed later, one byte per pixel instead of two float maps
+                self.across_x = np.abs(gx) >= np.abs(gy)
+            image = cv2.pyrDown(image)
+
+    # Nearest edge pixel to (x, y) within `radius` at one level, None when there is none
+    def nearest_edge(self, level, x, y, radius):
+        edges = self.edges[level]
+        height, width = edges.shape
+        x0, y0 = max(int(round(x - radius)), 0), max(int(round(y - radius)), 0)
+        x1, y1 = min(int(round(x + radius)) + 1, width), min(int(round(y + radius)) + 1, height)
+        ys, xs = np.nonzero(edges[y0:y1, x0:x1])
+        if not len(xs):
+            return None
+        xs, ys = xs + x0, ys + y0
+        distances = np.hypot(xs - x, ys - y)
+        nearest = int(np.argmin(distances))
+        if distances[nearest] > radius:
+            return None
+        return int(xs[nearest]), int(ys[nearest])
+
+    def refine(self, x, y):
+        """Sub-pixel edge position across the edge, from a parabola through the gradient magnitude."""
+        magnitude = self.magnitudes[0]
+        height, width = magnitude.shape
+        if not (0 < x < width - 1 and 0 < y < height - 1):
+            return float(x), float(y)
+        if self.across_x[y, x]:
+            return x + parabola_offset(magnitude[y, x - 1], magnitude[y, x], magnitude[y, x + 1]), float(y)
+        return float(x), y + parabola_offset(magnitude[y - 1, x], magnitude[y, x], magnitude[y + 1, x])
+
+    def snap(self, x, y, radius):
+        """
+        Nearest edge to (x, y) within `radius` full resolution pixels, found on the
+        coarsest level that keeps the search window small and followed down to
+        full resolution. None when there is no edge that close.
+        """
+        level = 0
+        while level < len(self.edges) - 1 and radius / 2 ** level > 16:  # See pyramid_levels
+            level += 1
+        point = self.nearest_edge(level, x / 2 ** level, y / 2 ** level, radius / 2 ** level)
+        while point is not None and level > 0:
+            level -= 1
+            point = self.nearest_edge(level, point[0] * 2 + 0.5, point[1] * 2 + 0.5, 2)
+        if point is None:
+            return None
+        return self.refine(*point)
+
+
+class ClickSnapper:
+    """
+    Moves clicked points onto the nearest detection box corner within
+    `corner_radius` pixels, otherwise onto the nearest strong edge within
+    `radius`, at full resolution. The edge pyramid is built on a background
+    thread as soon as a picture is processed; until it is ready only corners snap.
+    `frame` must be the raw picture, the annotated one has boxes drawn on it, and
+    clicks and snapped points are in its pixels, before any lens correction.
+    """
+
+    def __init__(self, frame, detections=None, radius=8, corner_radius=12, levels=None):
+        self.radius = radius
+        self.corner_radius = corner_radius
+        self.corners = np.empty((0, 2))
+        if detections is not None and len(detections):
+            self.corners = detections.frame_xyxy[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 2).astype(np.float64)
+        if levels is None:
+            levels = pyramid_levels(radius)
+        self.pyramid = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._build, args=(frame, levels), name="edge-pyramid", daemon=True)
+        self._thread.start()
+
+    def _build(self, frame, levels):
+        try:
+            self.pyramid = EdgePyramid(frame, levels)
+        finally:
+            self._ready.set()
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def snap(self, point):
+        """Snapped (x, y) for a full resolution click, or the click itself when nothing is close."""
+        x, y = point
+        if len(self.corners):
+            distances = np.hypot(self.corners[:, 0] - x, self.corners[:, 1] - y)
+            nearest = int(np.argmin(distances))
+            if distances[nearest] <= self.corner_radius:
+                return tuple(self.corners[nearest].tolist())
+        if self.pyramid is not None:
+            edge = self.pyramid.snap(x, y, self.radius)
+            if edge is not None:
+                return edge
+        return float(x), float(y)
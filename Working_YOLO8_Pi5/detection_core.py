@@ -0,0 +1,357 @@
+import json
+import math
+
+import cv2
+import numpy as np
+
+
+# Distance in pixels between two points
+def calculate_distance(x1, y1, x2, y2):
+    return math.hypot(x2 - x1, y2 - y1)
+
+
+# Center distance and edge gap (0 when touching or overlapping) between every pair of boxes, as two (N, N) arrays
+def pairwise_distances(xyxy):
+    xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+    centers = (xyxy[:, :2] + xyxy[:, 2:]) / 2
+    center_distance = np.hypot(*(centers[:, None] - centers[None]).transpose(2, 0, 1))
+    low, high = xyxy[:, :2], xyxy[:, 2:]
+    gaps = np.maximum(np.maximum(low[:, None], low[None]) - np.minimum(high[:, None], high[None]), 0)
+    return center_distance, np.hypot(gaps[..., 0], gaps[..., 1])
+
+
+# Intersection over union between every box of `a` and every box of `b`, as an (N, M) array
+def pairwise_iou(a, b):
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    width = np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0])
+    height = np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1])
+    intersection = np.clip(width, 0, None) * np.clip(height, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return intersection / np.maximum(area_a[:, None] + area_b[None] - intersection, 1e-9)
+
+
+# Map a click on the half-size display back to full resolution frame coordinates
+def display_to_frame(x, y, frame_shape, display_scale=2):
+    height, width = frame_shape[:2]
+    return x * width / (width // display_scale), y * height / (height // display_scale)
+
+
+def class_ids(names, classes, strict=True):
+    """
+    Sorted ids for `classes`, given as names or ids; None keeps every class.
+    Names the model does not know raise ValueError, or are skipped when not `strict`.
+    """
+    if classes is None:
+        return None
+    by_name = {name.lower(): class_id for class_id, name in names.items()}
+    ids = []
+    for value in classes:
+        if isinstance(value, str) and not value.isdigit():
+            if value.lower() in by_name:
+                ids.append(by_name[value.lower()])
+            elif strict:
+                raise ValueError(f"Unknown class {value!r}")
+        else:
+            ids.append(int(value))
+    return np.array(sorted(set(ids)), dtype=np.int64)
+
+
+class ReferencePolicy:
+    """
+    How a picture is scaled to real units: the classes whose average box diagonal
+    is taken as `real_size` units long, or a fixed `pixels_per_unit` when the
+    scale is known up front. `reference_classes=None` uses every detected box.
+    """
+
+    def __init__(self, mode, unit, real_size=None, reference_classes=None, pixels_per_unit=None):
+        self.mode = mode
+        self.unit = unit
+        self.real_size = real_size
+        self.reference_classes = None if reference_classes is None else [name.lower() for name in reference_classes]
+        self.pixels_per_unit = pixels_per_unit
+
+    def reference_mask(self, detections):
+        if self.reference_classes is None:
+            return np.ones(len(detections), dtype=bool)
+        return np.isin(detections.cls, class_ids(detections.names, self.reference_classes, strict=False))
+
+    # Real distance between two frame points when the policy knows better than one
+    # scale for the whole picture (see ground_scale.GroundPolicy), None otherwise
+    def ground_distance(self, point_a, point_b):
+        return None
+
+    # Same for (N, 2) frame points: their positions on the ground in real units, or None
+    def ground_points(self, points):
+        return None
+
+
+# Modes offered by the GUIs, keyed by the name shown in their dropdowns
+REFERENCE_POLICIES = {
+    "Toy Car": ReferencePolicy("toy", "inches", 3, ["car", "cell phone"]),
+    "Real Car": ReferencePolicy("real", "feet", 15, ["car", "cell phone"]),
+    "Dump Truck": ReferencePolicy("dump_truck", "meters", 8, ["car", "cell phone", "dump truck"]),
+}
+
+
+class Detections:
+    """Detected boxes for one frame as parallel arrays instead of per-box objects."""
+
+    def __init__(self, xyxy, conf, cls, names, raw=None, frame_xyxy=None):
+        self.xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        self.conf = np.asarray(conf, dtype=np.float32).reshape(-1)
+        self.cls = np.asarray(cls, dtype=np.int64).reshape(-1)
+        self.names = names
+        self.raw = raw  # Backend specific result, used for plotting
+        # Boxes where they are in the picture; only differs from xyxy once lens corrected
+        self.frame_xyxy = self.xyxy if frame_xyxy is None else np.asarray(frame_xyxy, dtype=np.float32).reshape(-1, 4)
+
+    def __len__(self):
+        return len(self.cls)
+
+    @property
+    def class_names(self):
+        return [self.names[class_id] for class_id in self.cls.tolist()]
+
+    # Plain lists so detections can be sent as JSON
+    def to_dict(self):
+        return {
+            "xyxy": self.xyxy.tolist(),
+            "conf": self.conf.tolist(),
+            "cls": self.cls.tolist(),
+            "names": {str(class_id): name for class_id, name in self.names.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        names = {int(class_id): name for class_id, name in data["names"].items()}
+        return cls(data["xyxy"], data["conf"], data["cls"], names)
+
+    # Width, height and diagonal of every box in one go
+    def box_differences(self):
+        dx = np.abs(self.xyxy[:, 2] - self.xyxy[:, 0])
+        dy = np.abs(self.xyxy[:, 3] - self.xyxy[:, 1])
+        return np.stack([dx, dy, np.hypot(dx, dy)], axis=1)
+
+
+class UltralyticsBackend:
+    """
+    Runs an Ultralytics YOLO model (PyTorch or exported ncnn) and converts its results.
+    `classes` (names or ids) keeps only those classes; names the model lacks are
+    ignored with a warning, and when none are known every class is kept.
+    """
+
+    def __init__(self, model, classes=None, **predict_kwargs):
+        self.model = model
+        self.predict_kwargs = predict_kwargs
+        if classes is not None:
+            ids = class_ids(model.names, classes, strict=False)
+            known = {name.lower() for name in model.names.values()}
+            missing = [value for value in classes if isinstance(value, str) and not value.isdigit() and value.lower() not in known]
+            if missing:
+                print(f"Warning: {', '.join(repr(name) for name in missing)} not among this model's classes, ignored")
+            if len(ids):
+                self.predict_kwargs["classes"] = ids.tolist()
+            else:
+                print("Warning: no class of the allow-list is known to this model, detecting every class")
+
+    @property
+    def names(self):
+        return self.model.names
+
+    # Identifies what this backend would output, for caching: the weights, the
+    # class list (YOLO-World's set_classes changes it) and the predict options
+    @property
+    def model_id(self):
+        weights = getattr(self.model, "ckpt_path", None) or getattr(self.model, "model_name", None) or repr(self.model)
+        return json.dumps([str(weights), self.names, self.predict_kwargs], sort_keys=True, default=str)
+
+    def detect(self, frame):
+        return self.detect_batch([frame])[0]
+
+    def detect_batch(self, frames):
+        results = self.model(frames, **self.predict_kwargs)
+        return [self._to_detections(result) for result in results]
+
+    def _to_detections(self, result):
+        boxes = result.boxes
+        return Detections(
+            boxes.xyxy.cpu().numpy(),
+            boxes.conf.cpu().numpy(),
+            boxes.cls.cpu().numpy(),
+            result.names,
+            raw=result,
+        )
+
+    def plot(self, detections, frame):
+        if detections.raw is not None:
+            return detections.raw.plot()
+        return draw_detections(frame.copy(), detections)
+
+
+class Measurement:
+    """Box sizes and the pixel-to-unit scale worked out for one set of detections."""
+
+    def __init__(self, detections, policy):
+        self.detections = detections
+        self.policy = policy
+        self.box_differences = detections.box_differences()
+        reference_diagonals = self.box_differences[policy.reference_mask(detections), 2]
+        self.reference_diagonal = float(reference_diagonals.mean()) if len(reference_diagonals) else 0.0
+
+    @property
+    def unit(self):
+        return self.policy.unit
+
+    @property
+    def pixels_per_unit(self):
+        if self.policy.pixels_per_unit is not None:
+            return self.policy.pixels_per_unit
+        if self.reference_diagonal == 0:
+            return 0.0
+        return self.reference_diagonal / self.policy.real_size
+
+    def real_boxes(self):
+        """Boxes in real units, or None when nothing set the scale. Ground policies map the corners onto the ground."""
+        xyxy = self.detections.xyxy
+        ground = self.policy.ground_points(xyxy[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 2)) if len(xyxy) else None
+        if ground is not None:
+            corners = ground.reshape(-1, 4, 2)
+            return np.concatenate([corners.min(axis=1), corners.max(axis=1)], axis=1)
+        if self.pixels_per_unit == 0:
+            return None
+        return xyxy / self.pixels_per_unit
+
+    def distance_matrix(self):
+        """
+        (center distances, edge gaps) between every pair of detections, in real
+        units, or in pixels when nothing set the scale.
+        """
+        boxes = self.real_boxes()
+        return pairwise_distances(self.detections.xyxy if boxes is None else boxes)
+
+    def nearest_neighbors(self):
+        """For every detection: index of the closest other one by edge gap, the gap and the center distance."""
+        if len(self.detections) < 2:
+            return np.full(len(self.detections), -1), np.full(len(self.detections), np.nan), np.full(len(self.detections), np.nan)
+        center_distance, gaps = self.distance_matrix()
+        np.fill_diagonal(gaps, np.inf)
+        nearest = np.argmin(gaps, axis=1)
+        rows = np.arange(len(gaps))
+        return nearest, gaps[rows, nearest], center_distance[rows, nearest]
+
+    def spacing_text(self, max_listed=7):
+        if len(self.detections) < 2:
+            return "Spacing: needs at least two objects."
+        nearest, gaps, centers = self.nearest_neighbors()
+        unit = self.unit if self.pixels_per_unit != 0 else "pixels"
+        names = self.detections.class_names
+        lines = [f"Spacing: closest gap {gaps.min():.2f} {unit}, median {np.median(gaps):.2f} {unit}"]
+        # Only the label is limited, the statistics cover every object
+        lines += [
+            f"{names[index]} #{index + 1} -> {names[other]} #{other + 1}: gap {gap:.2f}, centers {center:.2f} {unit}"
+            for index, (other, gap, center) in enumerate(zip(nearest[:max_listed].tolist(), gaps[:max_listed].tolist(), centers[:max_listed].tolist()))
+        ]
+        return "\n".join(lines)
+
+    # Convert a pixel length to real units, None when nothing set the scale
+    def scale_distance(self, pixel_distance):
+        if self.pixels_per_unit == 0:
+            return None
+        return pixel_distance / self.pixels_per_unit
+
+    def summary_text(self, max_listed=7):
+        if not len(self.detections):
+            return "No objects detected."
+        names = self.detections.class_names
+        lines = [f"Objects detected: {', '.join(names)}"]
+        # Only the label is limited, every box still counts towards the scale
+        lines += [
+            f"{name}: Δx={dx:.1f}, Δy={dy:.1f}, Δd={diagonal:.1f}"
+            for name, (dx, dy, diagonal) in zip(names[:max_listed], self.box_differences[:max_listed].tolist())
+        ]
+        if self.policy.pixels_per_unit is None:
+            reference_names = "All objects" if self.policy.reference_classes is None else "/".join(self.policy.reference_classes)
+            lines.append(f"Avg Δd ({reference_names}): {self.reference_diagonal:.1f} pixels")
+            lines.append(f"Normalized Diagonal: {self.pixels_per_unit:.1f} pixels per {self.unit}")
+            lines.append(f"Normalization Factor: {self.policy.real_size} {self.unit}")
+        else:
+            lines.append(f"Pixels per {self.unit}: {self.pixels_per_unit:.1f}")
+        return "\n".join(lines)
+
+    def distance_text(self, pixel_distance, prefix="Line length"):
+        scaled_distance = self.scale_distance(pixel_distance)
+        if scaled_distance is None:
+            return f"{prefix}: {pixel_distance:.2f} pixels (no reference object for scale)"
+        return f"{prefix}: {pixel_distance:.2f} pixels, {scaled_distance:.2f} {self.unit}"
+
+    # Like distance_text, for a line between two frame points
+    def line_text(self, point_a, point_b, prefix="Line length"):
+        pixel_distance = calculate_distance(*point_a, *point_b)
+        ground_distance = self.policy.ground_distance(point_a, point_b)
+        if ground_distance is None:
+            return self.distance_text(pixel_distance, prefix)
+        return f"{prefix}: {pixel_distance:.2f} pixels, {ground_distance:.2f} {self.unit}"
+
+
+class DetectionCore:
+    """
+    Detection and measurement shared by every GUI. The backend does inference,
+    the policy turns boxes into a scale, so changing units only re-runs `measure`.
+    With a `cache` (see result_cache.py) a picture that was seen before skips inference,
+    and a `correction` (see calibration.PointCorrection) fixes lens distortion in the boxes.
+    """
+
+    def __init__(self, backend, policy, cache=None, correction=None):
+        self.backend = backend
+        self.policy = policy
+        self.cache = cache
+        self.correction = correction
+
+    def detect(self, frame):
+        if self.cache is None:
+            detections = self.backend.detect(frame)
+        else:
+            key = self.cache.key(frame, self.backend.model_id)
+            detections = self.cache.get(key)
+            if detections is None:
+                detections = self.backend.detect(frame)
+                self.cache.put(key, detections)
+        if self.correction is not None:
+            detections = self.correction.correct_detections(detections, frame.shape)
+        return detections
+
+    def measure(self, detections, policy=None):
+        return Measurement(detections, policy or self.policy)
+
+    def process(self, frame):
+        detections = self.detect(frame)
+        return self.measure(detections), self.backend.plot(detections, frame)
+
+
+# Draw a measured line onto `frame` in place, at full resolution
+def draw_measurement_line(frame, point_a, point_b, color=(0, 255, 255), thickness=8):
+    point_a = (int(round(point_a[0])), int(round(point_a[1])))
+    point_b = (int(round(point_b[0])), int(round(point_b[1])))
+    cv2.line(frame, point_a, point_b, color, thickness)
+    return frame
+
+
+# Draw boxes and labels onto `frame` in place, for detections that did not come from Ultralytics
+def draw_detections(frame, detections, color=(0, 255, 0), thickness=2):
+    for (x1, y1, x2, y2), conf, name in zip(detections.frame_xyxy.astype(int).tolist(), detections.conf.tolist(), detections.class_names):
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, thickness)
+        cv2.putText(frame, f"{name} {conf:.2f}", (x1, max(y1 - 5, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2, cv2.LINE_AA)
+    return frame
+
+
+# Join every box to its nearest neighbour (see Measurement.nearest_neighbors) in place
+def draw_nearest_neighbors(frame, detections, nearest, color=(255, 0, 255), thickness=3):
+    # Line ends on the boxes as drawn, in picture pixels before lens correction
+    boxes = detections.frame_xyxy
+    centers = ((boxes[:, :2] + boxes[:, 2:]) / 2).round().astype(int).tolist()
+    for index, other in enumerate(nearest.tolist()):
+        if other >= 0:
+            cv2.line(frame, tuple(centers[index]), tuple(centers[other]), color, thickness, cv2.LINE_AA)
+    return frame
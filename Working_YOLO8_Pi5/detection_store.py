@@ -0,0 +1,253 @@
+"""
+Append-only columnar store for detections and measurements. Every column is its
+own fixed-width binary file, read back as a numpy memmap, so scans and
+aggregations over millions of rows only touch the columns they need and never
+build per-row Python objects. Class, site and unit names are kept in a small
+meta.json and stored in the columns as integer IDs.
+
+    python detection_store.py measurements --class "dump truck"    # lengths per site
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from result_cache import image_key
+
+DEFAULT_STORE_DIR = "measurements"
+DEFAULT_CHUNK_ROWS = 1 << 20
+
+# Row kinds: one row per detected box, and one per line measured by clicking
+KIND_BOX = 0
+KIND_LINE = 1
+
+# Column name -> (dtype, values per row)
+COLUMNS = {
+    "timestamp": ("<f8", 1),
+    "image": ("<u8", 1),
+    "site": ("<i4", 1),
+    "kind": ("u1", 1),
+    "cls": ("<i4", 1),  # Store-wide class ID, -1 for lines
+    "conf": ("<f4", 1),
+    "xyxy": ("<f4", 4),  # Box corners, or the two end points of a line
+    "diagonal": ("<f4", 1),  # Box diagonal or line length, in pixels
+    "scale": ("<f4", 1),  # Pixels per unit, 0 when nothing set the scale
+    "unit": ("u1", 1),
+}
+
+
+# 64-bit image ID from the frame contents, so the same picture always gets the same ID
+def frame_id(frame):
+    return int(image_key(frame)[:16], 16)
+
+
+class DetectionStore:
+    """
+    Columnar store in `directory`. Rows are appended a whole image at a time, and
+    a crash part way through an append only loses that image: the row count is
+    the shortest column. One process writes at a time; any number may read.
+    """
+
+    def __init__(self, directory=DEFAULT_STORE_DIR, site="default"):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._meta_path = os.path.join(directory, "meta.json")
+        self.site = site
+        self._views = {}
+        self.refresh()
+
+    def _path(self, column):
+        return os.path.join(self.directory, f"{column}.bin")
+
+    def _row_bytes(self, column):
+        dtype, width = COLUMNS[column]
+        return np.dtype(dtype).itemsize * width
+
+    def _count_rows(self):
+        rows = None
+        for column in COLUMNS:
+            path = self._path(column)
+            count = os.path.getsize(path) // self._row_bytes(column) if os.path.exists(path) else 0
+            rows = count if rows is None else min(rows, count)
+        return rows
+
+    def __len__(self):
+        return self._rows
+
+    # Integer ID for a class/site/unit name, adding it to meta.json the first time it is seen
+    def _name_id(self, table, name):
+        index = self._lookup[table].get(name)
+        if index is None:
+            index = len(self.meta[table])
+            self.meta[table].append(name)
+            self._lookup[table][name] = index
+            temporary_path = f"{self._meta_path}.tmp"
+            with open(temporary_path, "w") as f:
+                json.dump(self.meta, f)
+            os.replace(temporary_path, self._meta_path)
+        return index
+
+    def class_id(self, name):
+        return self._lookup["classes"].get(name, -2)  # -2 matches no row, lines are -1
+
+    def site_id(self, name):
+        return self._lookup["sites"].get(name, -1)
+
+    def _append(self, rows):
+        count = len(rows["timestamp"])
+        if not count:
+            return
+        # Bring a column cut short by a crash back to the common row count first
+        for column in COLUMNS:
+            path = self._path(column)
+            if os.path.exists(path) and os.path.getsize(path) != self._rows * self._row_bytes(column):
+                with open(path, "r+b") as f:
+                    f.truncate(self._rows * self._row_bytes(column))
+        for column, (dtype, width) in COLUMNS.items():
+            values = np.ascontiguousarray(rows[column], dtype=dtype).reshape((count, width) if width > 1 else (count,))
+            with open(self._path(column), "ab") as f:
+                f.write(values.tobytes())
+        self._rows += count
+        self._views.clear()
+
+    def append_measurement(self, measurement, image=None, timestamp=None, site=None):
+        """Store one row per detected box with its measurement scale. Returns the image ID."""
+        detections = measurement.detections
+        count = len(detections)
+        image = self._next_image() if image is None else image
+        timestamp = time.time() if timestamp is None else timestamp
+        class_ids = np.array([self._name_id("classes", name) for name in detections.class_names], dtype=np.int32)
+        self._append({
+            "timestamp": np.full(count, timestamp),
+            "image": np.full(count, image, dtype=np.uint64),
+            "site": np.full(count, self._name_id("sites", site or self.site)),
+            "kind": np.full(count, KIND_BOX),
+            "cls": class_ids,
+            "conf": detections.conf,
+            "xyxy": detections.xyxy,
+            "diagonal": measurement.box_differences[:, 2],
+            "scale": np.full(count, measurement.pixels_per_unit),
+            "unit": np.full(count, self._name_id("units", measurement.unit)),
+        })
+        return image
+
+    def append_line(self, measurement, point_a, point_b, image, timestamp=None, site=None):
+        """Store a line measured on an image, with the scale it was measured at."""
+        (x1, y1), (x2, y2) = point_a, point_b
+        self._append({
+            "timestamp": [time.time() if timestamp is None else timestamp],
+            "image": [image],
+            "site": [self._name_id("sites", site or self.site)],
+            "kind": [KIND_LINE],
+            "cls": [-1],
+            "conf": [1.0],
+            "xyxy": [x1, y1, x2, y2],
+            "diagonal": [np.hypot(x2 - x1, y2 - y1)],
+            "scale": [measurement.pixels_per_unit],
+            "unit": [self._name_id("units", measurement.unit)],
+        })
+
+    # Sequential image IDs for callers that do not hash the frame
+    def _next_image(self):
+        if not self._rows:
+            return 0
+        return int(self.column("image").max()) + 1
+
+    def column(self, name):
+        """Read-only memmap of one column over every stored row."""
+        if name not in self._views:
+            dtype, width = COLUMNS[name]
+            shape = (self._rows, width) if width > 1 else (self._rows,)
+            if self._rows == 0:
+                self._views[name] = np.empty(shape, dtype=dtype)
+            else:
+                self._views[name] = np.memmap(self._path(name), dtype=dtype, mode="r", shape=shape)
+        return self._views[name]
+
+    def refresh(self):
+        """Pick up rows and names appended by another process since this store was opened."""
+        self.meta = {"classes": [], "sites": [], "units": []}
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                self.meta = json.load(f)
+        self._lookup = {table: {name: index for index, name in enumerate(names)} for table, names in self.meta.items()}
+        self._rows = self._count_rows()
+        self._views.clear()
+
+    def scan(self, columns, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """Yield dicts of column slices `chunk_rows` rows at a time, so memory stays bounded."""
+        views = {name: self.column(name) for name in columns}
+        for start in range(0, self._rows, chunk_rows):
+            yield {name: view[start:start + chunk_rows] for name, view in views.items()}
+
+    def lengths(self, class_name, site=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """
+        Real-world diagonal of every `class_name` box with a scale, as
+        (lengths, site IDs, unit IDs) arrays. Only matching rows are copied out.
+        """
+        class_id = self.class_id(class_name)
+        site_id = None if site is None else self.site_id(site)
+        lengths, sites, units = [], [], []
+        for chunk in self.scan(["cls", "site", "scale", "diagonal", "unit"], chunk_rows):
+            mask = (chunk["cls"] == class_id) & (chunk["scale"] > 0)
+            if site_id is not None:
+                mask &= chunk["site"] == site_id
+            lengths.append(chunk["diagonal"][mask] / chunk["scale"][mask])
+            sites.append(chunk["site"][mask])
+            units.append(chunk["unit"][mask])
+        if not lengths:
+            return np.empty(0, np.float32), np.empty(0, np.int32), np.empty(0, np.uint8)
+        return np.concatenate(lengths), np.concatenate(sites), np.concatenate(units)
+
+    def length_distribution(self, class_name, percentiles=(10, 50, 90)):
+        """Per site and unit: count, mean and percentiles of the class's real-world length."""
+        lengths, sites, units = self.lengths(class_name)
+        groups = sites.astype(np.int64) * 256 + units
+        summary = {}
+        order = np.argsort(groups, kind="stable")
+        groups, lengths = groups[order], lengths[order]
+        boundaries = np.flatnonzero(np.diff(groups)) + 1
+        for group_lengths, group in zip(np.split(lengths, boundaries), groups[np.r_[0, boundaries]] if len(groups) else []):
+            site_name = self.meta["sites"][group // 256]
+            unit_name = self.meta["units"][group % 256]
+            summary[(site_name, unit_name)] = {
+                "count": len(group_lengths),
+                "mean": float(group_lengths.mean()),
+                "percentiles": dict(zip(percentiles, np.percentile(group_lengths, percentiles).tolist())),
+            }
+        return summary
+
+    def class_counts(self, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """Number of stored boxes per class name."""
+        counts = np.zeros(len(self.meta["classes"]), dtype=np.int64)
+        for chunk in self.scan(["cls", "kind"], chunk_rows):
+            boxes = chunk["cls"][chunk["kind"] == KIND_BOX]
+            counts += np.bincount(boxes, minlength=len(counts))[:len(counts)]
+        return dict(zip(self.meta["classes"], counts.tolist()))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Summarise a detection store")
+    parser.add_argument("directory", nargs="?", default=DEFAULT_STORE_DIR, help="Store directory")
+    parser.add_argument("--class", dest="class_name", default=None,
+                        help="Print the length distribution of this class per site")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    store = DetectionStore(args.directory)
+    start_time = time.perf_counter()
+    if args.class_name is None:
+        counts = store.class_counts()
+        print(f"{len(store)} rows in {args.directory} ({time.perf_counter() - start_time:.3f} s to scan)")
+        for name, count in sorted(counts.items(), key=lambda item: -item[1]):
+            print(f"  {name}: {count}")
+    else:
+        distribution = store.length_distribution(args.class_name)
+        print(f"{args.class_name} lengths over {len(store)} rows ({time.perf_counter() - start_time:.3f} s to scan)")
+        for (site, unit), entry in sorted(distribution.items()):
+            percentiles = ", ".join(f"p{p}={value:.2f}" for p, value in entry["percentiles"].items())
+            print(f"  {site}: {entry['count']} boxes, mean {entry['mean']:.2f} {unit}, {percentiles}")
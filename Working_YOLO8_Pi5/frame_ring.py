@@ -0,0 +1,249 @@
+"""
+Shared memory ring of fixed-size frame slots, so a capture process and an
+inference process can exchange 1280x1280 frames without pickling them.
+
+One writer fills slots in turn. A reader holds at most one slot at a time
+(`acquire_latest` / `release`); the writer never touches the held slot, so the
+reader can run the model straight on the returned NumPy view. Slots carry the
+sequence number and timestamp of the frame in them. Claiming, publishing and
+holding a slot happen under a multiprocessing.Lock shared by both sides (the
+header alone cannot order the two processes' reads and writes on ARM); frame
+copies are made outside it.
+
+Run this file to compare the per-frame transfer cost with a multiprocessing.Queue.
+"""
+import multiprocessing
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+# Header fields, stored as int64
+_WRITE_SEQ = 0  # Sequence number the next written frame gets
+_HELD_SEQ = 1  # Sequence number of the frame a reader is using, -1 when none
+_SLOTS = 2
+_HEIGHT = 3
+_WIDTH = 4
+_CHANNELS = 5
+_HEADER_FIELDS = 8
+_ALIGN = 64
+
+
+# Attach to a segment another process created without taking ownership of it,
+# otherwise the resource tracker unlinks it when this process exits
+def attach_shared_memory(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13 has no track argument
+        shm = shared_memory.SharedMemory(name=name)
+        # Children started by multiprocessing share their parent's tracker, where
+        # the creator's registration must stay so its unlink() can remove it
+        if multiprocessing.parent_process() is None:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def _aligned(size):
+    return (size + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+class FrameRing:
+    """
+    Use `FrameRing.create(...)` in the owning process and `FrameRing.attach(name, ring.lock)`
+    elsewhere. A ring attached without the lock can only use `slots` directly.
+    """
+
+    def __init__(self, shm, owner, lock=None):
+        self.shm = shm
+        self.owner = owner
+        self.lock = lock
+        header = np.ndarray((_HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        slots = int(header[_SLOTS])
+        self.frame_shape = (int(header[_HEIGHT]), int(header[_WIDTH]), int(header[_CHANNELS]))
+        offset = _aligned(header.nbytes)
+        self.slot_seq = np.ndarray((slots,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset = _aligned(offset + self.slot_seq.nbytes)
+        self.slot_time = np.ndarray((slots,), dtype=np.float64, buffer=shm.buf, offset=offset)
+        offset = _aligned(offset + self.slot_time.nbytes)
+        frame_bytes = _aligned(int(np.prod(self.frame_shape)))
+        self.slots = [
+            np.ndarray(self.frame_shape, dtype=np.uint8, buffer=shm.buf, offset=offset + index * frame_bytes)
+            for index in range(slots)
+        ]
+        self.header = header
+        self._write_index = 0
+        self._held_index = None
+
+    @classmethod
+    def create(cls, slots=3, frame_shape=(1280, 1280, 3), name=None):
+        if slots < 2:
+            raise ValueError("A frame ring needs at least two slots")
+        frame_bytes = _aligned(int(np.prod(frame_shape)))
+        size = _aligned(_HEADER_FIELDS * 8) + 2 * _aligned(slots * 8) + slots * frame_bytes
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((_HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[_HELD_SEQ] = -1
+        header[_SLOTS] = slots
+        header[_HEIGHT], header[_WIDTH], header[_CHANNELS] = frame_shape
+        ring = cls(shm, owner=True, lock=multiprocessing.Lock())
+        ring.slot_seq[:] = -1
+        return ring
+
+    @classmethod
+    def attach(cls, name, lock=None):
+        return cls(attach_shared_memory(name), owner=False, lock=lock)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def frames_written(self):
+        return int(self.header[_WRITE_SEQ])
+
+    # Writer side
+
+    # The next slot from the last one written that the reader is not holding;
+    # there is always one, a reader holds at most one slot of at least two
+    def _claim_slot(self):
+        slots = len(self.slots)
+        with self.lock:
+            held = int(self.header[_HELD_SEQ])
+            for step in range(slots):
+                index = (self._write_index + step) % slots
+                previous = int(self.slot_seq[index])
+                if previous < 0 or previous != held:
+                    self.slot_seq[index] = -1  # Readers skip a slot that is being written
+                    return index
+        raise RuntimeError("Every frame ring slot is held")
+
+    def write(self, frame, timestamp=None):
+        """Copy `frame` into the next free slot and publish it. Returns its sequence number."""
+        index = self._claim_slot()
+        np.copyto(self.slots[index], frame)
+        with self.lock:  # Publishes the copy: a reader that sees the sequence number sees the pixels
+            seq = int(self.header[_WRITE_SEQ])
+            self.slot_time[index] = time.time() if timestamp is None else timestamp
+            self.slot_seq[index] = seq
+            self.header[_WRITE_SEQ] = seq + 1
+        self._write_index = (index + 1) % len(self.slots)
+        return seq
+
+    # Reader side
+
+    def acquire_latest(self, newer_than=-1, timeout=None, poll_interval=0.0005):
+        """
+        Hold the newest frame with a sequence number above `newer_than` and return
+        (seq, timestamp, view), or None on timeout. The view stays valid until
+        `release()`; only one frame can be held at a time.
+        """
+        self.release()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                index = int(np.argmax(self.slot_seq))
+                seq = int(self.slot_seq[index])
+                if seq > newer_than:
+                    self.header[_HELD_SEQ] = seq
+                    self._held_index = index
+                    return seq, float(self.slot_time[index]), self.slots[index]
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(poll_interval)
+
+    def release(self):
+        if self._held_index is not None:
+            with self.lock:
+                self.header[_HELD_SEQ] = -1
+            self._held_index = None
+
+    def close(self):
+        self.release()
+        self.header = None
+        self.slot_seq = None
+        self.slot_time = None
+        self.slots = []
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# Capture loop for a child process: open the camera there and feed the ring
+def capture_loop(ring_name, lock, stop_event, source=None, cores=None):
+    from camera_source import open_camera
+    from runtime_config import pin
+
+    pin(cores)  # Keep capture off the inference cores
+    ring = FrameRing.attach(ring_name, lock)
+    camera = open_camera(source, size=(ring.frame_shape[1], ring.frame_shape[0]))
+    try:
+        while not stop_event.is_set():
+            ring.write(camera.capture_array())
+    finally:
+        camera.stop()
+        ring.close()
+
+
+# Fork rather than spawn so scripts without a __main__ guard are not re-run in the child;
+# start it before loading the model so the child does not inherit the weights.
+# `cores` restricts the child to those CPUs
+def start_capture_process(ring, source=None, cores=None):
+    context = multiprocessing.get_context("fork")
+    stop_event = context.Event()
+    process = context.Process(target=capture_loop, args=(ring.name, ring.lock, stop_event, source, cores),
+                              name="frame-capture", daemon=True)
+    process.start()
+    return process, stop_event
+
+
+def _ring_writer(ring_name, lock, frames):
+    ring = FrameRing.attach(ring_name, lock)
+    frame = np.full(ring.frame_shape, 128, dtype=np.uint8)
+    for _ in range(frames):
+        ring.write(frame)
+    ring.close()
+
+
+def _queue_writer(frame_queue, frame_shape, frames):
+    frame = np.full(frame_shape, 128, dtype=np.uint8)
+    for _ in range(frames):
+        frame_queue.put(frame)
+
+
+# Compare moving frames through the ring with pickling them through a Queue
+def benchmark(frames=200, frame_shape=(1280, 1280, 3)):
+    ring = FrameRing.create(slots=3, frame_shape=frame_shape)
+    writer = multiprocessing.Process(target=_ring_writer, args=(ring.name, ring.lock, frames))
+    seq, received = -1, 0
+    start_time = time.perf_counter()
+    writer.start()
+    while True:
+        acquired = ring.acquire_latest(newer_than=seq, timeout=0.5)
+        if acquired is None:
+            break
+        seq = acquired[0]
+        received += 1
+        if seq == frames - 1:
+            break
+    ring_time = time.perf_counter() - start_time
+    writer.join()
+    ring.close()
+
+    frame_queue = multiprocessing.Queue(maxsize=3)
+    writer = multiprocessing.Process(target=_queue_writer, args=(frame_queue, frame_shape, frames))
+    start_time = time.perf_counter()
+    writer.start()
+    for _ in range(frames):
+        frame_queue.get()
+    queue_time = time.perf_counter() - start_time
+    writer.join()
+
+    print(f"Frame {frame_shape}, {frames} frames written")
+    print(f"Shared memory ring: {ring_time / frames * 1000:.2f} ms per frame written "
+          f"({received} frames read as latest)")
+    print(f"multiprocessing.Queue: {queue_time / frames * 1000:.2f} ms per frame")
+
+
+if __name__ == "__main__":
+    benchmark()
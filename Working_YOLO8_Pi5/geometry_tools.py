@@ -0,0 +1,162 @@
+import cv2
+import numpy as np
+
+TOOLS = ("Line", "Polyline", "Polygon", "Rectangle")
+
+
+class Geometry:
+    """
+    A shape drawn by clicking: "polyline", "polygon" or "rectangle" (two clicks
+    at opposite corners). Vertices live in one growable (N, 2) array next to
+    running sums of the segment lengths and of the shoelace terms, so adding or
+    undoing a vertex and reading the length or area are all O(1).
+    """
+
+    def __init__(self, kind="polyline", capacity=64):
+        if kind not in ("polyline", "polygon", "rectangle"):
+            raise ValueError(f"Unknown shape {kind!r}")
+        self.kind = kind
+        self._vertices = np.empty((capacity, 2), dtype=np.float64)
+        self._lengths = np.zeros(capacity)  # Length of the path up to each vertex
+        self._shoelace = np.zeros(capacity)  # Twice the signed area swept up to each vertex
+        self._count = 0
+        self._redo = []
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def vertices(self):
+        if self.kind == "rectangle" and self._count == 2:
+            (x1, y1), (x2, y2) = self._vertices[:2]
+            return np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]])
+        return self._vertices[:self._count]
+
+    @property
+    def closed(self):
+        return self.kind != "polyline"
+
+    @property
+    def complete(self):
+        """A rectangle is done after two clicks, the other shapes take vertices until finished."""
+        return self.kind == "rectangle" and self._count == 2
+
+    def _push(self, point):
+        if self._count == len(self._vertices):
+            capacity = 2 * len(self._vertices)
+            self._vertices = np.resize(self._vertices, (capacity, 2))
+            self._lengths = np.resize(self._lengths, capacity)
+            self._shoelace = np.resize(self._shoelace, capacity)
+        index = self._count
+        self._vertices[index] = point
+        if index:
+            (x0, y0), (x1, y1) = self._vertices[index - 1], self._vertices[index]
+            self._lengths[index] = self._lengths[index - 1] + np.hypot(x1 - x0, y1 - y0)
+            self._shoelace[index] = self._shoelace[index - 1] + x0 * y1 - x1 * y0
+        else:
+            self._lengths[index] = self._shoelace[index] = 0.0
+        self._count += 1
+
+    def add(self, point):
+        """Add a vertex; returns False when the shape is already complete."""
+        if self.complete:
+            return False
+        self._push(point)
+        self._redo.clear()
+        return True
+
+    def undo(self):
+        if not self._count:
+            return False
+        self._count -= 1
+        self._redo.append(self._vertices[self._count].copy())
+        return True
+
+    def redo(self):
+        if not self._redo:
+            return False
+        self._push(self._redo.pop())
+        return True
+
+    def _closing(self):
+        # Segment and shoelace term from the last vertex back to the first
+        (x0, y0), (x1, y1) = self._vertices[self._count - 1], self._vertices[0]
+        return np.hypot(x1 - x0, y1 - y0), x0 * y1 - x1 * y0
+
+    @property
+    def length(self):
+        """Path length in pixels, around the whole outline for closed shapes."""
+        if self._count < 2:
+            return 0.0
+        if self.kind == "rectangle":
+            (x1, y1), (x2, y2) = self._vertices[:2]
+            return 2 * (abs(x2 - x1) + abs(y2 - y1))
+        length = self._lengths[self._count - 1]
+        if self.closed:
+            length += self._closing()[0]
+        return float(length)
+
+    @property
+    def area(self):
+        """Enclosed area in square pixels, 0 for polylines."""
+        if not self.closed or self._count < 2:
+            return 0.0
+        if self.kind == "rectangle":
+            (x1, y1), (x2, y2) = self._vertices[:2]
+            return float(abs(x2 - x1) * abs(y2 - y1))
+        return float(abs(self._shoelace[self._count - 1] + self._closing()[1]) / 2)
+
+    @property
+    def last_segment(self):
+        if self._count < 2:
+            return 0.0
+        return float(self._lengths[self._count - 1] - self._lengths[self._count - 2])
+
+    def mapped(self, transform):
+        """Copy with the vertices passed through `transform` ((N, 2) -> (N, 2)); rectangles become polygons."""
+        shape = Geometry("polygon" if self.kind == "rectangle" else self.kind, capacity=max(len(self.vertices), 1))
+        for point in transform(self.vertices):
+            shape._push(point)
+        return shape
+
+    def real_size(self, measurement):
+        """
+        (length, area) in the measurement's units, or None when nothing set the
+        scale. Policies that map pixels to the ground themselves (a tilted camera)
+        measure the outline on the ground instead of with one scale.
+        """
+        ground = measurement.policy.ground_points(self.vertices) if len(self) else None
+        if ground is not None:
+            shape = self.mapped(lambda vertices: ground)
+            return shape.length, shape.area
+        if measurement.pixels_per_unit == 0:
+            return None
+        return self.length / measurement.pixels_per_unit, self.area / measurement.pixels_per_unit ** 2
+
+    def summary_text(self, measurement, name=None):
+        name = name or self.kind.capitalize()
+        if len(self) < 2:
+            return f"{name}: click to add points"
+        lines = [f"{name}: {len(self.vertices)} points, length {self.length:.1f} pixels"]
+        if self.closed:
+            lines[0] += f", area {self.area:.0f} square pixels"
+        real_size = self.real_size(measurement)
+        if real_size is None:
+            lines.append("(no reference object for scale)")
+        else:
+            length, area = real_size
+            lines.append(f"{name} length: {length:.2f} {measurement.unit}")
+            if self.closed:
+                lines.append(f"{name} area: {area:.2f} square {measurement.unit}")
+        return "\n".join(lines)
+
+    def draw(self, frame, color=(0, 255, 255), thickness=4):
+        """Draw the shape onto `frame` in place, at full resolution."""
+        if not len(self):
+            return frame
+        points = np.round(self.vertices).astype(np.int32).reshape(-1, 1, 2)
+        if len(points) > 1:
+            cv2.polylines(frame, [points], self.closed and len(points) > 2, color, thickness, cv2.LINE_AA)
+        for x, y in points.reshape(-1, 2).tolist():
+            cv2.circle(frame, (x, y), thickness + 2, color, -1)
+        return frame
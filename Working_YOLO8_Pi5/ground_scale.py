@@ -0,0 +1,264 @@
+"""
+Scale from the camera instead of from a reference object. The ground sample
+distance (size of a pixel on the ground) follows from the altitude, the lens
+focal length, the sensor size and how far the camera is tilted from straight
+down, so nothing of known size needs to be in the picture.
+
+Altitude and tilt come from a JSON sidecar next to the image (photo.jpg.json or
+photo.json), from DJI-style XMP (RelativeAltitude, GimbalPitchDegree), or from
+EXIF GPS altitude minus the ground elevation; for live camera pictures from
+$CAMERA_ALTITUDE and $CAMERA_TILT.
+
+    python ground_scale.py photo.jpg --camera "Camera Module 3"
+"""
+import argparse
+import json
+import os
+import re
+
+import cv2
+import numpy as np
+
+from detection_core import ReferencePolicy
+
+# Meters per unit for the units the GUIs show
+UNIT_METERS = {"meters": 1.0, "feet": 0.3048, "inches": 0.0254}
+
+
+class CameraModel:
+    """
+    Lens and sensor of one camera. `image_size` is the full sensor resolution;
+    smaller output sizes are handled like libcamera does, by cropping the sensor
+    to the output aspect ratio and scaling. `camera_matrix` and `dist_coeffs`
+    (for `image_size`) come from a calibration, otherwise the lens is taken as ideal.
+    """
+
+    def __init__(self, focal_length_mm, sensor_width_mm, sensor_height_mm, image_size,
+                 camera_matrix=None, dist_coeffs=None):
+        self.focal_length_mm = focal_length_mm
+        self.sensor_width_mm = sensor_width_mm
+        self.sensor_height_mm = sensor_height_mm
+        self.image_size = tuple(image_size)
+        self.camera_matrix = None if camera_matrix is None else np.asarray(camera_matrix, dtype=np.float64)
+        self.dist_coeffs = np.zeros(5) if dist_coeffs is None else np.asarray(dist_coeffs, dtype=np.float64).reshape(-1)
+
+    def _crop_and_scale(self, size):
+        # Part of the sensor an output of `size` sees, and its pixels per sensor pixel
+        sensor_width, sensor_height = self.image_size
+        width, height = size
+        if width / height > sensor_width / sensor_height:
+            crop = (sensor_width, sensor_width * height / width)
+        else:
+            crop = (sensor_height * width / height, sensor_height)
+        return crop, width / crop[0]
+
+    def intrinsics(self, size):
+        """Camera matrix for frames of `size` (width, height)."""
+        (crop_width, crop_height), scale = self._crop_and_scale(size)
+        if self.camera_matrix is not None:
+            matrix = self.camera_matrix.copy()
+            matrix[0, 2] -= (self.image_size[0] - crop_width) / 2
+            matrix[1, 2] -= (self.image_size[1] - crop_height) / 2
+            matrix[:2] *= scale
+            return matrix
+        focal_pixels = self.focal_length_mm * self.image_size[0] / self.sensor_width_mm * scale
+        return np.array([[focal_pixels, 0, size[0] / 2], [0, focal_pixels, size[1] / 2], [0, 0, 1]])
+
+    @property
+    def has_distortion(self):
+        return bool(np.any(self.dist_coeffs))
+
+    def normalized_points(self, points, size):
+        """Undistorted normalized image coordinates (x/z, y/z) of pixel points."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+        return cv2.undistortPoints(points, self.intrinsics(size), self.dist_coeffs).reshape(-1, 2)
+
+    def undistort(self, frame):
+        """Lens-corrected copy of a whole frame, through remap tables cached per frame size."""
+        if not self.has_distortion:
+            return frame
+        from calibration import remap_tables
+
+        return remap_tables(self, (frame.shape[1], frame.shape[0])).remap(frame)
+
+
+# Nominal lenses of the Raspberry Pi cameras, before any calibration
+CAMERAS = {
+    "Camera Module 3": CameraModel(4.74, 6.45, 3.63, (4608, 2592)),
+    "Camera Module 3 Wide": CameraModel(2.75, 6.45, 3.63, (4608, 2592)),
+    "Camera Module 2": CameraModel(3.04, 3.68, 2.76, (3280, 2464)),
+    "HQ Camera 6mm": CameraModel(6.0, 6.287, 4.712, (4056, 3040)),
+}
+
+
+class GroundScale:
+    """
+    Maps pixels of a frame of `size` to meters on flat ground, for a camera
+    `altitude` meters up and tilted `tilt` degrees forward from straight down
+    (0 is nadir; the top of the picture is then further away than the bottom).
+    """
+
+    def __init__(self, camera, altitude, size, tilt=0.0):
+        self.camera = camera
+        self.altitude = float(altitude)
+        self.size = tuple(size)
+        self.tilt = float(tilt)
+        theta = np.radians(self.tilt)
+        # Camera x right, y down, z forward into world X right, Y ahead, Z up
+        self._rotation = np.array([
+            [1, 0, 0],
+            [0, -np.cos(theta), np.sin(theta)],
+            [0, -np.sin(theta), -np.cos(theta)],
+        ])
+
+    def ground_points(self, points):
+        """(N, 2) ground positions in meters below the camera; NaN above the horizon."""
+        normalized = self.camera.normalized_points(points, self.size)
+        rays = np.column_stack([normalized, np.ones(len(normalized))]) @ self._rotation.T
+        with np.errstate(divide="ignore", invalid="ignore"):
+            distance = np.where(rays[:, 2] < 0, self.altitude / -rays[:, 2], np.nan)
+        return rays[:, :2] * distance[:, None]
+
+    def distance(self, point_a, point_b):
+        """Ground distance in meters between two pixels."""
+        a, b = self.ground_points([point_a, point_b])
+        return float(np.hypot(*(b - a)))
+
+    def gsd(self, point=None):
+        """Meters per pixel around `point`, the image center by default."""
+        x, y = (self.size[0] / 2, self.size[1] / 2) if point is None else point
+        center, right, down = self.ground_points([(x, y), (x + 1, y), (x, y + 1)])
+        return float(np.sqrt(np.hypot(*(right - center)) * np.hypot(*(down - center))))
+
+    def pixels_per_unit(self, unit="meters", point=None):
+        return UNIT_METERS[unit] / self.gsd(point)
+
+
+class GroundPolicy(ReferencePolicy):
+    """Reference policy whose scale comes from a GroundScale instead of detected objects."""
+
+    def __init__(self, ground_scale, unit="meters"):
+        super().__init__("ground", unit, pixels_per_unit=ground_scale.pixels_per_unit(unit))
+        self.ground_scale = ground_scale
+
+    # Tilted pictures do not have one scale, so lines are measured on the ground itself
+    def ground_distance(self, point_a, point_b):
+        return self.ground_scale.distance(point_a, point_b) / UNIT_METERS[self.unit]
+
+    def ground_points(self, points):
+        return self.ground_scale.ground_points(points) / UNIT_METERS[self.unit]
+
+
+def _rational(value):
+    if isinstance(value, tuple):
+        return value[0] / value[1] if value[1] else 0.0
+    return float(value)
+
+
+# Focal length (mm) and GPS altitude (m above sea level) from EXIF
+def read_exif(path):
+    from PIL import Image
+
+    metadata = {}
+    try:
+        with Image.open(path) as image:
+            exif = image.getexif()
+            gps = exif.get_ifd(0x8825)
+            details = exif.get_ifd(0x8769)
+    except OSError:
+        return metadata
+    if 6 in gps:
+        altitude = _rational(gps[6])
+        metadata["gps_altitude"] = -altitude if gps.get(5) in (1, b"\x01") else altitude
+    if 37386 in details:
+        metadata["focal_length_mm"] = _rational(details[37386])
+    return metadata
+
+
+# Height above take-off and gimbal pitch from DJI-style XMP
+def read_xmp(path, max_bytes=1 << 18):
+    with open(path, "rb") as f:
+        head = f.read(max_bytes)
+    metadata = {}
+    for key, field in (("altitude", b"RelativeAltitude"), ("gimbal_pitch", b"GimbalPitchDegree")):
+        match = re.search(field + rb'\s*=\s*"([-+]?[0-9.]+)"', head) or re.search(field + rb">([-+]?[0-9.]+)<", head)
+        if match:
+            metadata[key] = float(match.group(1))
+    if "gimbal_pitch" in metadata:
+        metadata["tilt"] = 90 + metadata.pop("gimbal_pitch")  # -90 is straight down
+    return metadata
+
+
+def read_sidecar(path):
+    for sidecar in (f"{path}.json", f"{os.path.splitext(path)[0]}.json"):
+        if os.path.exists(sidecar):
+            with open(sidecar) as f:
+                return json.load(f)
+    return {}
+
+
+def flight_metadata(path=None):
+    """
+    Altitude (m above the ground), tilt (degrees from nadir) and anything else
+    known about the picture at `path`, or about the live camera when `path` is
+    None. A sidecar wins over XMP, which wins over EXIF.
+    """
+    if path is None:
+        metadata = {}
+        if os.environ.get("CAMERA_ALTITUDE"):
+            metadata["altitude"] = float(os.environ["CAMERA_ALTITUDE"])
+        if os.environ.get("CAMERA_TILT"):
+            metadata["tilt"] = float(os.environ["CAMERA_TILT"])
+        return metadata
+    metadata = read_exif(path)
+    metadata.update(read_xmp(path))
+    metadata.update(read_sidecar(path))
+    if "altitude" not in metadata and "gps_altitude" in metadata and "ground_elevation" in metadata:
+        metadata["altitude"] = metadata["gps_altitude"] - metadata["ground_elevation"]
+    return metadata
+
+
+def ground_policy(metadata, size, unit="meters", camera=None):
+    """
+    GroundPolicy for a picture of `size`, or None when its altitude is unknown.
+    Raises ValueError for a camera name that is not in CAMERAS.
+    """
+    if metadata.get("altitude") is None:
+        return None
+    if camera is None:
+        name = metadata.get("camera", os.environ.get("CAMERA_MODEL", "Camera Module 3"))
+        if name not in CAMERAS:
+            raise ValueError(f"Unknown camera {name!r}, expected one of {', '.join(CAMERAS)}")
+        camera = CAMERAS[name]
+    return GroundPolicy(GroundScale(camera, metadata["altitude"], size, metadata.get("tilt", 0.0)), unit)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ground sample distance of a picture from its flight metadata")
+    parser.add_argument("image", help="Picture with EXIF/XMP altitude or a JSON sidecar")
+    parser.add_argument("--camera", default=None, choices=list(CAMERAS), help="Camera the picture was taken with")
+    parser.add_argument("--altitude", type=float, default=None, help="Override the altitude in meters")
+    parser.add_argument("--tilt", type=float, default=None, help="Override the tilt from straight down in degrees")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    metadata = flight_metadata(args.image)
+    if args.altitude is not None:
+        metadata["altitude"] = args.altitude
+    if args.tilt is not None:
+        metadata["tilt"] = args.tilt
+    if args.camera is not None:
+        metadata["camera"] = args.camera
+    frame = cv2.imread(args.image)
+    if frame is None:
+        raise SystemExit(f"Could not read {args.image}")
+    size = (frame.shape[1], frame.shape[0])
+    policy = ground_policy(metadata, size)
+    if policy is None:
+        raise SystemExit(f"No altitude for {args.image}: add a sidecar, or pass --altitude")
+    scale = policy.ground_scale
+    print(f"{args.image}: {size[0]}x{size[1]}, {scale.altitude:.1f} m up, tilted {scale.tilt:.1f} degrees")
+    for name, point in (("center", None), ("top", (size[0] / 2, size[1] * 0.1)), ("bottom", (size[0] / 2, size[1] * 0.9))):
+        print(f"  GSD at {name}: {scale.gsd(point) * 100:.2f} cm/pixel")
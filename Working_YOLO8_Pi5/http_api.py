@@ -0,0 +1,390 @@
+"""
+Local HTTP API over the same detection and measurement code as the GUIs, for
+scripting from a ground station. Concurrent requests for the same model are
+batched (see batching.py), and every reply says how long it queued and how
+long the model took, so deployments can be sized from real traffic.
+
+    python http_api.py --model yolov8n.pt --port 8080
+    python http_api.py --model yolov8n.pt --models yolov8s.pt yolov8x.pt    # ?model= may pick these too
+
+    curl --data-binary @c1.jpg "localhost:8080/detect?mode=Real%20Car"
+    curl --data-binary @c1.jpg "localhost:8080/measure?points=100,200;400,260"
+    curl "localhost:8080/calibration?size=1280x1280&altitude=40"
+    curl localhost:8080/stats
+
+POST /detect?stream=1 takes several JPEGs in one body, each prefixed with its
+length as a 4-byte big-endian integer, and streams one JSON line back per picture
+as soon as it is done. Modes are the GUI dropdown names; `altitude` (and `tilt`,
+`camera`) scale from the flight altitude instead of a reference object.
+"""
+import argparse
+import json
+import queue
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import cv2
+import numpy as np
+
+from batching import RequestBatcher
+from calibration import PointCorrection, correction_mode, load_env_calibration
+from detection_core import Detections, Measurement, REFERENCE_POLICIES
+from ground_scale import CAMERAS, ground_policy
+from inference_server import ModelRegistry
+
+
+class ModelLoadError(RuntimeError):
+    """A model named in a request could not be loaded; `status` is the HTTP status to reply with."""
+
+    def __init__(self, model_name, error):
+        super().__init__(f"Could not load model {model_name!r}: {type(error).__name__}: {error}")
+        self.status = 404 if isinstance(error, (FileNotFoundError, LookupError)) else 500
+
+
+def measurement_dict(measurement):
+    """Boxes with their pixel and real sizes, and the scale they were measured with."""
+    differences = measurement.box_differences
+    real_boxes = measurement.real_boxes()
+    real = None
+    if real_boxes is not None:
+        width, height = real_boxes[:, 2] - real_boxes[:, 0], real_boxes[:, 3] - real_boxes[:, 1]
+        real = np.stack([width, height, np.hypot(width, height)], axis=1).tolist()
+    boxes = []
+    for index, name in enumerate(measurement.detections.class_names):
+        boxes.append({
+            "class": name,
+            "conf": float(measurement.detections.conf[index]),
+            "xyxy": measurement.detections.xyxy[index].tolist(),
+            "pixels": differences[index].tolist(),  # Width, height and diagonal
+            "real": None if real is None else real[index],
+        })
+    return {
+        "mode": measurement.policy.mode,
+        "unit": measurement.unit,
+        "pixels_per_unit": measurement.pixels_per_unit,
+        "boxes": boxes,
+    }
+
+
+# "x,y;x,y;..." -> [(x, y), ...]
+def parse_points(text):
+    return [tuple(float(value) for value in point.split(",")) for point in text.split(";") if point]
+
+
+class HTTPDetectionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, registry, default_model, max_batch=4, max_wait=0.01, calibration=None):
+        super().__init__(address, _Handler)
+        self.registry = registry
+        self.default_model = default_model
+        self.calibration = calibration
+        self.correction = PointCorrection(calibration) if calibration is not None and correction_mode() == "points" else None
+        self.batcher = RequestBatcher(self._run_batch, max_batch, max_wait)
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def _run_batch(self, model_name, frames):
+        return self.registry.get(model_name).detect_batch(frames)
+
+    def _record(self, model_name, request):
+        with self._stats_lock:
+            stats = self._stats.setdefault(model_name, {"requests": 0, "queue_time": 0.0, "compute_time": 0.0, "batch_size": 0})
+            stats["requests"] += 1
+            stats["queue_time"] += request.queue_time
+            stats["compute_time"] += request.compute_time
+            stats["batch_size"] += request.batch_size
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                model_name: {
+                    "requests": stats["requests"],
+                    "mean_queue_time": stats["queue_time"] / stats["requests"],
+                    "mean_compute_time": stats["compute_time"] / stats["requests"],
+                    "mean_batch_size": stats["batch_size"] / stats["requests"],
+                }
+                for model_name, stats in self._stats.items()
+            }
+
+    def policy(self, query, size):
+        if "altitude" in query:
+            metadata = {"altitude": float(query["altitude"]), "tilt": float(query.get("tilt", 0.0))}
+            if "camera" in query:
+                metadata["camera"] = query["camera"]
+            camera = None if self.calibration is None or "camera" in query else \
+                self.calibration.camera_model(corrected=correction_mode() == "frames")
+            policy = ground_policy(metadata, size, query.get("unit", "meters"), camera)
+            if policy is None:
+                raise ValueError("Could not make a ground scale from the altitude")
+            return policy
+        mode = query.get("mode", "Real Car")
+        if mode not in REFERENCE_POLICIES:
+            raise ValueError(f"Unknown mode {mode!r}, expected one of {', '.join(REFERENCE_POLICIES)}")
+        return REFERENCE_POLICIES[mode]
+
+    def load(self, model_name):
+        """Load `model_name` if it is not yet; raises ModelLoadError when it cannot be."""
+        try:
+            return self.registry.get(model_name)
+        except Exception as exc:  # Whatever the loader throws for a missing or broken model
+            raise ModelLoadError(model_name, exc) from exc
+
+    def submit(self, model_name, frame):
+        # Load outside the batcher thread so a first request does not hold up other models' batches
+        self.load(model_name)
+        return self.batcher.submit(model_name, frame)
+
+    def finish(self, model_name, request, frame, query, decode_time, start_time):
+        """Wait for a submitted frame and turn its detections into the JSON reply."""
+        detections = request.wait()
+        self._record(model_name, request)
+        measure_start = time.perf_counter()
+        if self.correction is not None:
+            detections = self.correction.correct_detections(detections, frame.shape)
+        measurement = Measurement(detections, self.policy(query, (frame.shape[1], frame.shape[0])))
+        reply = {
+            "model": model_name,
+            "detections": detections.to_dict(),
+            "measurement": measurement_dict(measurement),
+            "batch_size": request.batch_size,
+            "decode_time": decode_time,
+            "queue_time": request.queue_time,
+            "compute_time": request.compute_time,
+            "measure_time": time.perf_counter() - measure_start,
+            "total_time": time.perf_counter() - start_time,
+        }
+        return reply, measurement
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.close()
+
+
+def decode_jpeg(data):
+    frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError("Request body is not a JPEG (or other image cv2 can decode)")
+    return frame
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # Timings go in the replies and /stats instead
+
+    _streaming = False  # Set once a streamed reply's headers are sent
+
+    def _query(self):
+        return {name: values[-1] for name, values in parse_qs(urlsplit(self.path).query).items()}
+
+    def _send_json(self, reply, status=200, timings=None):
+        body = json.dumps(reply).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if timings:
+            # Shows up in browser dev tools and curl -v next to the JSON fields
+            self.send_header("Server-Timing", ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items()))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_GET(self):
+        route = urlsplit(self.path).path
+        try:
+            if route == "/stats":
+                self._send_json({"models": self.server.stats(), "loaded": self.server.registry.loaded()})
+            elif route == "/calibration":
+                self._send_json(self._calibration(self._query()))
+            else:
+                self._send_json({"error": f"No such endpoint {route}"}, 404)
+        except (ValueError, KeyError) as exc:
+            self._send_json({"error": f"{type(exc).__name__}: {exc}"}, 400)
+
+    def do_POST(self):
+        self._streaming = False  # The handler outlives a streamed request on a keep-alive connection
+        route = urlsplit(self.path).path
+        query = self._query()
+        try:
+            if route == "/detect" and query.get("stream"):
+                self._detect_stream(query)
+            elif route == "/detect":
+                self._detect(query)
+            elif route == "/measure":
+                self._measure(query)
+            else:
+                self._body()
+                self._send_json({"error": f"No such endpoint {route}"}, 404)
+        except ModelLoadError as exc:
+            self._send_error(str(exc), exc.status)
+        except (ValueError, KeyError) as exc:
+            self._send_error(f"{type(exc).__name__}: {exc}", 400)
+        except Exception as exc:
+            self._send_error(f"{type(exc).__name__}: {exc}", 500)
+
+    def _send_error(self, message, status):
+        if self._streaming:
+            self.close_connection = True  # Mid-stream: a second response would corrupt the chunked body
+            return
+        self._send_json({"error": message}, status)
+
+    def _detect_frame(self, query, data):
+        start_time = time.perf_counter()
+        frame = decode_jpeg(data)
+        decode_time = time.perf_counter() - start_time
+        model_name = query.get("model", self.server.default_model)
+        request = self.server.submit(model_name, frame)
+        return self.server.finish(model_name, request, frame, query, decode_time, start_time)
+
+    def _detect(self, query):
+        reply, _ = self._detect_frame(query, self._body())
+        timings = {name[:-5]: reply[name] for name in ("decode_time", "queue_time", "compute_time", "measure_time")}
+        self._send_json(reply, timings=timings)
+
+    def _detect_stream(self, query):
+        # Pictures are submitted while the body is still being read and answered in order as they finish.
+        # Errors before the 200 is sent get a status of their own; after it, they are error lines in the stream
+        model_name = query.get("model", self.server.default_model)
+        self.server.load(model_name)
+        self.server.policy(query, (1, 1))  # An unknown mode or camera is the same for every picture
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._streaming = True
+        submitted = queue.Queue()
+
+        def write_replies():
+            while True:
+                item = submitted.get()
+                if item is None:
+                    return
+                request, frame, decode_time, start_time = item
+                try:
+                    reply, _ = self.server.finish(model_name, request, frame, query, decode_time, start_time)
+                except Exception as exc:  # One bad picture should not end the stream
+                    reply = {"error": f"{type(exc).__name__}: {exc}"}
+                self._send_chunk(json.dumps(reply).encode() + b"\n")
+
+        writer = threading.Thread(target=write_replies, daemon=True)
+        writer.start()
+        remaining = int(self.headers.get("Content-Length", 0))
+        try:
+            while remaining >= 4:
+                (length,) = struct.unpack(">I", self.rfile.read(4))
+                data = self.rfile.read(length)
+                remaining -= 4 + length
+                start_time = time.perf_counter()
+                try:
+                    frame = decode_jpeg(data)
+                except ValueError as exc:
+                    submitted.put((_Failed(exc), None, 0.0, start_time))
+                    continue
+                decode_time = time.perf_counter() - start_time
+                try:
+                    request = self.server.submit(model_name, frame)
+                except Exception as exc:
+                    request = _Failed(exc)
+                submitted.put((request, frame, decode_time, start_time))
+        except Exception as exc:  # A broken body; the status is already sent, so report it in the stream
+            submitted.put((_Failed(exc), None, 0.0, time.perf_counter()))
+        finally:
+            submitted.put(None)
+            writer.join()
+            self._send_chunk(b"")
+
+    def _measure(self, query):
+        """
+        Distances along `points` (two for a line, more for a path). The scale comes
+        from a JPEG body, detected here, or a JSON body {"detections": ..., "points": ...,
+        "size": [w, h]} reusing the detections of an earlier /detect.
+        """
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            data = json.loads(self._body())
+            points = [tuple(point) for point in data["points"]]
+            query.update({name: value for name, value in data.items() if name not in ("points", "detections")})
+            measurement = Measurement(Detections.from_dict(data["detections"]), self.server.policy(query, tuple(data["size"])))
+            reply = {"measurement": measurement_dict(measurement)}
+        else:
+            points = parse_points(query["points"])
+            reply, measurement = self._detect_frame(query, self._body())
+        if len(points) < 2:
+            raise ValueError("Need at least two points to measure between")
+        segments = []
+        for point_a, point_b in zip(points[:-1], points[1:]):
+            pixels = float(np.hypot(point_b[0] - point_a[0], point_b[1] - point_a[1]))
+            real = measurement.policy.ground_distance(point_a, point_b)
+            segments.append({"pixels": pixels, "real": measurement.scale_distance(pixels) if real is None else float(real)})
+        reply["segments"] = segments
+        reply["length"] = {
+            "pixels": sum(segment["pixels"] for segment in segments),
+            "real": None if any(segment["real"] is None for segment in segments) else sum(segment["real"] for segment in segments),
+            "unit": measurement.unit,
+        }
+        self._send_json(reply)
+
+    def _calibration(self, query):
+        calibration = self.server.calibration
+        reply = {
+            "correction": correction_mode(),
+            "calibration": None if calibration is None else {
+                "camera_matrix": calibration.camera_matrix.tolist(),
+                "dist_coeffs": calibration.dist_coeffs.tolist(),
+                "image_size": list(calibration.image_size),
+                "rms": calibration.rms,
+            },
+            "cameras": list(CAMERAS),
+        }
+        if "size" in query and "altitude" in query:
+            size = tuple(int(value) for value in query["size"].lower().split("x"))
+            reply["gsd"] = self.server.policy(query, size).ground_scale.gsd()  # Meters per pixel at the picture's center
+        return reply
+
+
+class _Failed:
+    """Stands in for a batched request when a streamed picture could not be decoded or submitted."""
+
+    def __init__(self, error):
+        self.error = error
+
+    def wait(self):
+        raise self.error
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="HTTP API for detection and measurement")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    parser.add_argument("--model", default="yolov8n.pt", help="Model used when a request does not name one")
+    parser.add_argument("--models", nargs="*", default=[],
+                        help="Other models requests may name with ?model=; nothing else is ever loaded")
+    parser.add_argument("--max-batch", type=int, default=4, help="Largest batch sent to a model")
+    parser.add_argument("--max-wait", type=float, default=0.01,
+                        help="Seconds to wait for other requests before running a batch")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    registry = ModelRegistry(allowed=[args.model] + args.models)
+    registry.get(args.model)
+    server = HTTPDetectionServer((args.host, args.port), registry, args.model, args.max_batch, args.max_wait,
+                                 calibration=load_env_calibration())
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down...")
+    finally:
+        server.server_close()
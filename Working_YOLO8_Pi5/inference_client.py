@@ -0,0 +1,133 @@
+import argparse
+import socket
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from camera_source import list_images
+from detection_core import Detections, draw_detections
+from inference_server import DEFAULT_SOCKET, recv_message, send_message
+
+
+class InferenceClient:
+    """
+    Connection to inference_server.py. Frames live in a shared memory segment
+    owned by the client, so `capture()` and `detect()` only send its name.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, frame_shape=(1280, 1280, 3)):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        self.shm = None
+        self.frame = None
+        self._ensure_frame(tuple(frame_shape))
+
+    # (Re)allocate the shared frame when a picture of a new size comes along
+    def _ensure_frame(self, shape):
+        if self.frame is not None and self.frame.shape == shape:
+            return
+        self._release_frame()
+        self.shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+        self.frame = np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf)
+
+    def _release_frame(self):
+        if self.shm is not None:
+            self.frame = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def request(self, **message):
+        send_message(self.sock, message)
+        reply = recv_message(self.sock)
+        if reply is None:
+            raise ConnectionError("Inference server closed the connection")
+        if not reply.get("ok"):
+            raise RuntimeError(reply.get("error", "Inference server error"))
+        return reply
+
+    def _frame_message(self):
+        return {"shm": self.shm.name, "shape": list(self.frame.shape), "dtype": "uint8"}
+
+    # Grab a camera frame from the server; the returned array is the shared buffer itself
+    def capture(self):
+        self.request(op="capture", **self._frame_message())
+        return self.frame
+
+    def detect(self, model, frame=None, capture=False):
+        """
+        Run `model` on `frame`, or on a fresh camera frame when `capture` is set.
+        Returns the detections and the reply, which holds the queue and compute times.
+        """
+        if frame is not None and frame is not self.frame:
+            self._ensure_frame(frame.shape)
+            np.copyto(self.frame, frame)
+        reply = self.request(op="detect", model=model, capture=capture, **self._frame_message())
+        return Detections.from_dict(reply["detections"]), reply
+
+    def names(self, model):
+        reply = self.request(op="names", model=model)
+        return {int(class_id): name for class_id, name in reply["names"].items()}
+
+    def close(self):
+        self.sock.close()
+        self._release_frame()
+
+
+class RemoteBackend:
+    """DetectionCore backend that runs inference in the shared server instead of in-process."""
+
+    def __init__(self, client, model_name):
+        self.client = client
+        self.model_name = model_name
+        self._names = None
+
+    @property
+    def names(self):
+        if self._names is None:
+            self._names = self.client.names(self.model_name)
+        return self._names
+
+    @property
+    def model_id(self):
+        return self.model_name
+
+    def detect(self, frame):
+        detections, _ = self.client.detect(self.model_name, frame)
+        return detections
+
+    # The server batches across clients, so frames from one client go one at a time
+    def detect_batch(self, frames):
+        return [self.detect(frame) for frame in frames]
+
+    def plot(self, detections, frame):
+        return draw_detections(frame.copy(), detections)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run detection on images through the inference server")
+    parser.add_argument("source", help="Image file, folder or glob")
+    parser.add_argument("--model", default="yolov8n.pt", help="Model the server should use")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket of the inference server")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    client = InferenceClient(args.socket)
+    try:
+        for path in list_images(args.source):
+            frame = cv2.imread(path)
+            if frame is None:
+                print(f"{path}: could not read image")
+                continue
+            start_time = time.perf_counter()
+            detections, reply = client.detect(args.model, frame)
+            total = time.perf_counter() - start_time
+            print(f"{path}: {', '.join(detections.class_names) or 'no objects'} "
+                  f"(queue {reply['queue_time'] * 1000:.1f} ms, compute {reply['compute_time'] * 1000:.1f} ms, "
+                  f"batch {reply['batch_size']}, total {total * 1000:.1f} ms)")
+    finally:
+        client.close()
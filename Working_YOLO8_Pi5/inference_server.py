@@ -0,0 +1,222 @@
+"""
+Long-running inference daemon. It owns the camera and every loaded YOLO model,
+so several frontends (Tk GUIs, the pygame HUD, batch scripts) can share one unit
+without each loading its own weights.
+
+Clients talk to it over a Unix socket with length-prefixed JSON messages. Frames
+never go through the socket: the client puts them in a shared memory segment and
+only sends its name, and the server runs the model on a NumPy view of it.
+Detect requests for the same model from different clients are batched.
+
+Run with:
+    python inference_server.py --preload yolov8n.pt
+    python inference_server.py --camera-source c1.jpg   # replay images instead of the Pi camera
+"""
+import argparse
+import json
+import os
+import socketserver
+import struct
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+from batching import RequestBatcher
+from camera_source import open_camera
+from detection_core import UltralyticsBackend
+from frame_ring import attach_shared_memory
+from warmup import warm_up
+
+DEFAULT_SOCKET = "/tmp/aerial_inference.sock"
+
+
+def _recv_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data.extend(chunk)
+    return bytes(data)
+
+
+def send_message(sock, message):
+    payload = json.dumps(message).encode()
+    sock.sendall(struct.pack(">I", len(payload)) + payload)
+
+
+# Returns None once the other side has closed the connection
+def recv_message(sock):
+    header = _recv_exactly(sock, 4)
+    if header is None:
+        return None
+    (length,) = struct.unpack(">I", header)
+    payload = _recv_exactly(sock, length)
+    if payload is None:
+        return None
+    return json.loads(payload)
+
+
+class ModelRegistry:
+    """
+    Loads each model the first time it is asked for and keeps it for every client.
+    Models load outside the lock, so a slow first load only holds up the callers
+    waiting for that model. With `allowed` only those names can be loaded (and
+    LookupError is raised for others), which bounds what clients can make it hold.
+    """
+
+    def __init__(self, loader=None, warm=True, allowed=None):
+        self.loader = loader
+        self.warm = warm
+        self.allowed = None if allowed is None else set(allowed)
+        self._backends = {}  # Name: Future of its backend
+        self._lock = threading.Lock()
+
+    def _load(self, name):
+        if self.loader is not None:
+            model = self.loader(name)
+        else:
+            from ultralytics import YOLO
+
+            model = YOLO(name)
+        if self.warm:
+            warm_up(model)
+        return UltralyticsBackend(model, verbose=False)
+
+    def get(self, name):
+        with self._lock:
+            if self.allowed is not None and name not in self.allowed:
+                raise LookupError(f"Model {name!r} is not served here, expected one of {', '.join(sorted(self.allowed))}")
+            future = self._backends.get(name)
+            loading = future is None
+            if loading:
+                future = self._backends[name] = Future()
+        if loading:
+            try:
+                future.set_result(self._load(name))
+            except Exception as exc:
+                with self._lock:
+                    del self._backends[name]  # Let a later request try again
+                future.set_exception(exc)
+        return future.result()
+
+    def loaded(self):
+        with self._lock:
+            return [name for name, future in self._backends.items() if future.done() and future.exception() is None]
+
+
+class _ClientHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        segments = {}  # Shared memory attached for this client, by name
+        try:
+            while True:
+                message = recv_message(self.request)
+                if message is None:
+                    break
+                try:
+                    reply = self.server.dispatch(message, segments)
+                except Exception as exc:  # Report the error to the client and keep serving
+                    reply = {"ok": False, "error": f"{type(exc).__name__}: {exc}"}
+                send_message(self.request, reply)
+        finally:
+            for shm in segments.values():
+                shm.close()
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, camera, registry, max_batch=4, max_wait=0.01):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)  # Left over from a previous run
+        super().__init__(socket_path, _ClientHandler)
+        self.socket_path = socket_path
+        self.camera = camera
+        self.registry = registry
+        self.camera_lock = threading.Lock()
+        self.batcher = RequestBatcher(self._run_batch, max_batch, max_wait)
+
+    def _run_batch(self, model_name, frames):
+        return self.registry.get(model_name).detect_batch(frames)
+
+    def _frame_view(self, message, segments):
+        name = message["shm"]
+        if name not in segments:
+            segments[name] = attach_shared_memory(name)
+        return np.ndarray(tuple(message["shape"]), dtype=message.get("dtype", "uint8"), buffer=segments[name].buf)
+
+    def _capture_into(self, frame):
+        if self.camera is None:
+            raise RuntimeError("Server was started without a camera")
+        with self.camera_lock:
+            captured = self.camera.capture_array()
+        if captured.shape != frame.shape:
+            raise ValueError(f"Camera frames are {captured.shape}, client buffer is {frame.shape}")
+        np.copyto(frame, captured)
+
+    def dispatch(self, message, segments):
+        op = message.get("op")
+        if op == "ping":
+            return {"ok": True}
+        if op == "models":
+            return {"ok": True, "loaded": self.registry.loaded()}
+        if op == "load":
+            self.registry.get(message["model"])
+            return {"ok": True}
+        if op == "names":
+            return {"ok": True, "names": {str(k): v for k, v in self.registry.get(message["model"]).names.items()}}
+        if op == "capture":
+            self._capture_into(self._frame_view(message, segments))
+            return {"ok": True}
+        if op == "detect":
+            frame = self._frame_view(message, segments)
+            if message.get("capture"):
+                self._capture_into(frame)
+            request = self.batcher.submit(message["model"], frame)
+            detections = request.wait()
+            return {
+                "ok": True,
+                "detections": detections.to_dict(),
+                "queue_time": request.queue_time,
+                "compute_time": request.compute_time,
+                "batch_size": request.batch_size,
+            }
+        raise ValueError(f"Unknown op {op!r}")
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.close()
+        if self.camera is not None:
+            self.camera.stop()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Shared camera and YOLO inference daemon")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket path to listen on")
+    parser.add_argument("--camera-source", default=None,
+                        help="Image file, folder or glob to replay instead of the Pi camera")
+    parser.add_argument("--no-camera", action="store_true", help="Only serve detect requests on client frames")
+    parser.add_argument("--preload", nargs="*", default=[], help="Models to load and warm up at startup")
+    parser.add_argument("--max-batch", type=int, default=4, help="Largest batch sent to a model")
+    parser.add_argument("--max-wait", type=float, default=0.01,
+                        help="Seconds to wait for other clients before running a batch")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    camera = None if args.no_camera else open_camera(args.camera_source)
+    registry = ModelRegistry()
+    for model_name in args.preload:
+        registry.get(model_name)
+    server = InferenceServer(args.socket, camera, registry, args.max_batch, args.max_wait)
+    print(f"Serving on {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down...")
+    finally:
+        server.server_close()
@@ -1,6 +1,8 @@
 import tkinter as tk
 from PIL import Image, ImageTk
-import math
+from geometry_tools import Geometry
+
+PIXELS_PER_INCH = 50
 
 class LineDrawingApp:
     def __init__(self, root, image_path):
@@ -26,15 +28,18 @@ class LineDrawingApp:
         self.canvas.create_rectangle(20, 20, 70, 70, outline="blue", width=2)
         self.canvas.create_text(45, 75, text="1 inch", fill="blue", font=("Arial", 10))
         
-        # Line drawing variables
-        self.points = []  # List to store the two points
+        # Line drawing variables: clicks keep extending one polyline until Enter starts a new one
+        self.line = Geometry("polyline")
         
         # Label to display the distance
         self.distance_label = tk.Label(root, text="Distance: 0.00 inches", font=("Arial", 14))
         self.distance_label.pack(pady=10)
         
-        # Bind mouse events
+        # Bind mouse events, Enter for a new line and Ctrl+Z/Ctrl+Y to undo and redo points
         self.canvas.bind("<Button-1>", self.handle_click)
+        root.bind("<Return>", self.new_line)
+        root.bind("<Control-z>", lambda event: self.line.undo() and self.redraw())
+        root.bind("<Control-y>", lambda event: self.line.redo() and self.redraw())
         
         # Add Quit button
         quit_button = tk.Button(root, text="Quit", command=root.destroy)
@@ -44,26 +49,25 @@ class LineDrawingApp:
         root.bind("<Escape>", lambda event: root.destroy())
     
     def handle_click(self, event):
-        # Store the clicked point
-        self.points.append((event.x, event.y))
+        # Add the clicked point to the current line
+        self.line.add((event.x, event.y))
+        self.redraw()
+
+    def redraw(self):
+        # Only the current line is redrawn, finished lines stay on the canvas
+        self.canvas.delete("active_line")
+        if len(self.line) > 1:
+            self.canvas.create_line(*self.line.vertices.ravel().tolist(), fill="red", width=2, tags="active_line")
         
-        # If two points are clicked, draw a line
-        if len(self.points) == 2:
-            x1, y1 = self.points[0]
-            x2, y2 = self.points[1]
-            self.canvas.create_line(x1, y1, x2, y2, fill="red", width=2)
-            
-            # Calculate the distance in pixels
-            pixel_distance = math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
-            
-            # Convert pixels to inches (1 inch = 50 pixels)
-            inch_distance = pixel_distance / 50
-            
-            # Update the label with the distance
-            self.distance_label.config(text=f"Distance: {inch_distance:.2f} inches")
-            
-            # Reset points list for next line
-            self.points = []
+        # Convert pixels to inches (1 inch = 50 pixels)
+        segment = self.line.last_segment / PIXELS_PER_INCH
+        total = self.line.length / PIXELS_PER_INCH
+        self.distance_label.config(text=f"Distance: {segment:.2f} inches (total {total:.2f} inches, {len(self.line)} points)")
+        return True
+
+    def new_line(self, event=None):
+        self.canvas.itemconfig("active_line", tags="done")
+        self.line = Geometry("polyline")
 
 # Main execution
 if __name__ == "__main__":
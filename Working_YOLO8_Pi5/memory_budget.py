@@ -0,0 +1,233 @@
+"""
+Memory accounting for long field sessions: process RSS and system headroom
+from /proc, the frame buffers the GUI keeps, and the size of every loaded
+model. Models are loaded on first use and unloaded when another is picked,
+instead of all of them sitting in memory from startup, and when headroom runs
+low the GUI is told to shrink pictures or move to a smaller model.
+
+    python memory_budget.py yolov8n.pt yolov8s.pt     # load each model and print what it costs
+"""
+import argparse
+import collections
+import gc
+import os
+import time
+
+import numpy as np
+
+# Smallest first, so the model before another one in this list is the cheaper fallback
+MODEL_NAMES = ["yolov8n.pt", "yolov8s.pt", "yolov8m.pt", "yolov8l.pt", "yolov8x.pt",
+               "yolov8x-worldv2.pt", "yolov8n-obb.pt", "yolov8x-obb.pt"]
+FALLBACKS = {"yolov8x-worldv2.pt": None, "yolov8n-obb.pt": None, "yolov8x-obb.pt": "yolov8n-obb.pt"}
+
+MB = 1024 * 1024
+
+
+def _meminfo():
+    values = {}
+    with open("/proc/meminfo") as f:
+        for line in f:
+            name, value = line.split(":", 1)
+            values[name] = int(value.split()[0]) * 1024
+    return values
+
+
+# Resident set size of this process in bytes
+def process_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # Peak, not current, off Linux
+
+
+# (total, available) system memory in bytes
+def system_memory():
+    try:
+        info = _meminfo()
+    except OSError:
+        return None, None
+    return info.get("MemTotal"), info.get("MemAvailable", info.get("MemFree"))
+
+
+def model_bytes(model):
+    """Bytes of weights held by a loaded Ultralytics model, or the size of its files for exported ones."""
+    network = getattr(model, "model", None)
+    if hasattr(network, "parameters"):
+        return sum(parameter.numel() * parameter.element_size() for parameter in network.parameters())
+    path = str(getattr(model, "ckpt_path", None) or getattr(model, "model_name", None) or "")
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path) if os.path.isfile(path) else 0
+
+
+class BudgetedModelRegistry:
+    """
+    Models by name, loaded on first `get` and kept to the `max_loaded` most
+    recently used, so switching models in the GUI swaps weights instead of
+    holding every model at once. `loader` defaults to ultralytics.YOLO. Unlike
+    inference_server.ModelRegistry, which keeps every model it has loaded for the
+    servers, this one evicts to stay within a memory budget.
+    """
+
+    def __init__(self, names=MODEL_NAMES, loader=None, max_loaded=1):
+        self.names = list(names)
+        self.loader = loader
+        self.max_loaded = max_loaded
+        self.sizes = {}  # Bytes per model, remembered after unloading
+        self._loaded = collections.OrderedDict()
+
+    def get(self, name):
+        if name in self._loaded:
+            self._loaded.move_to_end(name)
+            return self._loaded[name]
+        while len(self._loaded) >= self.max_loaded:
+            self.unload(next(iter(self._loaded)))
+        if self.loader is None:
+            from ultralytics import YOLO
+
+            self.loader = YOLO
+        model = self.loader(name)
+        self._loaded[name] = model
+        self.sizes[name] = model_bytes(model)
+        return model
+
+    def unload(self, name):
+        if self._loaded.pop(name, None) is not None:
+            gc.collect()  # Let the weights go now rather than at the next collection
+
+    @property
+    def loaded(self):
+        return list(self._loaded)
+
+    @property
+    def loaded_bytes(self):
+        return sum(self.sizes.get(name, 0) for name in self._loaded)
+
+    def smaller(self, name):
+        """The next cheaper model that detects the same things, or None."""
+        if name in FALLBACKS:
+            return FALLBACKS[name]
+        index = self.names.index(name) if name in self.names else 0
+        return self.names[index - 1] if index > 0 else None
+
+
+class FramePool:
+    """
+    Named full-resolution buffers reused from one picture to the next, at most
+    `max_frames` of them. Drawing a line or a shape copies the annotated picture
+    into its buffer instead of allocating another frame per click.
+    """
+
+    def __init__(self, max_frames=3):
+        self.max_frames = max_frames
+        self._buffers = collections.OrderedDict()
+
+    def copy(self, name, frame):
+        buffer = self._buffers.pop(name, None)
+        if buffer is None or buffer.shape != frame.shape or buffer.dtype != frame.dtype:
+            while len(self._buffers) >= self.max_frames:
+                self._buffers.popitem(last=False)
+            buffer = np.empty_like(frame)
+        self._buffers[name] = buffer
+        np.copyto(buffer, frame)
+        return buffer
+
+    def clear(self):
+        self._buffers.clear()
+
+    def __len__(self):
+        return len(self._buffers)
+
+    @property
+    def nbytes(self):
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+
+class MemoryMonitor:
+    """
+    Samples memory use and rates the pressure: "ok", "high" once system headroom
+    drops below `high_reserve` (or RSS passes `budget`), "critical" below
+    `critical_reserve`. `frames` is a callable returning the other frame arrays
+    the caller keeps alive, so they count towards the frame total.
+    """
+
+    def __init__(self, registry=None, pool=None, frames=None, budget=None,
+                 high_reserve=0.2, critical_reserve=0.1, log_path=None):
+        self.registry = registry
+        self.pool = pool
+        self.frames = frames
+        self.budget = budget  # Bytes of RSS, None for no per-process limit
+        self.high_reserve = high_reserve
+        self.critical_reserve = critical_reserve
+        self.log_path = log_path
+        self.peak_rss = 0
+
+    def snapshot(self):
+        total, available = system_memory()
+        extra_frames = [frame for frame in (self.frames() if self.frames else []) if frame is not None]
+        snapshot = {
+            "time": time.time(),
+            "rss": process_rss(),
+            "total": total,
+            "available": available,
+            "frames": len(extra_frames) + (len(self.pool) if self.pool else 0),
+            "frame_bytes": sum(frame.nbytes for frame in extra_frames) + (self.pool.nbytes if self.pool else 0),
+            "model_bytes": self.registry.loaded_bytes if self.registry else 0,
+        }
+        self.peak_rss = max(self.peak_rss, snapshot["rss"])
+        snapshot["pressure"] = self.pressure(snapshot)
+        return snapshot
+
+    def pressure(self, snapshot):
+        if snapshot["total"]:
+            headroom = snapshot["available"] / snapshot["total"]
+            if headroom < self.critical_reserve:
+                return "critical"
+            if headroom < self.high_reserve:
+                return "high"
+        if self.budget is not None and snapshot["rss"] > self.budget:
+            return "high"
+        return "ok"
+
+    def status_text(self, snapshot):
+        text = (f"Memory: {snapshot['rss'] / MB:.0f} MB "
+                f"(models {snapshot['model_bytes'] / MB:.0f} MB, {snapshot['frames']} frames {snapshot['frame_bytes'] / MB:.0f} MB)")
+        if snapshot["available"] is not None:
+            text += f", {snapshot['available'] / MB:.0f} MB free"
+        return text
+
+    def log(self, snapshot, note=""):
+        """Append the snapshot to `log_path` as one CSV line, or print it when there is no log file."""
+        line = ",".join(str(value) for value in (
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(snapshot["time"])), snapshot["rss"], snapshot["available"],
+            snapshot["frames"], snapshot["frame_bytes"], snapshot["model_bytes"], snapshot["pressure"], note))
+        if self.log_path is None:
+            print(line)
+            return
+        new_file = not os.path.exists(self.log_path)
+        with open(self.log_path, "a") as f:
+            if new_file:
+                f.write("time,rss,available,frames,frame_bytes,model_bytes,pressure,note\n")
+            f.write(line + "\n")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Print the memory each YOLO model adds to the process")
+    parser.add_argument("models", nargs="*", default=MODEL_NAMES, help="Models to load, one at a time")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    registry = BudgetedModelRegistry(args.models)
+    monitor = MemoryMonitor(registry)
+    print(monitor.status_text(monitor.snapshot()))
+    for name in args.models:
+        before = process_rss()
+        registry.get(name)
+        snapshot = monitor.snapshot()
+        print(f"{name}: weights {registry.sizes[name] / MB:.1f} MB, RSS +{(snapshot['rss'] - before) / MB:.1f} MB")
+        print(f"  {monitor.status_text(snapshot)}")
@@ -0,0 +1,170 @@
+"""
+Capture from several cameras (both Pi 5 camera ports, or replayed files) and
+run one model over all of them. Each source has its own capture thread; frames
+that arrive within `window` seconds of each other go through the model as one
+batch, and each source gets its own results back. One model copy serves every
+camera, instead of one script and one model per camera.
+
+    python multi_camera.py pi:0 pi:1 --model yolov8n_ncnn_model
+    python multi_camera.py c1.jpg c2.jpg c3.jpg --fps 15 --seconds 20 --no-display
+"""
+import argparse
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from batching import RequestBatcher
+from camera_source import open_source
+from detection_core import UltralyticsBackend
+
+
+class SourceResult:
+    """Detections for one frame of one source, with when it was captured and how it was batched."""
+
+    def __init__(self, source, index, frame, timestamp, detections, request):
+        self.source = source
+        self.index = index  # Frame number within its source
+        self.frame = frame
+        self.timestamp = timestamp
+        self.detections = detections
+        self.queue_time = request.queue_time
+        self.compute_time = request.compute_time
+        self.batch_size = request.batch_size
+
+
+class MultiCameraRunner:
+    """
+    One capture thread per camera submits its newest frame to a RequestBatcher
+    and waits for the detections, so cameras take turns being batched together
+    without any of them waiting for the others to capture. `on_result` is
+    called from the capture threads with a SourceResult.
+
+    A failed capture, batch or `on_result` is counted in `error_counts` and kept in
+    `errors` for its source, and that source carries on with its next frame; after
+    `max_errors` failures in a row the whole runner stops, so `running` turns False.
+    """
+
+    def __init__(self, cameras, backend, on_result, window=0.02, max_batch=None, names=None, max_errors=5):
+        self.cameras = cameras
+        self.backend = backend
+        self.on_result = on_result
+        self.names = names or [f"camera {index}" for index in range(len(cameras))]
+        self.batcher = RequestBatcher(self._run_batch, max_batch=max_batch or len(cameras), max_wait=window)
+        self.frames = [0] * len(cameras)
+        self.max_errors = max_errors
+        self.errors = {}  # Source name: its last exception
+        self.error_counts = [0] * len(cameras)
+        self._stop = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._capture_loop, args=(index,), name=f"capture-{index}", daemon=True)
+            for index in range(len(cameras))
+        ]
+
+    def _run_batch(self, key, frames):
+        return self.backend.detect_batch(frames)
+
+    def _capture_loop(self, index):
+        camera = self.cameras[index]
+        failures = 0
+        while not self._stop.is_set():
+            try:
+                frame = camera.capture_array()
+                timestamp = time.monotonic()
+                if frame.ndim == 3 and frame.shape[2] == 4:
+                    frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+                request = self.batcher.submit("model", frame)
+                detections = request.wait()
+                self.on_result(SourceResult(self.names[index], self.frames[index], frame, timestamp, detections, request))
+            except EOFError:
+                break
+            except Exception as error:
+                failures += 1
+                self.error_counts[index] += 1
+                self.errors[self.names[index]] = error
+                print(f"{self.names[index]}: {type(error).__name__}: {error}")
+                if failures >= self.max_errors:
+                    print(f"{self.names[index]}: {failures} failures in a row, stopping")
+                    self._stop.set()
+                continue
+            failures = 0
+            self.frames[index] += 1
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self.batcher.close()
+        for camera in self.cameras:
+            camera.stop()
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run one YOLO model over several cameras with batched inference")
+    parser.add_argument("sources", nargs="+", help='Sources: "pi:0", "pi:1", or image folders, globs and videos')
+    parser.add_argument("--model", default="yolov8n.pt", help="YOLO model to run")
+    parser.add_argument("--window", type=float, default=0.02, help="Seconds to wait for other cameras' frames")
+    parser.add_argument("--fps", type=float, default=None, help="Pace replayed sources")
+    parser.add_argument("--size", type=int, nargs=2, default=(1280, 1280), help="Frame width and height")
+    parser.add_argument("--seconds", type=float, default=None, help="Stop after this long")
+    parser.add_argument("--no-display", action="store_true", help="Only print throughput, no preview windows")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    from ultralytics import YOLO
+
+    from warmup import warm_up
+
+    model = YOLO(args.model)
+    warm_up(model, frame_shape=(args.size[1], args.size[0], 3))
+    cameras = [open_source(source, tuple(args.size), fps=args.fps) for source in args.sources]
+
+    latest = {}
+    batch_sizes = []
+    lock = threading.Lock()
+
+    def collect(result):
+        with lock:
+            latest[result.source] = result
+            batch_sizes.append(result.batch_size)
+
+    runner = MultiCameraRunner(cameras, UltralyticsBackend(model, verbose=False), collect, args.window,
+                               names=args.sources).start()
+    start_time = time.perf_counter()
+    try:
+        while runner.running:
+            if args.seconds is not None and time.perf_counter() - start_time > args.seconds:
+                break
+            if args.no_display:
+                time.sleep(0.1)
+                continue
+            with lock:
+                shown = list(latest.values())
+            for result in shown:
+                annotated_frame = result.detections.raw.plot(img=result.frame.copy())
+                cv2.putText(annotated_frame, f"{result.source} #{result.index} batch {result.batch_size}", (10, 40),
+                            cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2, cv2.LINE_AA)
+                cv2.imshow(result.source, annotated_frame)
+            if cv2.waitKey(10) == ord("q"):
+                break
+    finally:
+        runner.stop()
+        cv2.destroyAllWindows()
+
+    elapsed = time.perf_counter() - start_time
+    for name, frames, errors in zip(runner.names, runner.frames, runner.error_counts):
+        print(f"{name}: {frames} frames, {frames / elapsed:.1f} FPS" + (f", {errors} errors" if errors else ""))
+    if batch_sizes:
+        print(f"combined: {sum(runner.frames) / elapsed:.1f} FPS, mean batch {np.mean(batch_sizes):.2f}")
@@ -1,7 +1,16 @@
 from ultralytics import YOLO
+from class_filter import prune_detect_head
 
 # Load a YOLOv8n PyTorch model
 model = YOLO("yolov8x.pt")
 
+# Only keep the classes the GUIs use, e.g. ["car", "truck", "cell phone"]; the head
+# then scores 3 classes instead of 80. None exports every class
+CLASSES = None
+if CLASSES is not None:
+    prune_detect_head(model, CLASSES)
+    model.save("yolov8x_pruned.pt")
+    model = YOLO("yolov8x_pruned.pt")
+
 # Export the model to NCNN format
-model.export(format="ncnn", imgsz=640)  # creates 'yolov8n_ncnn_model'
\ No newline at end of file
+model.export(format="ncnn", imgsz=640)  # creates 'yolov8n_ncnn_model' ('yolov8x_pruned_ncnn_model' when pruned)
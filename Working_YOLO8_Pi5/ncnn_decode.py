@@ -0,0 +1,205 @@
+"""
+Decoding of raw YOLOv8 ncnn output in NumPy, so an exported model can be run
+with the ncnn Python bindings alone, without torch or Ultralytics. `out0` is
+(1, 4 + classes, anchors): box centre, width and height, then one score per
+class for every anchor. Scores are thresholded before anything is sorted, so
+NMS only ever sees the few candidates that can survive.
+
+    python ncnn_decode.py                                   # time decode on a synthetic 1x84x8400 output
+    python ncnn_decode.py yolov8n_ncnn_model c1.jpg --classes car truck "cell phone"
+"""
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+
+from detection_core import Detections, class_ids, draw_detections
+
+# Offset per class so one NMS pass never suppresses a box of another class
+MAX_WH = 7680
+
+
+def load_names(model_dir):
+    """Class names from the `names:` block of an exported model's metadata.yaml."""
+    names = {}
+    with open(os.path.join(model_dir, "metadata.yaml")) as f:
+        in_names = False
+        for line in f:
+            if line.startswith("names:"):
+                in_names = True
+            elif in_names and line.startswith("  ") and ":" in line:
+                class_id, name = line.split(":", 1)
+                names[int(class_id)] = name.strip().strip("'\"")
+            elif in_names:
+                break
+    return names
+
+
+def nms(xyxy, iou_threshold):
+    """
+    Indices of the boxes to keep, for boxes already sorted by descending score.
+    Same result as greedy NMS, but from one IoU matrix: a box is dropped when a
+    kept, higher scoring box overlaps it, repeated until nothing changes
+    (Cluster-NMS), which takes a few matrix passes instead of one loop per box.
+    """
+    x1, y1, x2, y2 = xyxy.T
+    areas = (x2 - x1) * (y2 - y1)
+    width = np.minimum(x2[:, None], x2[None]) - np.maximum(x1[:, None], x1[None])
+    height = np.minimum(y2[:, None], y2[None]) - np.maximum(y1[:, None], y1[None])
+    intersection = np.clip(width, 0, None) * np.clip(height, 0, None)
+    iou = intersection / (areas[:, None] + areas[None] - intersection + 1e-9)
+    suppresses = np.triu(iou > iou_threshold, 1)  # [i, j]: higher scoring i overlaps j
+    keep = np.ones(len(xyxy), dtype=bool)
+    while True:
+        updated = ~(suppresses & keep[:, None]).any(axis=0)
+        if np.array_equal(updated, keep):
+            return np.flatnonzero(keep)
+        keep = updated
+
+
+def decode(output, conf=0.25, iou=0.45, classes=None, top_k=300, max_candidates=1000):
+    """
+    (xyxy, conf, cls) from raw output, boxes in network input pixels. `classes`
+    is an array of class ids to keep (see class_ids); their score rows are the
+    only ones looked at. `top_k` caps the boxes kept after NMS, `max_candidates`
+    the boxes going into it (NMS holds a candidates x candidates matrix).
+    """
+    predictions = np.asarray(output)
+    if predictions.ndim == 3:
+        predictions = predictions[0]
+    scores = predictions[4:]
+    if classes is not None:
+        scores = scores[classes]
+    # Class max over rows of the (classes, anchors) layout as it comes, no transpose
+    best = scores.max(axis=0)
+    candidates = np.flatnonzero(best > conf)
+    if not len(candidates):
+        return np.empty((0, 4), np.float32), np.empty(0, np.float32), np.empty(0, np.int64)
+    best = best[candidates]
+    order = np.argsort(-best, kind="stable")[:max_candidates]
+    candidates, best = candidates[order], best[order]
+    cls = scores[:, candidates].argmax(axis=0)
+    if classes is not None:
+        cls = classes[cls]
+    cx, cy, w, h = predictions[:4, candidates]
+    xyxy = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+    keep = nms(xyxy + (cls * MAX_WH)[:, None], iou)[:top_k]
+    return xyxy[keep].astype(np.float32), best[keep].astype(np.float32), cls[keep].astype(np.int64)
+
+
+def letterbox(frame, size=640, color=114):
+    """
+    The network input for a BGR frame: resized to fit `size` keeping its aspect,
+    padded, RGB, CHW float32 in [0, 1]. Returns it with the scale and padding.
+    """
+    height, width = frame.shape[:2]
+    scale = min(size / width, size / height)
+    new_width, new_height = int(round(width * scale)), int(round(height * scale))
+    pad_x, pad_y = (size - new_width) // 2, (size - new_height) // 2
+    image = np.full((size, size, 3), color, dtype=np.uint8)
+    image[pad_y:pad_y + new_height, pad_x:pad_x + new_width] = cv2.resize(frame, (new_width, new_height),
+                                                                         interpolation=cv2.INTER_LINEAR)
+    blob = cv2.cvtColor(image, cv2.COLOR_BGR2RGB).transpose(2, 0, 1).astype(np.float32) / 255.0
+    return np.ascontiguousarray(blob), scale, (pad_x, pad_y)
+
+
+# Boxes in letterboxed network pixels back to frame pixels
+def scale_boxes(xyxy, scale, pad, frame_shape):
+    xyxy = (xyxy - np.array([pad[0], pad[1], pad[0], pad[1]], dtype=np.float32)) / scale
+    xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, frame_shape[1])
+    xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, frame_shape[0])
+    return xyxy
+
+
+class NcnnBackend:
+    """
+    DetectionCore backend running an exported ncnn model directly (no torch or
+    Ultralytics), with `classes` restricting detection to an allow-list of names.
+    """
+
+    def __init__(self, model_dir, conf=0.25, iou=0.45, classes=None, top_k=300, num_threads=None, imgsz=640):
+        import ncnn
+
+        self.model_dir = model_dir
+        self.names = load_names(model_dir)
+        self.classes = class_ids(self.names, classes)
+        self.conf = conf
+        self.iou = iou
+        self.top_k = top_k
+        self.imgsz = imgsz
+        self.net = ncnn.Net()
+        if num_threads is not None:
+            self.net.opt.num_threads = num_threads
+        self.net.load_param(os.path.join(model_dir, "model.ncnn.param"))
+        self.net.load_model(os.path.join(model_dir, "model.ncnn.bin"))
+        self._ncnn = ncnn
+
+    @property
+    def model_id(self):
+        classes = None if self.classes is None else self.classes.tolist()
+        return f"ncnn:{os.path.abspath(self.model_dir)}:{self.conf}:{self.iou}:{classes}"
+
+    def infer(self, blob):
+        with self.net.create_extractor() as extractor:
+            extractor.input("in0", self._ncnn.Mat(blob).clone())
+            _, out0 = extractor.extract("out0")
+        return np.array(out0)
+
+    def detect(self, frame):
+        blob, scale, pad = letterbox(frame, self.imgsz)
+        xyxy, conf, cls = decode(self.infer(blob), self.conf, self.iou, self.classes, self.top_k)
+        return Detections(scale_boxes(xyxy, scale, pad, frame.shape), conf, cls, self.names)
+
+    def detect_batch(self, frames):
+        return [self.detect(frame) for frame in frames]
+
+    def plot(self, detections, frame):
+        return draw_detections(frame.copy(), detections)
+
+
+# Raw output with a handful of objects among 8400 anchors of background, like a real frame
+def synthetic_output(classes=80, anchors=8400, objects=20, seed=0):
+    rng = np.random.default_rng(seed)
+    output = np.empty((1, 4 + classes, anchors), dtype=np.float32)
+    output[0, :2] = rng.uniform(0, 640, (2, anchors))
+    output[0, 2:4] = rng.uniform(10, 200, (2, anchors))
+    output[0, 4:] = rng.uniform(0, 0.05, (classes, anchors))
+    for anchor in rng.choice(anchors, objects * 5, replace=False):
+        output[0, 4 + rng.integers(classes), anchor] = rng.uniform(0.3, 0.95)
+    return output
+
+
+def benchmark(runs=200, classes=None):
+    output = synthetic_output()
+    decode(output, classes=classes)
+    start_time = time.perf_counter()
+    for _ in range(runs):
+        xyxy, _, _ = decode(output, classes=classes)
+    elapsed = (time.perf_counter() - start_time) / runs
+    print(f"decode 1x84x8400: {elapsed * 1000:.3f} ms, {len(xyxy)} boxes kept"
+          + ("" if classes is None else f" ({len(classes)} classes)"))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Decode raw YOLOv8 ncnn output without torch")
+    parser.add_argument("model", nargs="?", default=None, help="Exported ncnn model folder; omit to time decode only")
+    parser.add_argument("image", nargs="?", default=None, help="Picture to detect on")
+    parser.add_argument("--classes", nargs="*", default=None, help="Only these class names")
+    parser.add_argument("--conf", type=float, default=0.25, help="Confidence threshold")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.model is None:
+        benchmark()
+        benchmark(classes=np.array([2, 7, 67]))  # car, truck, cell phone
+    else:
+        backend = NcnnBackend(args.model, conf=args.conf, classes=args.classes)
+        frame = cv2.imread(args.image)
+        start_time = time.perf_counter()
+        detections = backend.detect(frame)
+        print(f"{len(detections)} objects in {(time.perf_counter() - start_time) * 1000:.1f} ms: "
+              f"{', '.join(detections.class_names) or 'none'}")
@@ -0,0 +1,192 @@
+"""
+Box drawing, measuring, thumbnailing and image encoding in a pool of worker
+processes, so the thread that runs the model can go straight on to the next
+frame. Frames are handed over through shared memory slots (see frame_ring.py)
+and only the detection arrays are pickled; workers draw into the slot in
+place, so the annotated frame comes back without being copied either.
+
+    python postprocess_pool.py --frames 100 --workers 2     # time inline against pooled postprocessing
+"""
+import argparse
+import collections
+import multiprocessing
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from detection_core import Detections, Measurement, REFERENCE_POLICIES, draw_detections
+from frame_ring import FrameRing
+
+# The ring each worker process attached to, set by _init_worker
+_worker_ring = None
+
+
+def _init_worker(ring_name):
+    global _worker_ring
+    cv2.setNumThreads(1)  # Several workers already share the cores
+    _worker_ring = FrameRing.attach(ring_name)
+
+
+class PostprocessResult:
+    """What a worker made of one frame; the annotated frame itself stays in the shared slot."""
+
+    def __init__(self, slot, measurement=None, thumbnail=None, encoded=None, path=None, seconds=0.0):
+        self.slot = slot
+        self.measurement = measurement
+        self.thumbnail = thumbnail
+        self.encoded = encoded  # Bytes of the encoded image, when an encoding was asked for
+        self.path = path  # Where the image was written, when a path was given
+        self.seconds = seconds  # Time spent in the worker
+
+
+def _postprocess(slot, xyxy, conf, cls, names, policy, draw, thumbnail_scale, encoding, path):
+    start_time = time.perf_counter()
+    frame = _worker_ring.slots[slot]
+    measurement = None
+    if xyxy is not None:
+        detections = Detections(xyxy, conf, cls, names)
+        measurement = Measurement(detections, policy) if policy is not None else None
+        if draw:
+            draw_detections(frame, detections)
+    thumbnail = None
+    if thumbnail_scale:
+        size = (frame.shape[1] // thumbnail_scale, frame.shape[0] // thumbnail_scale)
+        thumbnail = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    encoded = None
+    if path is not None:
+        cv2.imwrite(path, frame)
+    elif encoding is not None:
+        ok, buffer = cv2.imencode(encoding, frame)
+        encoded = buffer.tobytes() if ok else None
+    return PostprocessResult(slot, measurement, thumbnail, encoded, path, time.perf_counter() - start_time)
+
+
+class PostprocessPool:
+    """
+    `submit(frame, detections)` copies the frame into a free shared slot and
+    returns a Future for its PostprocessResult. The slot holds the annotated
+    frame (`annotated(result)`) until `release(result)`. With `block=False` a
+    frame is dropped (None is returned) when every slot is in use, so a slow
+    display never holds up inference. One more slot is kept for `save`, so a save
+    never waits for slots the display is holding.
+
+    Workers are forked: create the pool before loading a model, so they do not
+    inherit its weights, as with frame_ring.start_capture_process.
+    """
+
+    def __init__(self, frame_shape=(1280, 1280, 3), workers=2, slots=None, policy=None,
+                 thumbnail_scale=None, encoding=None):
+        self.policy = policy
+        self.thumbnail_scale = thumbnail_scale
+        self.encoding = encoding
+        self.ring = FrameRing.create(slots=(slots or 2 * workers + 1) + 1, frame_shape=frame_shape)
+        self._free = queue.Queue()
+        for index in range(len(self.ring.slots) - 1):
+            self._free.put(index)
+        self._save_free = queue.Queue()
+        self._save_free.put(len(self.ring.slots) - 1)
+        self.executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"),
+                                            initializer=_init_worker, initargs=(self.ring.name,))
+        self.dropped = 0
+
+    def _slot(self, frame, block, free=None):
+        if frame.shape != self.ring.frame_shape:
+            raise ValueError(f"Frame is {frame.shape}, the pool was made for {self.ring.frame_shape}")
+        try:
+            slot = (free or self._free).get(block=block)
+        except queue.Empty:
+            if free is None:
+                self.dropped += 1  # A displayed frame, not a save
+            return None
+        np.copyto(self.ring.slots[slot], frame)
+        return slot
+
+    def submit(self, frame, detections=None, policy=None, draw=True, block=True):
+        slot = self._slot(frame, block)
+        if slot is None:
+            return None
+        arrays = (None, None, None, None) if detections is None else \
+            (detections.xyxy, detections.conf, detections.cls, detections.names)
+        return self.executor.submit(_postprocess, slot, *arrays, policy or self.policy, draw,
+                                    self.thumbnail_scale, self.encoding, None)
+
+    def save(self, frame, path):
+        """
+        Write `frame` to `path` from a worker, in the slot kept for saves. Never
+        waits: returns None while the previous save is still being written.
+        """
+        slot = self._slot(frame, block=False, free=self._save_free)
+        if slot is None:
+            return None
+        future = self.executor.submit(_postprocess, slot, None, None, None, None, None, False, None, None, path)
+        future.add_done_callback(lambda done: self._save_free.put(slot))
+        return future
+
+    def annotated(self, result):
+        return self.ring.slots[result.slot]
+
+    def release(self, result):
+        self._free.put(result.slot)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.ring.close()
+
+
+def _inline(frame, detections, policy):
+    annotated = draw_detections(frame.copy(), detections)
+    Measurement(detections, policy)
+    cv2.resize(annotated, (frame.shape[1] // 4, frame.shape[0] // 4), interpolation=cv2.INTER_AREA)
+    cv2.imencode(".jpg", annotated)
+
+
+# Throughput of a stand-in "inference" step followed by postprocessing inline, then with the pool
+def benchmark(frames=100, workers=2, inference_seconds=0.02, frame_shape=(1280, 1280, 3)):
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, frame_shape, dtype=np.uint8)
+    xyxy = np.sort(rng.uniform(0, frame_shape[1], (30, 4)).reshape(30, 2, 2), axis=1).reshape(30, 4)
+    detections = Detections(xyxy, rng.uniform(0.3, 1, 30), rng.integers(0, 3, 30), {0: "car", 1: "truck", 2: "person"})
+    policy = REFERENCE_POLICIES["Real Car"]
+
+    start_time = time.perf_counter()
+    for _ in range(frames):
+        time.sleep(inference_seconds)
+        _inline(frame, detections, policy)
+    inline_time = time.perf_counter() - start_time
+
+    pool = PostprocessPool(frame_shape, workers, policy=policy, thumbnail_scale=4, encoding=".jpg")
+    pool.release(pool.submit(frame, detections).result())  # Start the workers
+    pending = collections.deque()
+    start_time = time.perf_counter()
+    for _ in range(frames):
+        time.sleep(inference_seconds)
+        pending.append(pool.submit(frame, detections))
+        while pending and pending[0].done():
+            pool.release(pending.popleft().result())
+        if len(pending) >= len(pool.ring.slots) - 1:
+            pool.release(pending.popleft().result())
+    while pending:
+        pool.release(pending.popleft().result())
+    pool_time = time.perf_counter() - start_time
+    pool.close()
+
+    print(f"{frames} frames, {inference_seconds * 1000:.0f} ms of inference each")
+    print(f"  inline postprocessing: {frames / inline_time:.1f} FPS")
+    print(f"  {workers} postprocessing workers: {frames / pool_time:.1f} FPS "
+          f"(model alone {1 / inference_seconds:.1f} FPS)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare inline and pooled postprocessing throughput")
+    parser.add_argument("--frames", type=int, default=100, help="Frames to process")
+    parser.add_argument("--workers", type=int, default=2, help="Postprocessing processes")
+    parser.add_argument("--inference-ms", type=float, default=20, help="Stand-in inference time per frame")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    benchmark(args.frames, args.workers, args.inference_ms / 1000)
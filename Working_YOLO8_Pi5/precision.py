@@ -0,0 +1,252 @@
+"""
+Scale estimates with error bars. One picture's scale rests on a few jittery
+reference boxes, so instead every frame's confidence-weighted reference
+diagonal goes into a running mean and variance, reference boxes are followed
+from frame to frame to see how much they jitter, and distances are reported
+with a confidence interval. Capturing stops once the interval is narrow enough.
+
+    python precision.py "flight/*.jpg" --model yolov8n.pt --mode "Real Car" --precision 0.02
+"""
+import argparse
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+from detection_core import calculate_distance, pairwise_iou
+
+
+def t_quantile(probability, dof):
+    """Student's t quantile from the normal one (Cornish-Fisher); within 4% of the exact value from 3 degrees of freedom."""
+    z = NormalDist().inv_cdf(probability)
+    if math.isinf(dof):
+        return z
+    return z + (z ** 3 + z) / (4 * dof) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * dof ** 2)
+
+
+class RunningStats:
+    """Weighted mean and variance updated one value at a time (Welford/West), without keeping the values."""
+
+    def __init__(self):
+        self.count = 0
+        self.weight = 0.0
+        self.weight_squared = 0.0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value, weight=1.0):
+        self.count += 1
+        self.weight += weight
+        self.weight_squared += weight * weight
+        delta = value - self.mean
+        self.mean += delta * weight / self.weight
+        self._m2 += weight * delta * (value - self.mean)
+
+    @property
+    def effective_count(self):
+        return self.weight ** 2 / self.weight_squared if self.weight_squared else 0.0
+
+    @property
+    def variance(self):
+        # Unbiased for reliability weights; undefined until there are two values
+        denominator = self.weight - self.weight_squared / self.weight if self.weight else 0.0
+        return self._m2 / denominator if denominator > 0 else math.nan
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance) if self.count > 1 else math.nan
+
+    @property
+    def standard_error(self):
+        return self.std / math.sqrt(self.effective_count) if self.count > 1 else math.nan
+
+
+class ScaleEstimator:
+    """
+    Running pixels-per-unit for a reference policy over many frames. Each frame
+    adds its reference boxes' diagonal, averaged with their confidences as
+    weights; the estimate is converged once the `confidence` interval of the scale
+    is within `precision` (relative) of it, after at least `min_frames`.
+
+    Stopping as soon as the interval looks narrow enough favours runs whose first
+    frames happen to agree, so a stopped interval covers the true scale less often
+    than `confidence` says: about 89% instead of 95% in simulation when only 4
+    frames were required. Not stopping before `min_effective_count` (confidence
+    weighted) frames had reference objects brings it back to 94-95%.
+
+    `real_size_uncertainty` is the relative spread of the policy's assumed real
+    size (real cars are not all 15 feet), which no amount of averaging removes.
+    `click_error` is the standard error of a clicked point in pixels.
+    """
+
+    def __init__(self, policy, confidence=0.95, precision=0.01, min_frames=4, max_frames=30,
+                 real_size_uncertainty=0.0, click_error=1.0, match_iou=0.3, min_effective_count=10):
+        self.policy = policy
+        self.confidence = confidence
+        self.precision = precision
+        self.min_frames = min_frames
+        self.max_frames = max_frames
+        self.min_effective_count = min_effective_count
+        self.real_size_uncertainty = real_size_uncertainty
+        self.click_error = click_error
+        self.match_iou = match_iou
+        self.frames = 0
+        self.diagonal = RunningStats()  # Per frame weighted reference diagonal, in pixels
+        self.confidence_stats = RunningStats()
+        self._track_boxes = np.empty((0, 4), dtype=np.float32)
+        self._tracks = []  # RunningStats of each followed reference box's diagonal
+
+    @property
+    def fixed_scale(self):
+        return self.policy.pixels_per_unit is not None
+
+    def _follow(self, boxes, diagonals):
+        # Match each box to the followed box it overlaps most, greedily by IoU; unmatched boxes start new tracks
+        matched = np.full(len(boxes), -1)
+        if len(self._track_boxes) and len(boxes):
+            iou = pairwise_iou(boxes, self._track_boxes)
+            for index in np.argsort(-iou.max(axis=1)):
+                track = int(np.argmax(iou[index]))
+                if iou[index, track] >= self.match_iou:
+                    matched[index] = track
+                    iou[:, track] = -1
+        for index, track in enumerate(matched.tolist()):
+            if track < 0:
+                self._tracks.append(RunningStats())
+                self._track_boxes = np.vstack([self._track_boxes, boxes[index:index + 1]])
+                track = len(self._tracks) - 1
+            self._tracks[track].add(float(diagonals[index]))
+            self._track_boxes[track] = boxes[index]
+
+    def add(self, detections):
+        """Add one frame's detections; returns whether the estimate has converged."""
+        self.frames += 1
+        if self.fixed_scale:
+            return self.converged
+        mask = self.policy.reference_mask(detections)
+        if mask.any():
+            diagonals = detections.box_differences()[mask, 2]
+            weights = np.maximum(detections.conf[mask], 1e-3)
+            self.diagonal.add(float(np.average(diagonals, weights=weights)), float(weights.sum()))
+            for value in detections.conf[mask].tolist():
+                self.confidence_stats.add(value)
+            self._follow(detections.xyxy[mask], diagonals)
+        return self.converged
+
+    @property
+    def pixels_per_unit(self):
+        if self.fixed_scale:
+            return self.policy.pixels_per_unit
+        if not self.diagonal.count:
+            return 0.0
+        return self.diagonal.mean / self.policy.real_size
+
+    @property
+    def relative_error(self):
+        """Standard error of the scale relative to it; NaN until two frames had reference objects."""
+        if self.fixed_scale:
+            return 0.0
+        if self.diagonal.count < 2 or self.diagonal.mean == 0:
+            return math.nan
+        return math.hypot(self.diagonal.standard_error / self.diagonal.mean, self.real_size_uncertainty)
+
+    @property
+    def jitter(self):
+        """Median frame-to-frame spread of a reference box's diagonal, in pixels."""
+        spreads = [track.std for track in self._tracks if track.count > 1]
+        return float(np.median(spreads)) if spreads else math.nan
+
+    def _quantile(self):
+        dof = self.diagonal.effective_count - 1 if not self.fixed_scale else math.inf
+        return t_quantile(0.5 + self.confidence / 2, max(dof, 1.0))
+
+    @property
+    def interval_width(self):
+        """Half-width of the scale's confidence interval relative to the scale."""
+        return self._quantile() * self.relative_error
+
+    @property
+    def converged(self):
+        if self.frames >= self.max_frames or self.fixed_scale:
+            return True
+        if self.diagonal.count < max(self.min_frames, 2) or self.diagonal.effective_count < self.min_effective_count:
+            return False
+        # The assumed real size does not average out, so only the measured part has to reach the precision
+        measured = self._quantile() * self.diagonal.standard_error / self.diagonal.mean
+        return measured <= self.precision
+
+    def distance(self, pixel_distance):
+        """(distance, half-width of its confidence interval) in the policy's units, or None without a scale."""
+        if self.pixels_per_unit == 0:
+            return None
+        value = pixel_distance / self.pixels_per_unit
+        relative = self.relative_error  # NaN, and so no interval, until two frames had reference objects
+        if pixel_distance > 0:
+            relative = math.hypot(relative, math.sqrt(2) * self.click_error / pixel_distance)
+        return value, self._quantile() * relative * value
+
+    def line_text(self, point_a, point_b, prefix="Line length"):
+        pixel_distance = calculate_distance(*point_a, *point_b)
+        distance = self.distance(pixel_distance)
+        if distance is None:
+            return f"{prefix}: {pixel_distance:.2f} pixels (no reference object for scale)"
+        value, half_width = distance
+        if math.isnan(half_width):
+            return f"{prefix}: {pixel_distance:.2f} pixels, {value:.2f} {self.policy.unit} (one frame, no interval yet)"
+        return (f"{prefix}: {pixel_distance:.2f} pixels, {value:.2f} ± {half_width:.2f} {self.policy.unit} "
+                f"({self.confidence:.0%}, {self.frames} frames)")
+
+    def summary_text(self):
+        if self.fixed_scale:
+            return f"Fixed scale: {self.pixels_per_unit:.1f} pixels per {self.policy.unit}"
+        if not self.diagonal.count:
+            return f"No reference objects in {self.frames} frames."
+        text = (f"Scale: {self.pixels_per_unit:.2f} pixels per {self.policy.unit} "
+                f"from {self.diagonal.count} of {self.frames} frames")
+        if self.diagonal.count > 1:
+            text += f", ± {self.interval_width:.1%} ({self.confidence:.0%})"
+        if not math.isnan(self.jitter):
+            text += f"\nBox jitter: {self.jitter:.1f} pixels, mean confidence {self.confidence_stats.mean:.2f}"
+        return text + ("" if self.converged else " (not converged)")
+
+
+def measure_until_precise(capture, core, estimator):
+    """
+    Capture and detect frames with `capture()` and `core` until `estimator` has
+    converged. Returns the last frame and its detections.
+    """
+    while True:
+        frame = capture()
+        detections = core.detect(frame)
+        if estimator.add(detections):
+            return frame, detections
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Scale estimate with a confidence interval over a sequence of pictures")
+    parser.add_argument("source", help="Image folder, glob or video of one scene")
+    parser.add_argument("--model", default="yolov8n.pt", help="YOLO model to run")
+    parser.add_argument("--mode", default="Real Car", help="Reference mode, as in the GUI dropdown")
+    parser.add_argument("--precision", type=float, default=0.01, help="Relative interval half-width to stop at")
+    parser.add_argument("--max-frames", type=int, default=30, help="Stop after this many frames regardless")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    from ultralytics import YOLO
+
+    from camera_source import open_source
+    from detection_core import DetectionCore, REFERENCE_POLICIES, UltralyticsBackend
+
+    policy = REFERENCE_POLICIES[args.mode]
+    core = DetectionCore(UltralyticsBackend(YOLO(args.model), verbose=False), policy)
+    camera = open_source(args.source)
+    estimator = ScaleEstimator(policy, precision=args.precision, max_frames=args.max_frames)
+    try:
+        measure_until_precise(camera.capture_array, core, estimator)
+    except EOFError:
+        pass  # Ran out of pictures before converging
+    finally:
+        camera.stop()
+    print(estimator.summary_text())
@@ -0,0 +1,123 @@
+import collections
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from detection_core import Detections
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "aerial_measurement", "detections")
+
+
+# Content hash of a frame; the same picture re-imported or re-captured gets the same key
+def image_key(frame):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str((frame.shape, frame.dtype.str)).encode())
+    digest.update(np.ascontiguousarray(frame).data)
+    return digest.hexdigest()
+
+
+class DetectionCache:
+    """
+    Detections keyed by image content and model ID, in an in-memory LRU backed by
+    .npz files on disk, so re-analysing post-flight imagery skips inference. Pass
+    `directory=None` for a memory-only cache. The disk keeps the `max_disk_entries`
+    most recently used files (a few KB each); older ones are deleted.
+    """
+
+    def __init__(self, max_entries=64, directory=DEFAULT_CACHE_DIR, max_disk_entries=2000):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(frame, model_id):
+        model_digest = hashlib.blake2b(model_id.encode(), digest_size=8).hexdigest()
+        return f"{image_key(frame)}-{model_digest}"
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def _remember(self, key, detections):
+        self._memory[key] = detections
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _load(self, key):
+        if self.directory is None or not os.path.exists(self._path(key)):
+            return None
+        try:
+            with np.load(self._path(key)) as data:
+                names = {int(k): v for k, v in json.loads(str(data["names"])).items()}
+                detections = Detections(data["xyxy"], data["conf"], data["cls"], names)
+            os.utime(self._path(key))  # Recently used, so pruned last
+            return detections
+        except (OSError, ValueError, KeyError):
+            return None  # Half-written or old format, treat as a miss
+
+    def _save(self, key, detections):
+        if self.directory is None:
+            return
+        path = self._path(key)
+        temporary_path = f"{path}.{os.getpid()}.tmp.npz"
+        names = json.dumps({str(k): v for k, v in detections.names.items()})
+        np.savez(temporary_path, xyxy=detections.xyxy, conf=detections.conf, cls=detections.cls, names=names)
+        os.replace(temporary_path, path)  # Readers never see a partial file
+        self._prune()
+
+    # Delete the least recently used files past max_disk_entries
+    def _prune(self):
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                 if name.endswith(".npz") and ".tmp." not in name]
+        if len(paths) <= self.max_disk_entries:
+            return
+        times = {}
+        for path in paths:
+            try:
+                times[path] = os.path.getmtime(path)
+            except OSError:  # Pruned by another process
+                pass
+        for path in sorted(times, key=times.get)[:len(times) - self.max_disk_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get(self, key):
+        with self._lock:
+            detections = self._memory.get(key)
+            if detections is None:
+                detections = self._load(key)
+                if detections is not None:
+                    self._remember(key, detections)
+            else:
+                self._memory.move_to_end(key)
+            if detections is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return detections
+
+    def put(self, key, detections):
+        # Keep only the arrays; the backend's own result object would pin the full frame
+        detections = Detections(detections.xyxy, detections.conf, detections.cls, detections.names)
+        with self._lock:
+            self._remember(key, detections)
+            self._save(key, detections)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self.directory is not None:
+                for name in os.listdir(self.directory):
+                    if name.endswith(".npz"):
+                        os.remove(os.path.join(self.directory, name))
@@ -0,0 +1,205 @@
+"""
+Thread counts and CPU affinity for the pipeline stages. By default torch, ncnn
+and OpenCV each size their thread pools to every core, so inference, the Tk
+display path and capture end up fighting over the Pi 5's four cores. A
+RuntimeConfig gives inference a fixed number of threads on its own cores,
+keeps OpenCV to one thread, and puts UI and capture on the remaining core.
+
+    python runtime_config.py yolov8n.pt yolov8s.pt --frames 20     # sweep, saves runtime_config.json
+
+The sweep times every split per model and saves the best one; scripts load it
+with `load_config(model_name)` and fall back to the default split otherwise.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from memory_budget import MODEL_NAMES
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "runtime_config.json")
+
+
+def available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class RuntimeConfig:
+    """
+    Intra-op threads for inference (torch and ncnn), threads for OpenCV, and the
+    cores each stage ("inference", "ui", "capture") may run on.
+    """
+
+    def __init__(self, inference_threads, opencv_threads=1, cores=None):
+        self.inference_threads = inference_threads
+        self.opencv_threads = opencv_threads
+        self.cores = cores or {}
+
+    @classmethod
+    def default(cls, cores=None):
+        # Inference on every core but the first, which is left to the UI and capture
+        cores = cores or available_cores()
+        inference_cores = cores[1:] or cores
+        return cls(len(inference_cores), 1, {"inference": inference_cores, "ui": cores[:1], "capture": cores[:1]})
+
+    def to_dict(self):
+        return {"inference_threads": self.inference_threads, "opencv_threads": self.opencv_threads, "cores": self.cores}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["inference_threads"], data.get("opencv_threads", 1), data.get("cores"))
+
+    def __repr__(self):
+        cores = ", ".join(f"{stage} on {values}" for stage, values in self.cores.items())
+        return f"{self.inference_threads} inference threads, {self.opencv_threads} OpenCV threads, {cores}"
+
+
+# Restrict the calling thread, and every thread it starts afterwards, to `cores`
+def pin(cores):
+    if not cores or not hasattr(os, "sched_setaffinity"):
+        return None
+    usable = set(cores) & set(available_cores()) or set(available_cores())
+    os.sched_setaffinity(0, usable)
+    return usable
+
+
+def set_torch_threads(threads):
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(threads)
+
+
+# ncnn takes its thread count from the loaded net's options, so this needs a model that has run once
+def set_ncnn_threads(model, threads):
+    backend = getattr(getattr(model, "predictor", None), "model", None)
+    net = getattr(backend, "net", None)
+    if net is not None and hasattr(net, "opt"):
+        net.opt.num_threads = threads
+        return True
+    return False
+
+
+def apply_config(config, model=None, stage="inference"):
+    """
+    Set the thread counts and pin the calling thread to the cores of `stage`.
+    Pin before a thread's first inference: thread pools keep the cores they started on.
+    """
+    cv2.setNumThreads(config.opencv_threads)
+    set_torch_threads(config.inference_threads)
+    if model is not None:
+        set_ncnn_threads(model, config.inference_threads)
+    return pin(config.cores.get(stage))
+
+
+def load_config(model_name, path=DEFAULT_CONFIG_PATH):
+    if os.path.exists(path):
+        with open(path) as f:
+            configs = json.load(f)
+        if model_name in configs:
+            return RuntimeConfig.from_dict(configs[model_name])
+    return RuntimeConfig.default()
+
+
+def save_config(model_name, config, path=DEFAULT_CONFIG_PATH):
+    configs = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            configs = json.load(f)
+    configs[model_name] = config.to_dict()
+    with open(path, "w") as f:
+        json.dump(configs, f, indent=2)
+
+
+def candidate_configs(cores=None):
+    """Every split of the cores into a UI/capture core set and an inference set, at each thread count."""
+    cores = cores or available_cores()
+    candidates = []
+    for threads in range(1, len(cores) + 1):
+        inference_cores = cores[-threads:]
+        ui_cores = cores[:-threads] or cores[:1]
+        for opencv_threads in (1, 2):
+            cores_by_stage = {"inference": inference_cores, "ui": ui_cores, "capture": ui_cores}
+            candidates.append(RuntimeConfig(threads, opencv_threads, cores_by_stage))
+    return candidates
+
+
+def _display_load(config, stop, frame, frame_times, fps=30):
+    # What the GUIs do per shown frame: resize to half size and convert to RGB
+    from warmup import DisplayBuffers
+
+    pin(config.cores.get("ui"))
+    buffers = DisplayBuffers(frame.shape)
+    while not stop.is_set():
+        start_time = time.perf_counter()
+        buffers.to_display(frame)
+        frame_times.append(time.perf_counter() - start_time)
+        time.sleep(max(0.0, 1 / fps - frame_times[-1]))
+
+
+def _inference_load(model, config, frame, inference_times):
+    # A fresh thread per configuration, pinned before its first inference, so the
+    # thread pools torch and ncnn start from it get this configuration's cores
+    from warmup import warm_up
+
+    apply_config(config, model)
+    warm_up(model, frame.shape)
+    for index in range(len(inference_times)):
+        start_time = time.perf_counter()
+        model(frame, verbose=False)
+        inference_times[index] = time.perf_counter() - start_time
+
+
+def measure_config(model, config, frame, frames=20):
+    """Mean inference time with the display path running alongside, and the display's p95 frame time."""
+    stop = threading.Event()
+    frame_times = []
+    inference_times = np.empty(frames)
+    display = threading.Thread(target=_display_load, args=(config, stop, frame, frame_times), daemon=True)
+    inference = threading.Thread(target=_inference_load, args=(model, config, frame, inference_times), daemon=True)
+    display.start()
+    inference.start()
+    inference.join()
+    stop.set()
+    display.join()
+    return float(inference_times.mean()), float(np.percentile(frame_times, 95)) if frame_times else 0.0
+
+
+def sweep(model_name, frames=20, ui_budget=1 / 30, frame_shape=(1280, 1280, 3)):
+    """Try every candidate split for `model_name` and return the fastest that keeps the display within `ui_budget`."""
+    from ultralytics import YOLO
+
+    model = YOLO(model_name)  # Warmed up by each configuration's own inference thread, after pinning
+    frame = np.random.default_rng(0).integers(0, 256, frame_shape, dtype=np.uint8)
+    results = []
+    for config in candidate_configs():
+        inference_time, display_p95 = measure_config(model, config, frame, frames)
+        results.append((config, inference_time, display_p95))
+        print(f"  {config}: inference {inference_time * 1000:.1f} ms, display p95 {display_p95 * 1000:.1f} ms")
+    within_budget = [result for result in results if result[2] <= ui_budget] or results
+    return min(within_budget, key=lambda result: result[1])
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Find the best thread and core split per model")
+    parser.add_argument("models", nargs="*", default=MODEL_NAMES, help="Models to sweep")
+    parser.add_argument("--frames", type=int, default=20, help="Inferences per configuration")
+    parser.add_argument("--ui-budget", type=float, default=1 / 30, help="Longest acceptable display frame time (s)")
+    parser.add_argument("--output", default=DEFAULT_CONFIG_PATH, help="Where to save the best configurations")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    for model_name in args.models:
+        print(f"{model_name}:")
+        config, inference_time, display_p95 = sweep(model_name, args.frames, args.ui_budget)
+        save_config(model_name, config, args.output)
+        print(f"  best: {config} ({inference_time * 1000:.1f} ms per inference)")
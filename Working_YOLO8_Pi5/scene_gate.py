@@ -0,0 +1,95 @@
+import time
+
+import cv2
+import numpy as np
+
+
+# Small grayscale copy used to tell whether the scene moved on
+def scene_thumbnail(frame, size=(64, 64)):
+    small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY if small.shape[2] == 3 else cv2.COLOR_BGRA2GRAY)
+    return small
+
+
+# Mean absolute grey level change between two thumbnails (0-255)
+def frame_difference(thumbnail_a, thumbnail_b):
+    return float(cv2.absdiff(thumbnail_a, thumbnail_b).mean())
+
+
+# 64-bit difference hash: brighter/darker than the right-hand neighbour on a 9x8 grid
+def difference_hash(frame):
+    small = scene_thumbnail(frame, size=(9, 8)).astype(np.int16)
+    return np.packbits(small[:, 1:] > small[:, :-1])
+
+
+def hash_distance(hash_a, hash_b):
+    return int(np.unpackbits(np.bitwise_xor(hash_a, hash_b)).sum())
+
+
+class SceneGate:
+    """
+    Decides whether a frame is different enough from the last one the model ran on
+    to be worth running again. `method="diff"` compares 64x64 grey thumbnails
+    (threshold in mean grey levels), `method="hash"` compares difference hashes
+    (threshold in bits out of 64). Results are never reused for more than
+    `max_stale_frames` frames or `max_stale_seconds` seconds.
+    """
+
+    def __init__(self, threshold=6.0, method="diff", max_stale_frames=30, max_stale_seconds=None):
+        if method not in ("diff", "hash"):
+            raise ValueError(f"Unknown scene change method {method!r}")
+        self.threshold = threshold
+        self.method = method
+        self.max_stale_frames = max_stale_frames
+        self.max_stale_seconds = max_stale_seconds
+        self.frames = 0
+        self.inferences = 0
+        self.stale_frames = 0  # Frames the current result has been reused for
+        self.last_change = 0.0
+        self._reference = None
+        self._reference_time = None
+        self._result = None
+
+    @property
+    def skip_rate(self):
+        return 1 - self.inferences / self.frames if self.frames else 0.0
+
+    def _signature(self, frame):
+        return scene_thumbnail(frame) if self.method == "diff" else difference_hash(frame)
+
+    def _distance(self, signature):
+        if self.method == "diff":
+            return frame_difference(signature, self._reference)
+        return hash_distance(signature, self._reference)
+
+    def _too_stale(self, now):
+        if self.max_stale_frames is not None and self.stale_frames >= self.max_stale_frames:
+            return True
+        return self.max_stale_seconds is not None and now - self._reference_time >= self.max_stale_seconds
+
+    def should_run(self, frame, now=None):
+        """Count `frame` and say whether the model has to run on it."""
+        now = time.monotonic() if now is None else now
+        self.frames += 1
+        signature = self._signature(frame)
+        if self._reference is not None and not self._too_stale(now):
+            self.last_change = self._distance(signature)
+            if self.last_change < self.threshold:
+                self.stale_frames += 1
+                return False
+        self._reference = signature
+        self._reference_time = now
+        self.stale_frames = 0
+        self.inferences += 1
+        return True
+
+    def run(self, frame, infer, now=None):
+        """Return `infer(frame)`, or the previous result when the scene has not changed."""
+        if self.should_run(frame, now) or self._result is None:
+            self._result = infer(frame)
+        return self._result
+
+    def reset(self):
+        self._reference = None
+        self._result = None
@@ -0,0 +1,251 @@
+"""
+Uniform grid index over detection boxes for range, nearest-object and overlap
+queries. Boxes are added incrementally as frames are processed, and a query only
+looks at the boxes in the grid cells it touches instead of every stored result.
+Coordinates are whatever the boxes were inserted in: frame pixels, or ground
+units after dividing by the measurement scale (see `ground_boxes`). Pictures are
+not georeferenced, so ground coordinates only mean something within one picture.
+
+    python spatial_index.py measurements --class car --near 500 500 --radius 20
+    python spatial_index.py measurements --image 3 --ground --near 10 10 --radius 5
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+
+from detection_store import DetectionStore, KIND_BOX
+
+
+# Boxes in real units (feet, meters...) from pixel boxes and their pixels-per-unit scale
+def ground_boxes(xyxy, pixels_per_unit, origin=(0.0, 0.0)):
+    scale = np.asarray(pixels_per_unit, dtype=np.float64).reshape(-1, 1)
+    return np.asarray(xyxy, dtype=np.float64) / scale + np.tile(origin, 2)
+
+
+# Distance from (x, y) to every box, 0 when the point is inside it
+def point_box_distance(boxes, x, y):
+    dx = np.maximum(np.maximum(boxes[:, 0] - x, x - boxes[:, 2]), 0)
+    dy = np.maximum(np.maximum(boxes[:, 1] - y, y - boxes[:, 3]), 0)
+    return np.hypot(dx, dy)
+
+
+# Even-odd rule for many points against one polygon
+def points_in_polygon(points, polygon):
+    x, y = points[:, 0:1], points[:, 1:2]
+    x1, y1 = polygon[:, 0], polygon[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+    crosses = (y1 > y) != (y2 > y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    return np.logical_and(crosses, x < x_cross).sum(axis=1) % 2 == 1
+
+
+def _segments_intersect(a1, a2, b1, b2):
+    # Every segment in a against every segment in b, by the signs of the cross products
+    def cross(o, p, q):
+        return (p[..., 0] - o[..., 0]) * (q[..., 1] - o[..., 1]) - (p[..., 1] - o[..., 1]) * (q[..., 0] - o[..., 0])
+
+    a1, a2 = a1[:, None], a2[:, None]
+    b1, b2 = b1[None], b2[None]
+    d1, d2 = cross(b1, b2, a1), cross(b1, b2, a2)
+    d3, d4 = cross(a1, a2, b1), cross(a1, a2, b2)
+    return ((d1 * d2) < 0) & ((d3 * d4) < 0)
+
+
+class SpatialIndex:
+    """
+    Boxes hashed into square cells of `cell_size`. Each box is stored once and
+    referenced from every cell it covers; `ids` are whatever the caller uses to
+    find the box again (a detection number, a DetectionStore row...).
+    """
+
+    def __init__(self, cell_size=64.0):
+        self.cell_size = float(cell_size)
+        self._boxes = np.empty((256, 4), dtype=np.float64)
+        self._ids = np.empty(256, dtype=np.int64)
+        self._count = 0
+        self._cells = {}
+        self.bounds = None  # x0, y0, x1, y1 over every box
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def boxes(self):
+        return self._boxes[:self._count]
+
+    @property
+    def ids(self):
+        return self._ids[:self._count]
+
+    def _cell_range(self, x0, y0, x1, y1):
+        size = self.cell_size
+        return (math.floor(x0 / size), math.floor(y0 / size), math.floor(x1 / size), math.floor(y1 / size))
+
+    def insert(self, boxes, ids=None):
+        """Add (N, 4) xyxy boxes. `ids` default to their insertion order."""
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        boxes = np.column_stack([np.minimum(boxes[:, 0], boxes[:, 2]), np.minimum(boxes[:, 1], boxes[:, 3]),
+                                 np.maximum(boxes[:, 0], boxes[:, 2]), np.maximum(boxes[:, 1], boxes[:, 3])])
+        count = len(boxes)
+        if not count:
+            return
+        ids = np.arange(self._count, self._count + count) if ids is None else np.asarray(ids, dtype=np.int64)
+        if self._count + count > len(self._boxes):
+            capacity = max(2 * len(self._boxes), self._count + count)
+            self._boxes = np.resize(self._boxes, (capacity, 4))
+            self._ids = np.resize(self._ids, capacity)
+        start = self._count
+        self._boxes[start:start + count] = boxes
+        self._ids[start:start + count] = ids
+        self._count += count
+
+        cells = np.floor(boxes / self.cell_size).astype(np.int64)
+        for position, (cx0, cy0, cx1, cy1) in enumerate(cells.tolist(), start):
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    self._cells.setdefault((cx, cy), []).append(position)
+
+        low, high = boxes[:, :2].min(axis=0), boxes[:, 2:].max(axis=0)
+        if self.bounds is not None:
+            low = np.minimum(low, self.bounds[:2])
+            high = np.maximum(high, self.bounds[2:])
+        self.bounds = np.concatenate([low, high])
+
+    def _candidates(self, x0, y0, x1, y1):
+        if self.bounds is None:
+            return np.empty(0, dtype=np.int64)
+        # Never walk cells outside the indexed area
+        x0, y0 = max(x0, self.bounds[0]), max(y0, self.bounds[1])
+        x1, y1 = min(x1, self.bounds[2]), min(y1, self.bounds[3])
+        if x0 > x1 or y0 > y1:
+            return np.empty(0, dtype=np.int64)
+        cx0, cy0, cx1, cy1 = self._cell_range(x0, y0, x1, y1)
+        positions = []
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                positions.extend(self._cells.get((cx, cy), ()))
+        return np.unique(np.array(positions, dtype=np.int64))
+
+    def intersecting(self, x0, y0, x1, y1):
+        """IDs of boxes that overlap the rectangle."""
+        positions = self._candidates(x0, y0, x1, y1)
+        boxes = self._boxes[positions]
+        hit = (boxes[:, 0] <= x1) & (boxes[:, 2] >= x0) & (boxes[:, 1] <= y1) & (boxes[:, 3] >= y0)
+        return self._ids[positions[hit]]
+
+    def within(self, x, y, radius):
+        """IDs and distances of boxes within `radius` of (x, y), nearest first."""
+        positions = self._candidates(x - radius, y - radius, x + radius, y + radius)
+        distances = point_box_distance(self._boxes[positions], x, y)
+        keep = distances <= radius
+        order = np.argsort(distances[keep], kind="stable")
+        return self._ids[positions[keep][order]], distances[keep][order]
+
+    def nearest(self, x, y, k=1):
+        """IDs and distances of the `k` boxes closest to (x, y)."""
+        k = min(k, self._count)
+        if not k:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        # Grow the search square until it holds k boxes that are closer than its edge
+        radius = self.cell_size
+        reach = max(abs(x - self.bounds[0]), abs(x - self.bounds[2]), abs(y - self.bounds[1]), abs(y - self.bounds[3]))
+        while True:
+            positions = self._candidates(x - radius, y - radius, x + radius, y + radius)
+            if len(positions) >= k:
+                distances = point_box_distance(self._boxes[positions], x, y)
+                closest = np.argpartition(distances, k - 1)[:k]
+                if distances[closest].max() <= radius or radius >= reach:
+                    closest = closest[np.argsort(distances[closest], kind="stable")]
+                    return self._ids[positions[closest]], distances[closest]
+            radius *= 2
+
+    def overlapping(self, polygon):
+        """IDs of boxes that overlap a polygon given as (N, 2) vertices."""
+        polygon = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+        low, high = polygon.min(axis=0), polygon.max(axis=0)
+        positions = self._candidates(low[0], low[1], high[0], high[1])
+        boxes = self._boxes[positions]
+        if not len(boxes):
+            return self._ids[positions]
+        corners = np.stack([boxes[:, [0, 1]], boxes[:, [2, 1]], boxes[:, [2, 3]], boxes[:, [0, 3]]], axis=1)
+        # A box overlaps when one of its corners is inside the polygon...
+        hit = points_in_polygon(corners.reshape(-1, 2), polygon).reshape(-1, 4).any(axis=1)
+        # ...a polygon vertex is inside the box...
+        hit |= ((polygon[None, :, 0] >= boxes[:, 0:1]) & (polygon[None, :, 0] <= boxes[:, 2:3])
+                & (polygon[None, :, 1] >= boxes[:, 1:2]) & (polygon[None, :, 1] <= boxes[:, 3:4])).any(axis=1)
+        # ...or their edges cross
+        box_edges = _segments_intersect(corners.reshape(-1, 2), np.roll(corners, -1, axis=1).reshape(-1, 2),
+                                        polygon, np.roll(polygon, -1, axis=0))
+        hit |= box_edges.any(axis=1).reshape(-1, 4).any(axis=1)
+        return self._ids[positions[hit]]
+
+    @classmethod
+    def from_detections(cls, detections, cell_size=64.0):
+        """Index one frame's boxes by detection number, in frame pixels (before any lens correction)."""
+        index = cls(cell_size)
+        index.insert(detections.frame_xyxy)
+        return index
+
+    @classmethod
+    def from_store(cls, store, class_name=None, image=None, ground=False, cell_size=None):
+        """
+        Index box rows of a DetectionStore by row number, optionally only one class
+        or image. With `ground` boxes are in real units and rows without a scale are
+        left out; it needs an `image`, as every picture's ground units start from its
+        own corner and the store has no position to line pictures up with.
+        """
+        if ground and image is None:
+            raise ValueError("Ground coordinates are per picture, index one image at a time")
+        keep = store.column("kind") == KIND_BOX
+        if class_name is not None:
+            keep &= store.column("cls") == store.class_id(class_name)
+        if image is not None:
+            keep &= store.column("image") == np.uint64(image)
+        if ground:
+            keep &= store.column("scale") > 0
+        rows = np.flatnonzero(keep)
+        boxes = store.column("xyxy")[rows]
+        if ground:
+            boxes = ground_boxes(boxes, store.column("scale")[rows])
+        if cell_size is None:
+            # About one box per cell on average
+            sizes = boxes[:, 2:] - boxes[:, :2] if len(boxes) else np.ones((1, 2))
+            cell_size = max(float(np.median(sizes)), 1e-6)
+        index = cls(cell_size)
+        index.insert(boxes, rows)
+        return index
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Query stored detections by location")
+    parser.add_argument("directory", nargs="?", default="measurements", help="Detection store directory")
+    parser.add_argument("--class", dest="class_name", default=None, help="Only index this class")
+    parser.add_argument("--image", type=int, default=None, help="Only index this image")
+    parser.add_argument("--ground", action="store_true", help="Query in real units instead of pixels (needs --image)")
+    parser.add_argument("--near", type=float, nargs=2, metavar=("X", "Y"), required=True, help="Query point")
+    parser.add_argument("--radius", type=float, default=None, help="Return every box within this distance")
+    parser.add_argument("-k", type=int, default=5, help="Number of nearest boxes when no radius is given")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    store = DetectionStore(args.directory)
+    start_time = time.perf_counter()
+    index = SpatialIndex.from_store(store, args.class_name, args.image, ground=args.ground)
+    build_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    x, y = args.near
+    if args.radius is None:
+        rows, distances = index.nearest(x, y, args.k)
+    else:
+        rows, distances = index.within(x, y, args.radius)
+    query_time = time.perf_counter() - start_time
+    print(f"Indexed {len(index)} boxes in {build_time:.2f} s, query took {query_time * 1000:.2f} ms")
+    class_names = store.meta["classes"]
+    for row, distance in zip(rows.tolist(), distances.tolist()):
+        box = ", ".join(f"{value:.1f}" for value in store.column("xyxy")[row].tolist())
+        print(f"  row {row}: {class_names[store.column('cls')[row]]} at [{box}], distance {distance:.2f}")
@@ -0,0 +1,243 @@
+"""
+Run detection and measurement over a video file or stream (rtsp://, http://)
+without loading it into memory. A decoder thread feeds a small bounded queue and
+only hands over every Nth frame, or only frames where the scene has changed, so
+a long flight is processed in a fraction of its running time.
+
+    python video_ingest.py flight.mp4 --model yolov8n.pt --every 15 --scene-threshold 8 --output flight.jsonl
+
+Each analysed frame is written as one JSON line; a per-class timeline summary
+is printed (and appended to the output) at the end.
+"""
+import argparse
+import json
+import queue
+import threading
+import time
+
+import cv2
+
+from detection_core import DetectionCore, UltralyticsBackend, REFERENCE_POLICIES
+from detection_store import DetectionStore, frame_id
+from scene_gate import SceneGate
+
+_END = object()
+
+
+def open_video(source):
+    # Ask for hardware decoding where this OpenCV build supports it, plain decode otherwise
+    if hasattr(cv2, "VIDEO_ACCELERATION_ANY"):
+        capture = cv2.VideoCapture(source, cv2.CAP_ANY, [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
+        if capture.isOpened():
+            return capture
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open {source}")
+    return capture
+
+
+class VideoDecoder:
+    """
+    Decodes `source` on a background thread. Frames between every `every`th are
+    only grabbed (never converted or copied), and with a `scene_threshold` a
+    kept frame is also dropped when it barely differs from the last one handed
+    over, unless `max_gap` frames have passed since then.
+    """
+
+    def __init__(self, source, every=1, scene_threshold=None, max_gap=None, queue_size=4):
+        self.source = source
+        self.every = max(1, every)
+        self.scene_threshold = scene_threshold
+        self.max_gap = max_gap
+        self.gate = None
+        if scene_threshold is not None:
+            # The gate only sees every `every`th frame, so convert the gap to those
+            max_stale = None if max_gap is None else max(1, -(-max_gap // self.every))
+            self.gate = SceneGate(scene_threshold, max_stale_frames=max_stale)
+        self.capture = open_video(source)
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 30.0
+        self.frame_count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT)) or None
+        self.frames_decoded = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="video-decoder", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        # Unblock the decoder if it is waiting on a full queue
+        while self._thread.is_alive():
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._thread.join(timeout=0.05)
+        self.capture.release()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        index = -1
+        try:
+            while not self._stop.is_set():
+                if not self.capture.grab():
+                    break
+                index += 1
+                self.frames_decoded += 1
+                if index % self.every:
+                    continue
+                ok, frame = self.capture.retrieve()
+                if not ok:
+                    break
+                if self.gate is not None and not self.gate.should_run(frame, now=index / self.fps):
+                    continue
+                if not self._put((index, index / self.fps, frame)):
+                    break
+        finally:
+            self._put(_END)
+
+    @property
+    def frames_skipped_by_scene(self):
+        return 0 if self.gate is None else self.gate.frames - self.gate.inferences
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is _END:
+                return
+            yield item
+
+
+class Timeline:
+    """Per-class presence over the video: frames seen, peak count and contiguous segments."""
+
+    def __init__(self, gap=2.0):
+        self.gap = gap  # Seconds without a class before its segment is closed
+        self.classes = {}
+
+    def add(self, timestamp, class_names):
+        counts = {}
+        for name in class_names:
+            counts[name] = counts.get(name, 0) + 1
+        for name, count in counts.items():
+            entry = self.classes.setdefault(name, {"frames": 0, "max_count": 0, "segments": []})
+            entry["frames"] += 1
+            entry["max_count"] = max(entry["max_count"], count)
+            segments = entry["segments"]
+            if segments and timestamp - segments[-1][1] <= self.gap:
+                segments[-1][1] = timestamp
+            else:
+                segments.append([timestamp, timestamp])
+
+    def summary(self):
+        return {
+            name: {
+                "frames": entry["frames"],
+                "max_count": entry["max_count"],
+                "first_seen": entry["segments"][0][0],
+                "last_seen": entry["segments"][-1][1],
+                "segments": entry["segments"],
+            }
+            for name, entry in sorted(self.classes.items())
+        }
+
+
+def frame_result(index, timestamp, measurement):
+    detections = measurement.detections
+    return {
+        "frame": index,
+        "time": round(timestamp, 3),
+        "classes": detections.class_names,
+        "conf": [round(conf, 3) for conf in detections.conf.tolist()],
+        "xyxy": [[round(value, 1) for value in box] for box in detections.xyxy.tolist()],
+        "pixels_per_unit": measurement.pixels_per_unit,
+        "unit": measurement.unit,
+    }
+
+
+def ingest(decoder, core, on_result=None, store=None):
+    """
+    Run `core` on every frame the decoder hands over and return the timeline
+    summary. With a `store` (see detection_store.py) every analysed frame is appended to it.
+    """
+    timeline = Timeline()
+    analysed = 0
+    start_time = time.perf_counter()
+    decoder.start()
+    try:
+        for index, timestamp, frame in decoder:
+            measurement = core.measure(core.detect(frame))
+            timeline.add(timestamp, measurement.detections.class_names)
+            if store is not None:
+                store.append_measurement(measurement, frame_id(frame))
+            analysed += 1
+            if on_result is not None:
+                on_result(frame_result(index, timestamp, measurement))
+    finally:
+        decoder.stop()
+    elapsed = time.perf_counter() - start_time
+    return {
+        "source": decoder.source,
+        "frames_decoded": decoder.frames_decoded,
+        "frames_analysed": analysed,
+        "frames_skipped_by_scene": decoder.frames_skipped_by_scene,
+        "video_seconds": decoder.frames_decoded / decoder.fps,
+        "processing_seconds": elapsed,
+        "timeline": timeline.summary(),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Detect and measure objects in a video file or stream")
+    parser.add_argument("source", help="Video file or stream URL")
+    parser.add_argument("--model", default="yolov8n.pt", help="YOLO model to run")
+    parser.add_argument("--mode", default="Real Car", choices=list(REFERENCE_POLICIES), help="Scale reference")
+    parser.add_argument("--every", type=int, default=1, help="Only analyse every Nth frame")
+    parser.add_argument("--scene-threshold", type=float, default=None,
+                        help="Skip frames whose mean grey level change from the last analysed frame is below this")
+    parser.add_argument("--max-gap", type=int, default=None,
+                        help="Analyse a frame at least this often (in frames) even without a scene change")
+    parser.add_argument("--output", default=None, help="Write per-frame results as JSON lines here")
+    parser.add_argument("--store", default=None, help="Also append detections to the detection store in this folder")
+    parser.add_argument("--site", default="default", help="Site name recorded in the detection store")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    from ultralytics import YOLO
+
+    core = DetectionCore(UltralyticsBackend(YOLO(args.model), verbose=False), REFERENCE_POLICIES[args.mode])
+    decoder = VideoDecoder(args.source, args.every, args.scene_threshold, args.max_gap)
+    output = open(args.output, "w") if args.output else None
+    store = DetectionStore(args.store, site=args.site) if args.store else None
+
+    def write_result(result):
+        if output is not None:
+            output.write(json.dumps(result) + "\n")
+        else:
+            print(f"{result['time']:8.2f}s  {', '.join(result['classes']) or '-'}")
+
+    try:
+        summary = ingest(decoder, core, write_result, store)
+        if output is not None:
+            output.write(json.dumps({"summary": summary}) + "\n")
+    finally:
+        if output is not None:
+            output.close()
+
+    print(f"Analysed {summary['frames_analysed']} of {summary['frames_decoded']} frames "
+          f"({summary['video_seconds']:.1f} s of video) in {summary['processing_seconds']:.1f} s")
+    for name, entry in summary["timeline"].items():
+        print(f"  {name}: {entry['frames']} frames, up to {entry['max_count']} at once, "
+              f"{entry['first_seen']:.1f}-{entry['last_seen']:.1f} s in {len(entry['segments'])} segments")
@@ -0,0 +1,166 @@
+"""
+Video recording that never holds up the detection loop. Frames are copied into
+a fixed set of preallocated buffers and encoded by a background thread; when
+every buffer is waiting to be encoded the new frame is dropped instead of
+blocking, so memory stays at `buffers` + 1 frames however slow the encoder is.
+
+    python video_writer.py flight.mp4 --rate 30 --frames 300    # encoder throughput and drops on synthetic frames
+    python video_writer.py flight.mp4 --rate 2 --fps 10         # frames repeated to play back in real time
+"""
+import argparse
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class VideoWriter:
+    """
+    Background cv2.VideoWriter. `write(frame)` returns False when the frame was
+    dropped. The video's size is taken from the first frame; later frames of
+    another size are resized to it.
+
+    Frames arrive at whatever rate the caller manages (1-2 FPS for yolov8x on a
+    Pi), so each one is given its capture time and the previous frame is repeated
+    until the video, at a fixed `fps`, has caught up with it, while frames coming
+    faster than `fps` are thinned out: recordings play back at the speed they
+    happened. If the encoder fails (codec, path, full disk) the recording stops,
+    `error` is set and later writes are ignored; nothing raises into the caller's
+    loop.
+    """
+
+    def __init__(self, path, fps=10.0, fourcc="mp4v", buffers=8):
+        self.path = path
+        self.fps = fps
+        self.fourcc = fourcc
+        self.buffers = buffers
+        self.written = 0  # Frames given to write() that made it into the video
+        self.encoded = 0  # Video frames, repeats included
+        self.dropped = 0
+        self.encode_seconds = 0.0
+        self.error = None
+        self._free = queue.Queue()
+        self._filled = queue.Queue()
+        self._shape = None
+        self._writer = None
+        self._start_time = None
+        self._thread = threading.Thread(target=self._encode, daemon=True)
+        self._thread.start()
+
+    def _allocate(self, frame_shape):
+        self._shape = frame_shape
+        # One more than can be queued: the encoder holds on to the last frame to repeat it
+        for _ in range(self.buffers + 1):
+            self._free.put(np.empty(frame_shape, dtype=np.uint8))
+
+    def write(self, frame, timestamp=None):
+        """Queue `frame`, captured at `timestamp` in seconds (now by default; any clock, the same for every frame)."""
+        if self.error is not None:
+            return False
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        if frame.ndim == 3 and frame.shape[2] == 4:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+        if self._shape is None:
+            self._allocate(frame.shape)
+        try:
+            buffer = self._free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1  # The encoder is behind
+            return False
+        if frame.shape != self._shape:
+            cv2.resize(frame, (self._shape[1], self._shape[0]), dst=buffer, interpolation=cv2.INTER_AREA)
+        else:
+            np.copyto(buffer, frame)
+        self._filled.put((buffer, timestamp))
+        return True
+
+    def _encode_frame(self, previous, buffer, timestamp):
+        if self._writer is None:
+            height, width = buffer.shape[:2]
+            self._writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, (width, height))
+            if not self._writer.isOpened():
+                raise OSError(f"Cannot open {self.path} for writing with {self.fourcc}")
+            self._start_time = timestamp
+        # Hold the previous frame until this one is due; a frame arriving before its
+        # video frame is due (callers faster than `fps`) is left out
+        due = int(round((timestamp - self._start_time) * self.fps))
+        while previous is not None and self.encoded < due:
+            self._writer.write(previous)
+            self.encoded += 1
+        if self.encoded > due:
+            return False
+        self._writer.write(buffer)
+        self.encoded += 1
+        self.written += 1
+        return True
+
+    def _encode(self):
+        previous = None
+        while True:
+            item = self._filled.get()
+            if item is None:
+                break
+            buffer, timestamp = item
+            if self.error is None:
+                start_time = time.perf_counter()
+                try:
+                    used = self._encode_frame(previous, buffer, timestamp)
+                except Exception as error:  # Stop recording, the caller finds out from `error`
+                    self.error = error
+                    used = False
+                self.encode_seconds += time.perf_counter() - start_time
+                if not used:
+                    self._free.put(buffer)
+                    continue
+            if previous is not None:
+                self._free.put(previous)
+            previous = buffer
+        if self._writer is not None:
+            self._writer.release()
+
+    @property
+    def throughput(self):
+        """Video frames the encoder manages per second of its own time."""
+        return self.encoded / self.encode_seconds if self.encode_seconds else 0.0
+
+    @property
+    def drop_rate(self):
+        total = self.written + self.dropped + self._filled.qsize()
+        return self.dropped / total if total else 0.0
+
+    def status_text(self):
+        if self.error is not None:
+            return f"Recording stopped after {self.written} frames: {self.error}"
+        return (f"REC {self.written} frames, encoder {self.throughput:.1f} FPS, "
+                f"dropped {self.dropped} ({self.drop_rate:.0%})")
+
+    def close(self):
+        """Encode what is queued, then finish the file. Check `error` for whether it worked."""
+        self._filled.put(None)
+        self._thread.join()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Time the background video writer on synthetic frames")
+    parser.add_argument("path", help="Video file to write")
+    parser.add_argument("--rate", type=float, default=30.0, help="Rate frames are offered at")
+    parser.add_argument("--fps", type=float, default=10.0, help="Frame rate of the video")
+    parser.add_argument("--frames", type=int, default=300, help="Frames to offer")
+    parser.add_argument("--size", type=int, nargs=2, default=(1280, 1280), help="Frame width and height")
+    parser.add_argument("--fourcc", default="mp4v", help="Codec")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    frame = np.random.default_rng(0).integers(0, 255, (args.size[1], args.size[0], 3), dtype=np.uint8)
+    writer = VideoWriter(args.path, args.fps, args.fourcc)
+    start_time = time.perf_counter()
+    for index in range(args.frames):
+        cv2.putText(frame, str(index), (50, 100), cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 3)
+        writer.write(frame)
+        time.sleep(max(0.0, start_time + (index + 1) / args.rate - time.perf_counter()))
+    writer.close()
+    print(f"{writer.status_text()}, {writer.encoded} video frames for {time.perf_counter() - start_time:.1f} seconds")
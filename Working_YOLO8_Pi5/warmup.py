@@ -0,0 +1,93 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+# Run a few dummy inferences so graph setup, memory allocation and lazy imports
+# happen before the first real picture instead of during it
+def warm_up(model, frame_shape=(1280, 1280, 3), imgsz=None, runs=2):
+    dummy = np.zeros(frame_shape, dtype=np.uint8)
+    kwargs = {"verbose": False}
+    if imgsz is not None:
+        kwargs["imgsz"] = imgsz
+    start_time = time.perf_counter()
+    for _ in range(runs):
+        model(dummy, **kwargs)
+    return time.perf_counter() - start_time
+
+
+def run_in_background(root, work, on_done, cores=None, on_poll=None, name="worker"):
+    """
+    Run `work()` on a background thread, pinned to `cores` when given, and call
+    `on_done(result, error)` on the Tk thread once it returns or raises. Tk is not
+    thread safe, so the main loop polls for the result (calling `on_poll()` every
+    time it is still running) instead of the worker touching any widgets.
+    """
+    result = {}
+    done = threading.Event()
+
+    def worker():
+        from runtime_config import pin
+
+        pin(cores)  # Only this thread, and the thread pools it starts
+        try:
+            result["value"] = work()
+        except Exception as exc:
+            result["error"] = exc
+        done.set()
+
+    def poll():
+        if done.is_set():
+            on_done(result.get("value"), result.get("error"))
+        else:
+            if on_poll is not None:
+                on_poll()
+            root.after(100, poll)
+
+    thread = threading.Thread(target=worker, name=name, daemon=True)
+    thread.start()
+    root.after(100, poll)
+    return thread
+
+
+def start_warmup(root, model, on_ready, frame_shape=(1280, 1280, 3), imgsz=None, runs=2, cores=None):
+    """
+    Warm up `model` on a background thread (on `cores`) and call `on_ready(seconds)`
+    on the Tk thread once it is done, with None when the warm-up failed.
+    """
+
+    def finished(seconds, error):
+        if error is not None:  # Still unlock the UI if the model cannot warm up
+            print(f"Warm-up failed: {error}")
+        on_ready(seconds)
+
+    return run_in_background(root, lambda: warm_up(model, frame_shape, imgsz, runs), finished, cores, name="model-warmup")
+
+
+class DisplayBuffers:
+    """
+    Preallocated half-size buffers for showing a full resolution frame in Tk.
+    cv2 writes the resized and colour converted image straight into them, so the
+    display path does not allocate two new images on every picture or click.
+    """
+
+    def __init__(self, frame_shape=(1280, 1280, 3), scale=2):
+        self.scale = scale
+        self._allocate(frame_shape)
+
+    def _allocate(self, frame_shape):
+        height, width = frame_shape[:2]
+        self.frame_shape = tuple(frame_shape)
+        self.size = (width // self.scale, height // self.scale)
+        # np.ones touches every page now rather than on the first real frame
+        self.resized = np.ones((self.size[1], self.size[0], 3), dtype=np.uint8)
+        self.rgb = np.ones_like(self.resized)
+
+    def to_display(self, frame, color_conversion=cv2.COLOR_BGR2RGB):
+        if frame.shape != self.frame_shape:
+            self._allocate(frame.shape)  # Imported images can have any size
+        cv2.resize(frame, self.size, dst=self.resized)
+        cv2.cvtColor(self.resized, color_conversion, dst=self.rgb)
+        return self.rgb
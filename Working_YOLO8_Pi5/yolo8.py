@@ -1,35 +1,97 @@
+import collections
+from datetime import datetime
 import cv2
-from picamera2 import Picamera2
 from ultralytics import YOLO
+from warmup import warm_up
+from frame_ring import FrameRing, start_capture_process
+from scene_gate import SceneGate
+from runtime_config import load_config, apply_config, set_ncnn_threads
+from detection_core import UltralyticsBackend
+from postprocess_pool import PostprocessPool
+from class_filter import allowed_classes
+from video_writer import VideoWriter
 
-# Set up the camera with Picam
-picam2 = Picamera2()
-picam2.preview_configuration.main.size = (1280, 1280)
-picam2.preview_configuration.main.format = "RGB888"
-picam2.preview_configuration.align()
-picam2.configure("preview")
-picam2.start()
+MODEL_NAME = "yolov8x_ncnn_model"
+# r starts and stops recording: "annotated" records the shown frames with boxes and FPS,
+# "raw" the camera frames the detection loop took, without boxes. Encoded in the background
+# and dropped when it falls behind; frames are repeated so the video plays in real time
+RECORD_MODE = "annotated"
+RECORD_FPS = 10.0
+
+# Thread counts and cores per stage (see runtime_config.py); capture gets its own core
+runtime = load_config(MODEL_NAME)
+
+# Capture with Picam in its own process so it runs on another core while the model
+# is busy; frames come through a shared memory ring instead of being pickled
+ring = FrameRing.create(slots=3, frame_shape=(1280, 1280, 3))
+capture_process, stop_capture = start_capture_process(ring, cores=runtime.cores.get("capture"))
+
+# Boxes are drawn and pictures saved by worker processes, so this loop goes straight
+# back to the model; started before the model is loaded so the workers do not copy it
+postprocess = PostprocessPool(frame_shape=ring.frame_shape, workers=2)
+pending = collections.deque()
 
 # Load YOLOv8
 #model = YOLO("yolov8n.pt")
 #model = YOLO("yolov8n_ncnn_model")
 #model = YOLO("yolov8x.pt")
-model = YOLO("yolov8x_ncnn_model")
+model = YOLO(MODEL_NAME)
+apply_config(runtime, model)
+
+# Warm up so the FPS overlay reflects steady-state speed from the first frame
+warm_up(model)
+set_ncnn_threads(model, runtime.inference_threads)  # The ncnn net only exists after the first inference
+
+# While hovering consecutive frames barely change, so reuse the last detections
+# until the scene moves on (or they are a second old)
+gate = SceneGate(threshold=6.0, max_stale_seconds=1.0)
+backend = UltralyticsBackend(model, classes=allowed_classes())  # $DETECT_CLASSES, every class when unset
 
+recorder = None
+seq = -1
 while True:
-    # Capture a frame from the camera
-    frame = picam2.capture_array()
-    
-    # Run YOLO model on the captured frame and store the results
-    results = model(frame)
-    
-    # Output the visual detection data, we will draw this on our camera preview window
-    annotated_frame = results[0].plot()
-    
+    # Take the newest frame from the camera process; stop if it died (camera unplugged, driver error)
+    acquired = ring.acquire_latest(newer_than=seq, timeout=0.5)
+    if acquired is None:
+        if not capture_process.is_alive():
+            print(f"Camera process exited with code {capture_process.exitcode}, stopping")
+            break
+        if cv2.waitKey(1) == ord("q"):
+            break
+        continue
+    seq, captured, frame = acquired
+
+    # Run YOLO model on the captured frame and store the results, unless the scene is unchanged
+    if gate.should_run(frame):
+        detections = backend.detect(frame)
+
+    # Hand the frame and boxes to a worker to draw; when all of them are busy this frame is not shown
+    future = postprocess.submit(frame, detections, block=False)
+    if future is not None:
+        pending.append((future, captured))  # Capture time travels with the frame, for the recording
+    if recorder is not None and RECORD_MODE == "raw":
+        recorder.write(frame, captured)  # Copied, so the slot can be released right after
+    ring.release()  # Done with the shared frame, the camera can reuse its slot
+
+    # Show the newest frame the workers have finished, skip older ones
+    finished = []
+    while pending and pending[0][0].done():
+        future, shown_captured = pending.popleft()
+        finished.append((future.result(), shown_captured))
+    if not finished:
+        key = cv2.waitKey(1)
+        if key == ord("q"):
+            break
+        continue
+    for result, _ in finished[:-1]:
+        postprocess.release(result)
+    result, shown_captured = finished[-1]
+    annotated_frame = postprocess.annotated(result)
+
     # Get inference time
-    inference_time = results[0].speed['inference']
+    inference_time = detections.raw.speed['inference']
     fps = 1000 / inference_time  # Convert to milliseconds
-    text = f'FPS: {fps:.1f}'
+    text = f'FPS: {fps:.1f} Skipped: {gate.skip_rate:.0%}'
 
     # Define font and position
     font = cv2.FONT_HERSHEY_SIMPLEX
@@ -40,12 +102,45 @@ while True:
     # Draw the text on the annotated frame
     cv2.putText(annotated_frame, text, (text_x, text_y), font, 1, (255, 255, 255), 2, cv2.LINE_AA)
 
+    # Record the frame as shown, then mark it as recording (the mark is not recorded)
+    if recorder is not None and RECORD_MODE == "annotated":
+        recorder.write(annotated_frame, shown_captured)
+    if recorder is not None and recorder.error is not None:
+        # The encoder failed (codec, path, full disk); the live view carries on without recording
+        recorder.close()
+        print(recorder.status_text())
+        recorder = None
+    if recorder is not None:
+        cv2.putText(annotated_frame, recorder.status_text(), (10, annotated_frame.shape[0] - 20), font, 0.8,
+                    (0, 0, 255), 2, cv2.LINE_AA)
+
     # Display the resulting frame
     cv2.imshow("Camera", annotated_frame)
 
-    # Exit the program if q is pressed
-    if cv2.waitKey(1) == ord("q"):
+    # Save the shown frame with s (encoded by a worker), start or stop recording with r,
+    # exit the program if q is pressed
+    key = cv2.waitKey(1)
+    if key == ord("s"):
+        path = f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.png"
+        if postprocess.save(annotated_frame, path) is None:
+            print(f"Still saving the previous picture, {path} not saved")
+    elif key == ord("r"):
+        if recorder is None:
+            recorder = VideoWriter(f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{RECORD_MODE}.mp4", RECORD_FPS)
+        else:
+            recorder.close()
+            print(f"Saved {recorder.path}: {recorder.status_text()}")
+            recorder = None
+    postprocess.release(result)
+    if key == ord("q"):
         break
 
-# Close all windows
+# Finish the recording, stop the camera process and the workers and close all windows
+if recorder is not None:
+    recorder.close()
+    print(f"Saved {recorder.path}: {recorder.status_text()}")
+stop_capture.set()
+capture_process.join()
+ring.close()
+postprocess.close()
 cv2.destroyAllWindows()
\ No newline at end of file
@@ -1,20 +1,18 @@
-import cv2
-from picamera2 import Picamera2
+from camera_source import open_camera
 from ultralytics import YOLO
 import tkinter as tk
 from tkinter import Label
 from PIL import Image, ImageTk
+from warmup import start_warmup, DisplayBuffers
+from detection_core import DetectionCore, UltralyticsBackend, REFERENCE_POLICIES
 
 # Initialize the camera
-picam2 = Picamera2()
-picam2.preview_configuration.main.size = (1280, 1280)
-picam2.preview_configuration.main.format = "RGB888"
-picam2.preview_configuration.align()
-picam2.configure("preview")
-picam2.start()
+picam2 = open_camera()  # Pi camera, or the images/video named by $CAMERA_SOURCE
 
 # Load YOLOv8 model
 model = YOLO("yolov8x_ncnn_model")
+core = DetectionCore(UltralyticsBackend(model), REFERENCE_POLICIES["Toy Car"])
+display_buffers = DisplayBuffers()
 
 # Function to capture and process an image
 def take_picture():
@@ -22,16 +20,10 @@ def take_picture():
     frame = picam2.capture_array()
     
     # Run YOLO model on the captured frame
-    results = model(frame)
-    
-    # Extract detected object class names
-    detected_objects = []
-    if results[0].boxes:
-        for box in results[0].boxes:
-            class_id = int(box.cls)  # Class ID for the detected object
-            detected_objects.append(model.names[class_id])  # Map class ID to class name
+    measurement, annotated_frame = core.process(frame)
     
     # Update the label with detected objects
+    detected_objects = measurement.detections.class_names
     if detected_objects:
         detected_label.config(
             text=f"Objects detected: {', '.join(detected_objects)}"
@@ -39,17 +31,8 @@ def take_picture():
     else:
         detected_label.config(text="No objects detected.")
     
-    # Annotate the frame with detection results
-    annotated_frame = results[0].plot()
-    
-    # Resize the frame to half its original dimensions
-    height, width, _ = annotated_frame.shape
-    resized_frame = cv2.resize(annotated_frame, (width // 2, height // 2))
-    
-    # Convert the frame to a format suitable for Tkinter
-    frame_rgb = cv2.cvtColor(resized_frame, cv2.COLOR_BGR2RGB)
-    img = Image.fromarray(frame_rgb)
-    img_tk = ImageTk.PhotoImage(img)
+    # Show the annotated frame at half size
+    img_tk = ImageTk.PhotoImage(Image.fromarray(display_buffers.to_display(annotated_frame)))
     
     # Update the image label
     image_label.config(image=img_tk)
@@ -89,5 +72,14 @@ quit_button.pack(side=tk.RIGHT, expand=True, padx=10)
 image_label = Label(root)
 image_label.pack()
 
+# Warm up the model in the background so the first picture runs at full speed
+def on_model_ready(seconds):
+    take_picture_button.config(state=tk.NORMAL)
+    detected_label.config(text="Model ready. No objects detected.")
+
+take_picture_button.config(state=tk.DISABLED)
+detected_label.config(text="Warming up model...")
+start_warmup(root, model, on_model_ready)
+
 # Run the Tkinter event loop
 root.mainloop()
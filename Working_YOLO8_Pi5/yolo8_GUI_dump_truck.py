@@ -1,21 +1,19 @@
 import cv2
-from picamera2 import Picamera2
+from camera_source import open_camera
 from ultralytics import YOLO
 import tkinter as tk
 from tkinter import Label, filedialog
 from PIL import Image, ImageTk
-import math
+from warmup import start_warmup, DisplayBuffers
+from detection_core import DetectionCore, UltralyticsBackend, ReferencePolicy, REFERENCE_POLICIES, calculate_distance, display_to_frame, draw_measurement_line, draw_nearest_neighbors
+from result_cache import DetectionCache
+from detection_store import DetectionStore, frame_id
+from click_snap import ClickSnapper
 from datetime import datetime
 import os
 
 # Initialize the camera
-picam2 = Picamera2()
-#picam2.preview_configuration.main.size = (1280, 1280)
-picam2.preview_configuration.main.size = (1280, 1280)
-picam2.preview_configuration.main.format = "RGB888"
-picam2.preview_configuration.align()
-picam2.configure("preview")
-picam2.start()
+picam2 = open_camera()  # Pi camera, or the images/video named by $CAMERA_SOURCE
 
 # Load YOLOv8 model
 #model = YOLO("yolov8s.pt")
@@ -53,6 +51,9 @@ import_image_button.pack(side=tk.LEFT, expand=True, padx=10)
 save_button = tk.Button(button_frame, text="Save Image", command=lambda: save_image())
 save_button.pack(side=tk.LEFT, expand=True, padx=10)
 
+spacing_button = tk.Button(button_frame, text="Spacing", command=lambda: show_spacing())
+spacing_button.pack(side=tk.LEFT, expand=True, padx=10)
+
 quit_button = tk.Button(button_frame, text="Quit", command=root.quit)
 quit_button.pack(side=tk.RIGHT, expand=True, padx=10)
 
@@ -62,44 +63,43 @@ image_label.pack()
 
 # Initialize global variables
 annotated_frame = None
+measurement = None
 click_points = []
-current_mode = "toy"
-unit = "inches"  # Default unit for toy mode
+display_buffers = DisplayBuffers()
+# Toy dump trucks are measured in inches, real ones against an 8 meter average length
+toy_policy = ReferencePolicy("toy", "inches", 3, ["car", "cell phone", "dump truck"])
+real_policy = REFERENCE_POLICIES["Dump Truck"]
+# Re-importing a picture reuses its cached detections instead of running the model again
+# Every picture's boxes and every measured line are appended to ./measurements
+store = DetectionStore(site=os.environ.get("MEASUREMENT_SITE", "default"))
+image_id = None
+snapper = None
+core = DetectionCore(UltralyticsBackend(model), toy_policy, cache=DetectionCache())
 
 # Function to toggle between "toy" and "real" modes
 def toggle_mode():
-    global current_mode, unit
-    if current_mode == "toy":
-        current_mode = "real"
-        unit = "meter"
+    global measurement
+    if core.policy is toy_policy:
+        core.policy = real_policy
         toggle_button.config(text="Mode: Real Dump Truck(meter)")
     else:
-        current_mode = "toy"
-        unit = "inch"
+        core.policy = toy_policy
         toggle_button.config(text="Mode: Toy Car (inches)")
     update_detected_label()  # Update the label with the current mode
+    if measurement is not None:
+        # Only the scale changes, so re-measure the boxes we already have
+        measurement = core.measure(measurement.detections)
+        detected_label.config(text=measurement.summary_text())
 
 # Function to update the detected label based on mode
 def update_detected_label():
-    detected_label.config(fg="green" if current_mode == "toy" else "red")
-
-def calculate_distance(x1, y1, x2, y2):
-    return math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
-
-def calculate_box_differences(box):
-    x1, y1, x2, y2 = box.xyxy[0]  # Bounding box coordinates
-    dx = abs(x2 - x1)  # Change in x
-    dy = abs(y2 - y1)  # Change in y
-    diagonal = math.sqrt(dx**2 + dy**2)  # Diagonal length
-    return dx, dy, diagonal
+    detected_label.config(fg="green" if core.policy.mode == "toy" else "red")
 
 def take_picture():
-    global annotated_frame
     frame = picam2.capture_array()
     process_frame(frame)
 
 def import_image():
-    global annotated_frame
     file_path = filedialog.askopenfilename(
         title="Select an Image",
         filetypes=[("Image Files", "*.jpg *.jpeg *.png *.bmp *.tiff")]
@@ -112,45 +112,12 @@ def import_image():
             detected_label.config(text="Invalid image selected. Please try again.")
 
 def process_frame(frame):
-    global annotated_frame, unit, normalization_factor, avg_car_phone_diagonal
-    results = model(frame)
-    detected_objects = []
-    box_differences = []
-    car_and_phone_differences = []
-
-    if results[0].boxes:
-        for box in results[0].boxes[:7]:
-            class_id = int(box.cls)
-            object_name = model.names[class_id]
-            detected_objects.append(object_name)
-            dx, dy, diagonal = calculate_box_differences(box)
-            box_differences.append((dx, dy, diagonal))
-            if object_name.lower() in ["car", "cell phone", "dump truck"]:
-                car_and_phone_differences.append(diagonal)
-
-    avg_car_phone_diagonal = (sum(car_and_phone_differences) / len(car_and_phone_differences)) if car_and_phone_differences else 0
-
-    if detected_objects:
-        object_text = f"Objects detected: {', '.join(detected_objects)}"
-        differences_text = "\n".join(
-            [f"{obj}: Δx={dx:.1f}, Δy={dy:.1f}, Δd={diagonal:.1f}"
-             for obj, (dx, dy, diagonal) in zip(detected_objects, box_differences)]
-        )
-        normalization_factor = 3 if current_mode == "toy" else 8 #meters for dump truck (average length)
-        #normalization_factor_text = f"Pixels per Unit: {normalization_factor:.2f} "
-        #pixels_per_unit = avg_car_phone_diagonal / normalization_factor
-        avg_car_phone_text = f"Avg Δd (Car/Cell phone): {avg_car_phone_diagonal:.1f} pixels"
-        normalization_text = f"Normalized Diagonal: {avg_car_phone_diagonal / normalization_factor:.1f} pixels per {unit}"
-        #pixels_per_unit_text = f"Pixels per Unit: {pixels_per_unit:.2f} pixels/{unit}"
-        #pixels_per_unit_text = f"Pixels per Unit: {pixels_per_unit:.2f} "
-        #detected_label.config(text=f"{object_text}\n{differences_text}\n{avg_car_phone_text}\n{normalization_text}\n{pixels_per_unit_text}")
-        factor_text = f"Normalization Factor: {normalization_factor} {unit} "
-        
-        detected_label.config(text=f"{object_text}\n{differences_text}\n{avg_car_phone_text}\n{normalization_text}\n{factor_text}")
-    else:
-        detected_label.config(text="No objects detected.")
-
-    annotated_frame = results[0].plot()
+    global annotated_frame, measurement, click_points, image_id, snapper
+    measurement, annotated_frame = core.process(frame)
+    snapper = ClickSnapper(frame, measurement.detections)
+    image_id = store.append_measurement(measurement, frame_id(frame))
+    click_points = []
+    detected_label.config(text=measurement.summary_text())
     update_image_label(annotated_frame)
 
 # Add the toggle button to the button frame
@@ -158,9 +125,7 @@ toggle_button = tk.Button(button_frame, text="Mode: Toy Car (inches)", command=t
 toggle_button.pack(side=tk.LEFT, expand=True, padx=10)
 
 def update_image_label(frame):
-    height, width, _ = frame.shape
-    resized_frame = cv2.resize(frame, (width // 2, height // 2))
-    frame_rgb = cv2.cvtColor(resized_frame, cv2.COLOR_BGR2RGB)
+    frame_rgb = display_buffers.to_display(frame)
     img = Image.fromarray(frame_rgb)
     img_tk = ImageTk.PhotoImage(img)
     image_label.config(image=img_tk)
@@ -174,30 +139,40 @@ def save_image():
         print(f"Image saved as {filename}")
 
 def handle_click(event):
-    global click_points, unit, normalization_factor, avg_car_phone_diagonal
-    click_points.append((event.x, event.y))
+    global click_points
+    if annotated_frame is None:
+        return  # Nothing to measure until a picture has been processed
+    # Snap the click onto the nearest box corner or edge at full resolution
+    click_points.append(snapper.snap(display_to_frame(event.x, event.y, annotated_frame.shape)))
     if len(click_points) == 2:
-        x1, y1 = click_points[0]
-        x2, y2 = click_points[1]
-        annotated_frame_with_line = annotated_frame.copy()
-        height, width, _ = annotated_frame_with_line.shape
-        resized_width = width // 2
-        resized_height = height // 2
-        x1 = int(x1 * width / resized_width)
-        y1 = int(y1 * height / resized_height)
-        x2 = int(x2 * width / resized_width)
-        y2 = int(y2 * height / resized_height)
-        #cv2.line(annotated_frame_with_line, (x1, y1), (x2, y2), (255, 0, 0), 8) #blue
-        cv2.line(annotated_frame_with_line, (x1, y1), (x2, y2), (0, 255, 0), 8) #blue
-        
+        (x1, y1), (x2, y2) = click_points
+        annotated_frame_with_line = draw_measurement_line(annotated_frame.copy(), (x1, y1), (x2, y2), (0, 255, 0), 8)
         pixel_distance = calculate_distance(x1, y1, x2, y2)
-        #scaled_distance = pixel_distance / normalization_factor
-        scaled_distance = pixel_distance * normalization_factor / avg_car_phone_diagonal 
-        
-        distance_text = f"Line length: {pixel_distance:.2f} pixels, {scaled_distance:.2f} {unit}"
+        store.append_line(measurement, (x1, y1), (x2, y2), image_id)
+        distance_text = measurement.distance_text(pixel_distance)
         detected_label.config(text=f"{detected_label.cget('text')}\n{distance_text}")
         update_image_label(annotated_frame_with_line)
         click_points = []
 
+# Distance from every object to its nearest neighbour, all pairs in one go
+def show_spacing():
+    if measurement is None:
+        return
+    nearest, _, _ = measurement.nearest_neighbors()
+    detected_label.config(text=f"{measurement.summary_text()}\n{measurement.spacing_text()}")
+    update_image_label(draw_nearest_neighbors(annotated_frame.copy(), measurement.detections, nearest))
+
 image_label.bind("<Button-1>", handle_click)
+
+# Warm up the model in the background so the first picture runs at full speed
+def on_model_ready(seconds):
+    take_picture_button.config(state=tk.NORMAL)
+    import_image_button.config(state=tk.NORMAL)
+    detected_label.config(text="Model ready. No objects detected.")
+
+take_picture_button.config(state=tk.DISABLED)
+import_image_button.config(state=tk.DISABLED)
+detected_label.config(text="Warming up model...")
+start_warmup(root, model, on_model_ready)
+
 root.mainloop()
@@ -1,31 +1,22 @@
 import cv2
-from picamera2 import Picamera2
+from camera_source import open_camera
 from ultralytics import YOLO
 import tkinter as tk
 from tkinter import Label
-from tkinter import filedialog
 from PIL import Image, ImageTk
-import math
+from warmup import start_warmup, DisplayBuffers
+from detection_core import DetectionCore, UltralyticsBackend, ReferencePolicy
 from datetime import datetime
 
 # Initialize the camera
-picam2 = Picamera2()
-picam2.preview_configuration.main.size = (1280, 1280)
-picam2.preview_configuration.main.format = "RGB888"
-picam2.preview_configuration.align()
-picam2.configure("preview")
-picam2.start()
+picam2 = open_camera()  # Pi camera, or the images/video named by $CAMERA_SOURCE
 
 # Load YOLOv8 model
 model = YOLO("yolov8x_ncnn_model")
 
-# Function to calculate changes in x, y, and diagonal pixels
-def calculate_box_differences(box):
-    x1, y1, x2, y2 = box.xyxy[0]  # Bounding box coordinates (x_min, y_min, x_max, y_max)
-    dx = abs(x2 - x1)  # Change in x (width of the bounding box)
-    dy = abs(y2 - y1)  # Change in y (height of the bounding box)
-    diagonal = math.sqrt(dx**2 + dy**2)  # Diagonal length
-    return dx, dy, diagonal
+# Scale from the average diagonal of every detected object, assumed to be 3 inches
+core = DetectionCore(UltralyticsBackend(model), ReferencePolicy("toy", "inches", 3))
+display_buffers = DisplayBuffers()
 
 # Function to capture and process an image
 def take_picture():
@@ -33,55 +24,14 @@ def take_picture():
     # Capture a frame from the camera
     frame = picam2.capture_array()
     
-    # Run YOLO model on the captured frame
-    results = model(frame)
-    
-    # Extract detected object class names and bounding box differences
-    detected_objects = []
-    box_differences = []
-    if results[0].boxes:
-        for box in results[0].boxes[:7]:  # Limit to the first 7 detected objects
-            class_id = int(box.cls)  # Class ID for the detected object
-            detected_objects.append(model.names[class_id])  # Map class ID to class name
-            
-            # Calculate changes in x, y, and diagonal pixels
-            dx, dy, diagonal = calculate_box_differences(box)
-            box_differences.append((dx, dy, diagonal))
-    
-    # Calculate average diagonal d for up to 7 cars
-    if box_differences:
-        avg_diagonal = sum([diagonal for _, _, diagonal in box_differences]) / len(box_differences)
-    else:
-        avg_diagonal = 0
-    
-    # Scale the average diagonal to 3 inches (assuming known scaling factor)
-    inches = 3  # Target in inches
-    pixels_per_inch = avg_diagonal / inches 
+    # Run YOLO model on the captured frame and work out the box sizes
+    measurement, annotated_frame = core.process(frame)
     
     # Update the label with detected objects and box differences
-    if detected_objects:
-        object_text = f"Objects detected: {', '.join(detected_objects)}"
-        differences_text = "\n".join(
-            [f"{obj}: Δx={dx:.1f}, Δy={dy:.1f}, Δd={diagonal:.1f}" 
-             for obj, (dx, dy, diagonal) in zip(detected_objects, box_differences)]
-        )
-        avg_diagonal_text = f"Avg Δd : {avg_diagonal} pixels"
-        pixels_per_inch_text = f"Pixels per inch: {pixels_per_inch:.1f}"
-        detected_label.config(text=f"{object_text}\n{differences_text}\n{avg_diagonal_text}\n{pixels_per_inch_text}")
-    else:
-        detected_label.config(text="No objects detected.")
-    
-    # Annotate the frame with detection results
-    annotated_frame = results[0].plot()
+    detected_label.config(text=measurement.summary_text())
     
-    # Resize the frame to half its original dimensions
-    height, width, _ = annotated_frame.shape
-    resized_frame = cv2.resize(annotated_frame, (width // 2, height // 2))
-    
-    # Convert the frame to a format suitable for Tkinter
-    frame_rgb = cv2.cvtColor(resized_frame, cv2.COLOR_BGR2RGB)
-    img = Image.fromarray(frame_rgb)
-    img_tk = ImageTk.PhotoImage(img)
+    # Convert the half-size frame to a format suitable for Tkinter
+    img_tk = ImageTk.PhotoImage(Image.fromarray(display_buffers.to_display(annotated_frame)))
     
     # Update the image label
     image_label.config(image=img_tk)
@@ -139,5 +89,14 @@ image_label.pack()
 # Initialize global variable for annotated frame
 annotated_frame = None
 
+# Warm up the model in the background so the first picture runs at full speed
+def on_model_ready(seconds):
+    take_picture_button.config(state=tk.NORMAL)
+    detected_label.config(text="Model ready. No objects detected.")
+
+take_picture_button.config(state=tk.DISABLED)
+detected_label.config(text="Warming up model...")
+start_warmup(root, model, on_model_ready)
+
 # Run the Tkinter event loop
 root.mainloop()
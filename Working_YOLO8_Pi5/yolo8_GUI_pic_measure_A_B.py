@@ -1,19 +1,16 @@
 import cv2
-from picamera2 import Picamera2
+from camera_source import open_camera
 from ultralytics import YOLO
 import tkinter as tk
 from tkinter import Canvas
 from PIL import Image, ImageTk
-import math
+from warmup import start_warmup, DisplayBuffers
+from detection_core import DetectionCore, UltralyticsBackend, ReferencePolicy, REFERENCE_POLICIES, calculate_distance, display_to_frame, draw_measurement_line
+from click_snap import ClickSnapper
 from datetime import datetime
 
 # Initialize the camera
-picam2 = Picamera2()
-picam2.preview_configuration.main.size = (1280, 1280)
-picam2.preview_configuration.main.format = "RGB888"
-picam2.preview_configuration.align()
-picam2.configure("preview")
-picam2.start()
+picam2 = open_camera()  # Pi camera, or the images/video named by $CAMERA_SOURCE
 
 # Load YOLOv8 model
 model = YOLO("yolov8x_ncnn_model")
@@ -56,74 +53,28 @@ annotated_frame = None
 click_points = []  # List to store clicked points for drawing
 text_items = []  # List to store text items for persistence
 
-# Function to calculate distance between two points
-def calculate_distance(x1, y1, x2, y2):
-    return math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
-
-def calculate_box_differences(box):
-    x1, y1, x2, y2 = box.xyxy[0]  # Bounding box coordinates (x_min, y_min, x_max, y_max)
-    dx = abs(x2 - x1)  # Change in x (width of the bounding box)
-    dy = abs(y2 - y1)  # Change in y (height of the bounding box)
-    diagonal = math.sqrt(dx**2 + dy**2)  # Diagonal length
-    return dx, dy, diagonal
+# Car and cell phone boxes are reported against a 3 inch reference, drawn lines use 1 inch = 50 pixels
+core = DetectionCore(UltralyticsBackend(model), REFERENCE_POLICIES["Toy Car"])
+line_policy = ReferencePolicy("toy", "inches", pixels_per_unit=50)
+display_buffers = DisplayBuffers()
+measurement = None
+snapper = None
 
 # Function to capture and process an image
 def take_picture():
-    global annotated_frame  # Declare as global to access in save function
+    global annotated_frame, measurement, snapper  # Declare as global to access in save function
     # Capture a frame from the camera
     frame = picam2.capture_array()
     
-    # Run YOLO model on the captured frame
-    results = model(frame)
-    
-    # Extract detected object class names and bounding box differences
-    detected_objects = []
-    box_differences = []
-    car_and_phone_differences = []
-    if results[0].boxes:
-        for box in results[0].boxes[:7]:  # Limit to the first 7 detected objects
-            class_id = int(box.cls)  # Class ID for the detected object
-            object_name = model.names[class_id]
-            detected_objects.append(object_name)  # Map class ID to class name
-            
-            # Calculate changes in x, y, and diagonal pixels
-            dx, dy, diagonal = calculate_box_differences(box)
-            box_differences.append((dx, dy, diagonal))
-            
-            # Filter for car and cell phone objects
-            if object_name.lower() in ["car", "cell phone"]:
-                car_and_phone_differences.append(diagonal)
-    
-    # Calculate the average delta d for car and cell phone objects (up to 7)
-    if car_and_phone_differences:
-        avg_car_phone_diagonal = sum(car_and_phone_differences) / len(car_and_phone_differences)
-    else:
-        avg_car_phone_diagonal = 0
+    # Run YOLO model on the captured frame and work out the box sizes
+    measurement, annotated_frame = core.process(frame)
+    snapper = ClickSnapper(frame, measurement.detections)  # Edges are found in the background
     
     # Update the label with detected objects and box differences
-    if detected_objects:
-        object_text = f"Objects detected: {', '.join(detected_objects)}"
-        differences_text = "\n".join(
-            [f"{obj}: Δx={dx:.1f}, Δy={dy:.1f}, Δd={diagonal:.1f}" 
-             for obj, (dx, dy, diagonal) in zip(detected_objects, box_differences)]
-        )
-        avg_car_phone_text = f"Avg Δd (Car/Cell phone): {avg_car_phone_diagonal:.1f} pixels"
-        pixels_per_inch_text = f"Pixels per inch: {avg_car_phone_diagonal / 3:.1f}"  # Assuming 3 inches is the reference
-        detected_label.config(text=f"{object_text}\n{differences_text}\n{avg_car_phone_text}\n{pixels_per_inch_text}")
-    else:
-        detected_label.config(text="No objects detected.")
-            
-    # Annotate the frame with detection results
-    annotated_frame = results[0].plot()
+    detected_label.config(text=measurement.summary_text())
     
-    # Resize the frame to half its original dimensions
-    height, width, _ = annotated_frame.shape
-    resized_frame = cv2.resize(annotated_frame, (width // 2, height // 2))
-    
-    # Convert the frame to a format suitable for Tkinter
-    frame_rgb = cv2.cvtColor(resized_frame, cv2.COLOR_BGR2RGB)
-    img = Image.fromarray(frame_rgb)
-    img_tk = ImageTk.PhotoImage(img)
+    # Convert the half-size frame to a format suitable for Tkinter
+    img_tk = ImageTk.PhotoImage(Image.fromarray(display_buffers.to_display(annotated_frame)))
     
     # Update the Canvas with the image
     canvas.create_image(0, 0, anchor=tk.NW, image=img_tk)
@@ -142,7 +93,7 @@ def save_image():
 
 # Function to handle mouse click events and draw lines
 def handle_click(event):
-    global click_points, text_items, annotated_frame
+    global click_points, text_items
     
     if annotated_frame is None:
         return  # Do nothing if no image is loaded yet
@@ -161,42 +112,32 @@ def handle_click(event):
         item = canvas.create_text(click_points[1][0] - 10, click_points[1][1], text="B", font=("Arial", 18), fill="red")
         text_items.append(item)  # Add item ID to the list to ensure it stays visible
         
-        x1, y1 = click_points[0]
-        x2, y2 = click_points[1]
-        
-        # Ensure the line is drawn on the annotated image
-        annotated_frame_with_line = annotated_frame.copy()
-        
-        # Adjust the coordinates based on the resized image
-        height, width, _ = annotated_frame_with_line.shape
-        resized_width = width // 2
-        resized_height = height // 2
-        x1 = int(x1 * width / resized_width)
-        y1 = int(y1 * height / resized_height)
-        x2 = int(x2 * width / resized_width)
-        y2 = int(y2 * height / resized_height)
+        # Adjust the coordinates based on the resized image and snap them to the nearest box corner or edge
+        x1, y1 = snapper.snap(display_to_frame(*click_points[0], annotated_frame.shape))
+        x2, y2 = snapper.snap(display_to_frame(*click_points[1], annotated_frame.shape))
         
-        # Draw the line on the frame
-        cv2.line(annotated_frame_with_line, (x1, y1), (x2, y2), (255, 0, 0), 2)
+        # Draw the line straight onto the annotated frame so it is kept for saving
+        draw_measurement_line(annotated_frame, (x1, y1), (x2, y2), (255, 0, 0), 2)
         
-        # Calculate the distance between the two points
+        # Calculate the distance between the two points and convert it to inches
         pixel_distance = calculate_distance(x1, y1, x2, y2)
-        
-        # Convert pixels to inches (1 inch = 50 pixels)
-        inch_distance = pixel_distance / 50
-        
-        # Update the label with the distance in pixels and inches
-        distance_text = f"Line length: {pixel_distance:.2f} pixels, {inch_distance:.2f} inches"
+        distance_text = core.measure(measurement.detections, line_policy).distance_text(pixel_distance)
         detected_label.config(text=f"{detected_label.cget('text')}\n{distance_text}")
         
-        # Annotate the frame with the drawn line
-        annotated_frame = annotated_frame_with_line.copy()
-        
         # Reset click_points for the next line
         click_points = []
 
 # Bind mouse clicks to the handle_click function
 canvas.bind("<Button-1>", handle_click)
 
+# Warm up the model in the background so the first picture runs at full speed
+def on_model_ready(seconds):
+    take_picture_button.config(state=tk.NORMAL)
+    detected_label.config(text="Model ready. No objects detected.")
+
+take_picture_button.config(state=tk.DISABLED)
+detected_label.config(text="Warming up model...")
+start_warmup(root, model, on_model_ready)
+
 # Run the Tkinter event loop
 root.mainloop()
@@ -1,12 +1,25 @@
 import cv2
-from picamera2 import Picamera2
+from camera_source import open_camera
 from ultralytics import YOLO
 import tkinter as tk
 from tkinter import Label, filedialog, StringVar, OptionMenu
 from PIL import Image, ImageTk
-import math
 from datetime import datetime
 import os
+from warmup import start_warmup, run_in_background, DisplayBuffers
+from detection_core import DetectionCore, UltralyticsBackend, REFERENCE_POLICIES, display_to_frame, draw_measurement_line, draw_nearest_neighbors
+from result_cache import DetectionCache
+from detection_store import DetectionStore, frame_id
+from spatial_index import SpatialIndex
+from ground_scale import flight_metadata, ground_policy
+from calibration import PointCorrection, correction_mode, load_env_calibration
+from click_snap import ClickSnapper
+from geometry_tools import Geometry, TOOLS
+from runtime_config import load_config, apply_config, set_ncnn_threads
+from memory_budget import BudgetedModelRegistry, FramePool, MemoryMonitor, MODEL_NAMES
+from class_filter import allowed_classes
+from precision import ScaleEstimator, measure_until_precise
+from burst_capture import BurstCapture
 
 # Create the Tkinter window
 root = tk.Tk()
@@ -17,9 +30,11 @@ root.geometry(f"{1280 // 2}x{1280 // 2 + 150}")
 instructions_label = Label(
     root,
     text=(
-        "1. Select a YOLO model and mode (Toy Car, Real Car, or Dump Truck).\n"
+        "1. Select a YOLO model and mode (Toy Car, Real Car, Dump Truck, or Altitude).\n"
         "2. Take a picture or import an image.\n"
-        "3. Click on two points in the image to measure the distance between them.\n"
+        "3. Click on two points in the image to measure the distance between them,\n"
+        "   or right-click an object to measure it. The polyline, polygon and rectangle\n"
+        "   tools keep adding points; Enter starts a new shape, Ctrl+Z/Ctrl+Y undo and redo.\n"
         "4. Save the annotated image if needed."
     ),
     font=("Arial", 10),
@@ -30,31 +45,18 @@ instructions_label = Label(
 instructions_label.pack(pady=10)
 
 # Initialize the camera
-picam2 = Picamera2()
-picam2.preview_configuration.main.size = (1280, 1280)
-picam2.preview_configuration.main.format = "RGB888"
-picam2.preview_configuration.align()
-picam2.configure("preview")
-picam2.start()
-
-# Model options
-model_options = {
-    "yolov8n.pt": YOLO("yolov8n.pt"),
-    "yolov8s.pt": YOLO("yolov8s.pt"),
-    "yolov8m.pt": YOLO("yolov8m.pt"),
-    "yolov8l.pt": YOLO("yolov8l.pt"),
-    "yolov8x.pt": YOLO("yolov8x.pt"),
-    "yolov8x-worldv2.pt": YOLO("yolov8x-worldv2.pt"),
-    "yolov8n-obb.pt": YOLO("yolov8n-obb.pt"),
-    "yolov8x-obb.pt": YOLO("yolov8x-obb.pt"),
-}
+picam2 = open_camera()  # Pi camera, or the images/video named by $CAMERA_SOURCE
+
+# Model options; a model is loaded when it is selected and only the selected one stays in memory
+models = BudgetedModelRegistry(MODEL_NAMES, loader=YOLO)
 selected_model = StringVar(value="yolov8n.pt")
-model = model_options[selected_model.get()]
+model = models.get(selected_model.get())
 
 #model.set_classes(["dump truck" , "tractor" , "large vehicle", "construction equipment"])
 
 # Replace toggle button with a dropdown menu
-mode_options = ["Toy Car", "Real Car", "Dump Truck"]
+# "Altitude (GSD)" scales from the flight altitude and camera lens instead of a reference object
+mode_options = ["Toy Car", "Real Car", "Dump Truck", "Altitude (GSD)"]
 selected_mode = StringVar(value=mode_options[1])  # Default to "toy Car"
 
 # Labels and dropdown menu for models
@@ -64,7 +66,7 @@ detected_label.pack(pady=5)
 model_label = Label(root, text="Select YOLO Model:")
 model_label.pack()
 
-model_dropdown = OptionMenu(root, selected_model, *model_options.keys())
+model_dropdown = OptionMenu(root, selected_model, *MODEL_NAMES)
 model_dropdown.pack()
 
 mode_label = Label(root, text="Select Mode:")
@@ -73,19 +75,35 @@ mode_label.pack()
 mode_dropdown = OptionMenu(root, selected_mode, *mode_options)
 mode_dropdown.pack()
 
+selected_tool = StringVar(value=TOOLS[0])
+tool_label = Label(root, text="Select Tool:")
+tool_label.pack()
+
+tool_dropdown = OptionMenu(root, selected_tool, *TOOLS)
+tool_dropdown.pack()
+
 # Frame for buttons
 button_frame = tk.Frame(root)
 button_frame.pack(fill=tk.X, pady=5)
 
-take_picture_button = tk.Button(button_frame, text="Take Picture", command=lambda: take_picture())
+take_picture_button = tk.Button(button_frame, text="Take Picture", command=lambda: take_picture(), state=tk.DISABLED)
 take_picture_button.pack(side=tk.LEFT, expand=True, padx=10)
 
-import_image_button = tk.Button(button_frame, text="Import Image", command=lambda: import_image())
+precise_picture_button = tk.Button(button_frame, text="Precise Picture", command=lambda: precise_picture(), state=tk.DISABLED)
+precise_picture_button.pack(side=tk.LEFT, expand=True, padx=10)
+
+burst_picture_button = tk.Button(button_frame, text="Burst Picture", command=lambda: burst_picture(), state=tk.DISABLED)
+burst_picture_button.pack(side=tk.LEFT, expand=True, padx=10)
+
+import_image_button = tk.Button(button_frame, text="Import Image", command=lambda: import_image(), state=tk.DISABLED)
 import_image_button.pack(side=tk.LEFT, expand=True, padx=10)
 
 save_button = tk.Button(button_frame, text="Save Image", command=lambda: save_image())
 save_button.pack(side=tk.LEFT, expand=True, padx=10)
 
+spacing_button = tk.Button(button_frame, text="Spacing", command=lambda: show_spacing())
+spacing_button.pack(side=tk.LEFT, expand=True, padx=10)
+
 quit_button = tk.Button(button_frame, text="Quit", command=root.quit)
 quit_button.pack(side=tk.RIGHT, expand=True, padx=10)
 
@@ -96,50 +114,99 @@ quit_button.pack(side=tk.RIGHT, expand=True, padx=10)
 image_label = Label(root)
 image_label.pack()
 
-runtime_label = Label(root, text="Run Time: N/A", font=("Arial", 12), fg="green")
+runtime_label = Label(root, text="Warming up model...", font=("Arial", 12), fg="orange")
 runtime_label.pack(pady=5)
 
+memory_label = Label(root, text="", font=("Arial", 10), fg="gray")
+memory_label.pack()
+
 annotated_frame = None
 click_points = []
-current_mode = "real"
-unit = "feet"
-
-
-
+measurement = None
+display_buffers = DisplayBuffers()
+# Lines, shapes and highlights are drawn on a reused copy of the picture instead of a new one per click
+frames = FramePool(max_frames=2)
+# RSS, frames and model sizes; set $MEMORY_LOG to a CSV file to log every sample
+memory = MemoryMonitor(models, frames, lambda: [annotated_frame, display_buffers.resized, display_buffers.rgb, burst.buffer.stack],
+                       log_path=os.environ.get("MEMORY_LOG"))
+MEMORY_CHECK_MS = 5000
+capture_scale = 1.0  # Dropped to half when memory runs low
+scale_estimate = None  # Scale averaged over several frames by "Precise Picture", see precision.py
+busy = False  # A picture is being detected on a worker thread
+runtime = None  # Thread counts and cores for the selected model, see runtime_config.py
+# Re-importing a picture reuses its cached detections instead of running the model again
+# Every picture's boxes and every measured line are appended to ./measurements
+store = DetectionStore(site=os.environ.get("MEASUREMENT_SITE", "default"))
+image_id = None
+box_index = None  # Boxes of the current picture, for picking an object by right-clicking it
+snapper = None
+geometry = None  # Shape being drawn with the polyline, polygon or rectangle tool
+frame_metadata = {}  # Altitude and tilt of the current picture, see ground_scale.py
+# $CAMERA_CALIBRATION corrects whole frames in open_camera(), or only boxes and clicks with $CAMERA_CORRECTION=points
+calibration = load_env_calibration()
+point_correction = PointCorrection(calibration) if correction_mode() == "points" else None
+core = DetectionCore(UltralyticsBackend(model, classes=allowed_classes()), REFERENCE_POLICIES[selected_mode.get()], cache=DetectionCache(),
+                     correction=point_correction)
+# "Burst Picture" frames go into one preallocated stack, reused (or reallocated after a resolution change) every burst
+burst = BurstCapture(lambda: fit_to_memory(picam2.capture_array()), core, frames=5)
+
+
+# Policy for the selected mode; altitude mode falls back to Real Car when the picture has no altitude
+def current_policy():
+    if selected_mode.get() != "Altitude (GSD)":
+        return REFERENCE_POLICIES[selected_mode.get()]
+    if annotated_frame is None:
+        return REFERENCE_POLICIES["Real Car"]
+    height, width = annotated_frame.shape[:2]
+    # Measured points are already lens corrected when a calibration is in use
+    camera = None if calibration is None else calibration.camera_model(corrected=True)
+    try:
+        return ground_policy(frame_metadata, (width, height), camera=camera) or REFERENCE_POLICIES["Real Car"]
+    except ValueError as error:
+        print(f"{error}, using Real Car scale")  # An unknown camera in the picture's metadata or $CAMERA_MODEL
+        return REFERENCE_POLICIES["Real Car"]
+
+
+def measurement_text():
+    text = measurement.summary_text()
+    if selected_mode.get() == "Altitude (GSD)" and core.policy.mode != "ground":
+        text += "\nNo altitude or known camera for this picture (sidecar, XMP or $CAMERA_ALTITUDE), using Real Car scale"
+    return text
+
+
+# Switching units only changes the scale, so re-measure the boxes we already have
 def update_mode(*args):
-    global current_mode, unit, normalization_factor
-    mode = selected_mode.get()
-    if mode == "Toy Car":
-        current_mode = "toy"
-        unit = "inches"
-        normalization_factor = 3
-    elif mode == "Real Car":
-        current_mode = "real"
-        unit = "feet"
-        normalization_factor = 15
-    elif mode == "Dump Truck":
-        current_mode = "dump_truck"
-        unit = "meters"
-        normalization_factor = 8  # Adjust this value as needed
+    global measurement, scale_estimate
+    scale_estimate = None  # Averaged for the previous mode's reference objects
+    core.policy = current_policy()
     update_detected_label()
+    if measurement is not None:
+        measurement = core.measure(measurement.detections)
+        detected_label.config(text=measurement_text())
 
 selected_mode.trace_add("write", update_mode)
-#selected_model.trace_add("write", lambda *args: update_model())
+selected_model.trace_add("write", lambda *args: warm_selected_model())
 
 
         
 # Function to update the detected label based on mode
 def update_detected_label():
-    detected_label.config(fg="green" if current_mode == "toy" else "red")
+    detected_label.config(fg="green" if core.policy.mode == "toy" else "red")
 
 
 def update_model():
     """
     Update the selected YOLO model and configure its classes if the selected model is 'yolov8x-worldv2.pt'.
     """
-    global model
+    global model, runtime
     selected_model_name = selected_model.get()
-    model = model_options[selected_model_name]
+    model = core.backend = None  # Let go of the previous model before loading the next
+    model = models.get(selected_model_name)
+
+    # Thread counts for the model; this Tk thread keeps to the UI cores, inference
+    # runs on worker threads that pin themselves to the inference cores (see run_detection)
+    runtime = load_config(selected_model_name)
+    apply_config(runtime, model, stage="ui")
 
     # Configure classes for 'yolov8x-worldv2.pt'
     if selected_model_name == "yolov8x-worldv2.pt":
@@ -147,27 +214,106 @@ def update_model():
         print("Using yolov8x-worldv2.pt - Configured for detecting dump truck and related objects.")
     else:
         print(f"Using {selected_model_name} - No specific classes configured.")
+    # After set_classes, so an allow-list from $DETECT_CLASSES matches the model's own class names
+    core.backend = UltralyticsBackend(model, classes=allowed_classes())
 
 
-def calculate_distance(x1, y1, x2, y2):
-    return math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
+# Warm up the selected model in the background and only enable the detection buttons once it is ready
+def warm_selected_model():
+    if busy:
+        root.after(200, warm_selected_model)  # Not while a picture is being detected with the current model
+        return
+    update_model()
+    set_detection_buttons(tk.DISABLED)
+    runtime_label.config(text=f"Warming up {selected_model.get()}...", fg="orange")
+    model_name = selected_model.get()
+    start_warmup(root, model, lambda seconds: on_model_ready(model_name, seconds), cores=runtime.cores.get("inference"))
+
+def on_model_ready(model_name, seconds):
+    if model_name != selected_model.get():
+        return  # Another model was selected while this one was warming up
+    set_ncnn_threads(model, runtime.inference_threads)
+    set_detection_buttons(tk.NORMAL)
+    if seconds is None:
+        runtime_label.config(text="Model ready (warm-up failed)", fg="red")
+    else:
+        runtime_label.config(text=f"Model ready (warm-up {seconds:.2f} seconds)", fg="green")
+
+
+# Shrink pictures while memory is low, see check_memory(); pass `scale` to keep
+# the scale a multi-frame capture started with
+def fit_to_memory(frame, scale=None):
+    scale = capture_scale if scale is None else scale
+    if scale < 1:
+        return cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return frame
+
+
+def set_detection_buttons(state):
+    for button in (take_picture_button, precise_picture_button, burst_picture_button, import_image_button):
+        button.config(state=state)
+
+
+# Run `work` (inference) on a worker thread pinned to the inference cores, with the
+# detection buttons disabled, and hand its result to `on_done` back on the Tk thread
+def run_detection(work, on_done, on_poll=None):
+    global busy
+    busy = True
+    set_detection_buttons(tk.DISABLED)
+
+    def finished(result, error):
+        global busy
+        busy = False
+        set_detection_buttons(tk.NORMAL)
+        if error is not None:
+            runtime_label.config(text=f"Detection failed: {error}", fg="red")
+            return
+        on_done(result)
+
+    run_in_background(root, work, finished, cores=runtime.cores.get("inference"), on_poll=on_poll, name="detection")
 
-def calculate_box_differences(box):
-    x1, y1, x2, y2 = box.xyxy[0]  # Bounding box coordinates
-    dx = abs(x2 - x1)  # Change in x
-    dy = abs(y2 - y1)  # Change in y
-    diagonal = math.sqrt(dx**2 + dy**2)  # Diagonal length
-    return dx, dy, diagonal
 
 def take_picture():
-    global annotated_frame
-    update_model()
     start_time = datetime.now()
-    frame = picam2.capture_array()
-    process_frame(frame, start_time)
+    frame = fit_to_memory(picam2.capture_array())
+    run_detection(lambda: core.detect(frame), lambda detections: process_frame(frame, start_time, flight_metadata(), detections))
+
+
+# Keep capturing until the scale from the reference objects is known to within 1%
+# (or 30 frames), then measure the last frame with that scale and its error bars
+def precise_picture():
+    start_time = datetime.now()
+    estimator = ScaleEstimator(current_policy(), precision=0.01)
+    scale = capture_scale  # Every frame the same size, even if memory runs low halfway
+
+    def finished(result):
+        global scale_estimate
+        frame, detections = result
+        process_frame(frame, start_time, flight_metadata(), detections)
+        scale_estimate = estimator
+        detected_label.config(text=f"{measurement_text()}\n{estimator.summary_text()}")
+
+    def progress():
+        # Read from the worker's estimator, the buttons stay disabled until it has converged
+        runtime_label.config(text=f"Precise picture: {estimator.frames} of at most {estimator.max_frames} frames", fg="orange")
+
+    run_detection(lambda: measure_until_precise(lambda: fit_to_memory(picam2.capture_array(), scale), core, estimator),
+                  finished, on_poll=progress)
+
+# Five frames back to back, detected as one batch; boxes found in most of them
+# are fused into their median, and the sharpest frame is measured
+def burst_picture():
+    start_time = datetime.now()
+
+    def finished(result):
+        frame, detections = result
+        process_frame(frame, start_time, flight_metadata(), detections)
+        detected_label.config(text=f"{measurement_text()}\nFused from {burst.buffer.frames} frames, "
+                                   f"votes per object: {burst.votes.tolist()}")
+
+    run_detection(burst.capture, finished)
 
 def import_image():
-    global annotated_frame
     file_path = filedialog.askopenfilename(
         title="Select an Image",
         filetypes=[("Image Files", "*.jpg *.jpeg *.png *.bmp *.tiff")]
@@ -176,45 +322,32 @@ def import_image():
         frame = cv2.imread(file_path)
         if frame is not None:
             start_time = datetime.now()
-            process_frame(frame, start_time)
+            frame = fit_to_memory(frame)
+            run_detection(lambda: core.detect(frame),
+                          lambda detections: process_frame(frame, start_time, flight_metadata(file_path), detections))
         else:
             detected_label.config(text="Invalid image selected. Please try again.")
 
-def process_frame(frame, start_time):
-    global annotated_frame, unit, normalization_factor, avg_car_phone_diagonal
-    results = model(frame)
-    detected_objects = []
-    box_differences = []
-    car_and_phone_differences = []
-
-    if results[0].boxes:
-        for box in results[0].boxes[:7]:
-            class_id = int(box.cls)
-            object_name = model.names[class_id]
-            detected_objects.append(object_name)
-            dx, dy, diagonal = calculate_box_differences(box)
-            box_differences.append((dx, dy, diagonal))
-            if object_name.lower() in ["car", "cell phone"]:
-                car_and_phone_differences.append(diagonal)
-
-    avg_car_phone_diagonal = (sum(car_and_phone_differences) / len(car_and_phone_differences)) if car_and_phone_differences else 0
-
-    if detected_objects:
-        object_text = f"Objects detected: {', '.join(detected_objects)}"
-        differences_text = "\n".join(
-            [f"{obj}: Δx={dx:.1f}, Δy={dy:.1f}, Δd={diagonal:.1f}"
-             for obj, (dx, dy, diagonal) in zip(detected_objects, box_differences)]
-        )
-        normalization_factor = 3 if current_mode == "toy" else 15  # Inches or feet
-        avg_car_phone_text = f"Avg Δd (Car/Cell phone): {avg_car_phone_diagonal:.1f} pixels"
-        normalization_text = f"Normalized Diagonal: {avg_car_phone_diagonal / normalization_factor:.1f} pixels per {unit}"
-        factor_text = f"Normalization Factor: {normalization_factor} {unit} "
-
-        detected_label.config(text=f"{object_text}\n{differences_text}\n{avg_car_phone_text}\n{normalization_text}\n{factor_text}")
+# `detections` come from a worker thread (see run_detection); without them the frame is detected here
+def process_frame(frame, start_time, metadata, detections=None):
+    global annotated_frame, measurement, click_points, image_id, box_index, frame_metadata, snapper, scale_estimate
+    frame_metadata = metadata
+    scale_estimate = None
+    if detections is None:
+        measurement, annotated_frame = core.process(frame)
     else:
-        detected_label.config(text="No objects detected.")
-
-    annotated_frame = results[0].plot()
+        measurement, annotated_frame = core.measure(detections), core.backend.plot(detections, frame)
+    measurement.detections.raw = None  # Already plotted, and the Ultralytics result keeps its own copy of the frame
+    if selected_mode.get() == "Altitude (GSD)":
+        # The ground scale depends on this picture, so measure again now its size and altitude are known
+        core.policy = current_policy()
+        measurement = core.measure(measurement.detections)
+    box_index = SpatialIndex.from_detections(measurement.detections)
+    new_shape()
+    snapper = ClickSnapper(frame, measurement.detections)
+    image_id = store.append_measurement(measurement, frame_id(frame))
+    click_points = []
+    detected_label.config(text=measurement_text())
     update_image_label(annotated_frame)
     
 # Calculate runtime and update the label
@@ -223,9 +356,7 @@ def process_frame(frame, start_time):
     runtime_label.config(text=f"Run Time: {runtime:.2f} seconds")
 
 def update_image_label(frame):
-    height, width, _ = frame.shape
-    resized_frame = cv2.resize(frame, (width // 2, height // 2))
-    frame_rgb = cv2.cvtColor(resized_frame, cv2.COLOR_BGR2RGB)
+    frame_rgb = display_buffers.to_display(frame)
     img = Image.fromarray(frame_rgb)
     img_tk = ImageTk.PhotoImage(img)
     image_label.config(image=img_tk)
@@ -238,34 +369,118 @@ def save_image():
         cv2.imwrite(filename, annotated_frame)
         print(f"Image saved as {filename}")
 
+# Start a fresh shape for the selected tool; the line tool measures two-point lines instead
+def new_shape():
+    global geometry
+    geometry = None if selected_tool.get() == "Line" else Geometry(selected_tool.get().lower())
+
+
+def shape_text():
+    shape = geometry
+    if point_correction is not None:
+        shape = geometry.mapped(point_correction.tables(annotated_frame.shape).correct_points)
+    return shape.summary_text(measurement, geometry.kind.capitalize())
+
+
+def show_shape():
+    if geometry is None or annotated_frame is None:
+        return
+    detected_label.config(text=f"{measurement_text()}\n{shape_text()}")
+    update_image_label(geometry.draw(frames.copy("overlay", annotated_frame)))
+
+
+def change_shape(action):
+    if geometry is not None and action():
+        show_shape()
+
+
+def finish_shape(event=None):
+    new_shape()
+    if annotated_frame is not None:
+        detected_label.config(text=measurement_text())
+        update_image_label(annotated_frame)
+
+
+selected_tool.trace_add("write", lambda *args: finish_shape())
+root.bind("<Return>", finish_shape)
+root.bind("<Control-z>", lambda event: change_shape(lambda: geometry.undo()))
+root.bind("<Control-y>", lambda event: change_shape(lambda: geometry.redo()))
+
+
 def handle_click(event):
-    global click_points, unit, normalization_factor, avg_car_phone_diagonal
-    click_points.append((event.x, event.y))
+    global click_points
+    if annotated_frame is None:
+        return  # Nothing to measure until a picture has been processed
+    if geometry is not None:
+        if geometry.complete:
+            new_shape()  # A finished rectangle, the next click starts another one
+        geometry.add(snapper.snap(display_to_frame(event.x, event.y, annotated_frame.shape)))
+        show_shape()
+        return
+    # Snap the click onto the nearest box corner or edge at full resolution
+    click_points.append(snapper.snap(display_to_frame(event.x, event.y, annotated_frame.shape)))
     if len(click_points) == 2:
-        x1, y1 = click_points[0]
-        x2, y2 = click_points[1]
-        annotated_frame_with_line = annotated_frame.copy()
-        height, width, _ = annotated_frame_with_line.shape
-        x1 = int(x1 * width / (width // 2))
-        y1 = int(y1 * height / (height // 2))
-        x2 = int(x2 * width / (width // 2))
-        y2 = int(y2 * height / (height // 2))
-        cv2.line(annotated_frame_with_line, (x1, y1), (x2, y2), (0, 255, 255), 8)
-        pixel_distance = calculate_distance(x1, y1, x2, y2)
-        #scaled_distance = pixel_distance / normalization_factor
-        scaled_distance = pixel_distance * normalization_factor / avg_car_phone_diagonal 
-        
-        distance_text = f"Estimated Line length: {pixel_distance:.2f} pixels, {scaled_distance:.2f} {unit}"
+        (x1, y1), (x2, y2) = click_points
+        annotated_frame_with_line = draw_measurement_line(frames.copy("overlay", annotated_frame), (x1, y1), (x2, y2))
+        if point_correction is not None:
+            # The line is drawn where it was clicked but measured where the lens really saw it
+            (x1, y1), (x2, y2) = [point_correction.correct_point(point, annotated_frame.shape) for point in click_points]
+        store.append_line(measurement, (x1, y1), (x2, y2), image_id)
+        if scale_estimate is not None and not scale_estimate.fixed_scale:
+            distance_text = scale_estimate.line_text((x1, y1), (x2, y2), "Estimated Line length")
+        else:
+            distance_text = measurement.line_text((x1, y1), (x2, y2), "Estimated Line length")
         detected_label.config(text=f"{detected_label.cget('text')}\n{distance_text}")
   
         update_image_label(annotated_frame_with_line)
         click_points = []
 
-#print(model.names)
-
-#print(f"Detected class IDs: {[box.cls for box in results[0].boxes]}")
-#print(f"Detected class names: {[model.names[int(box.cls)] for box in results[0].boxes]}")
+# Distance from every object to its nearest neighbour, all pairs in one go
+def show_spacing():
+    if measurement is None:
+        return
+    nearest, _, _ = measurement.nearest_neighbors()
+    detected_label.config(text=f"{measurement_text()}\n{measurement.spacing_text()}")
+    update_image_label(draw_nearest_neighbors(frames.copy("overlay", annotated_frame), measurement.detections, nearest))
+
+
+# Right-click selects the detected object nearest the click and shows its size
+def handle_select(event):
+    if box_index is None or not len(box_index):
+        return
+    x, y = display_to_frame(event.x, event.y, annotated_frame.shape)
+    ids, _ = box_index.nearest(x, y)
+    selected = int(ids[0])
+    name = measurement.detections.class_names[selected]
+    x1, y1, x2, y2 = measurement.detections.frame_xyxy[selected].astype(int).tolist()
+    highlighted = cv2.rectangle(frames.copy("overlay", annotated_frame), (x1, y1), (x2, y2), (0, 0, 255), 6)
+    diagonal_text = measurement.distance_text(measurement.box_differences[selected, 2], f"Selected {name} diagonal")
+    detected_label.config(text=f"{measurement_text()}\n{diagonal_text}")
+    update_image_label(highlighted)
+
+
+# Sample memory every few seconds; under pressure shrink new pictures first, then fall back to a smaller model
+def check_memory():
+    global capture_scale
+    snapshot = memory.snapshot()
+    note = ""
+    if snapshot["pressure"] != "ok":
+        frames.clear()
+        if capture_scale == 1.0:
+            capture_scale = 0.5
+            note = "pictures at half resolution"
+        elif snapshot["pressure"] == "critical" and models.smaller(selected_model.get()) is not None:
+            note = f"switching to {models.smaller(selected_model.get())}"
+            selected_model.set(models.smaller(selected_model.get()))
+    colors = {"ok": "gray", "high": "orange", "critical": "red"}
+    memory_label.config(text=memory.status_text(snapshot) + (f" - {note}" if note else ""), fg=colors[snapshot["pressure"]])
+    if note or memory.log_path:
+        memory.log(snapshot, note)
+    root.after(MEMORY_CHECK_MS, check_memory)
 
 
 image_label.bind("<Button-1>", handle_click)
-root.mainloop()
+image_label.bind("<Button-3>", handle_select)
+warm_selected_model()
+check_memory()
+root.mainloop()
\ No newline at end of file
@@ -1,10 +1,14 @@
+import os
+import sys
+
 import numpy as np
 import ncnn
-import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ncnn_decode import decode, load_names
 
 def test_inference():
-    torch.manual_seed(0)
-    in0 = torch.rand(1, 3, 640, 640, dtype=torch.float)
+    in0 = np.random.default_rng(0).random((1, 3, 640, 640), dtype=np.float32)
     out = []
 
     with ncnn.Net() as net:
@@ -12,10 +16,10 @@ def test_inference():
         net.load_model("yolov8n_ncnn_model/model.ncnn.bin")
 
         with net.create_extractor() as ex:
-            ex.input("in0", ncnn.Mat(in0.squeeze(0).numpy()).clone())
+            ex.input("in0", ncnn.Mat(in0[0]).clone())
 
             _, out0 = ex.extract("out0")
-            out.append(torch.from_numpy(np.array(out0)).unsqueeze(0))
+            out.append(np.array(out0)[None])
 
     if len(out) == 1:
         return out[0]
@@ -23,4 +27,10 @@ def test_inference():
         return tuple(out)
 
 if __name__ == "__main__":
-    print(test_inference())
+    out0 = test_inference()
+    print(out0.shape)
+    # Boxes, scores and classes straight from the raw output, no torch or Ultralytics needed
+    names = load_names("yolov8n_ncnn_model")
+    xyxy, conf, cls = decode(out0)
+    for box, score, class_id in zip(xyxy.tolist(), conf.tolist(), cls.tolist()):
+        print(f"{names[class_id]} {score:.2f} {[round(value, 1) for value in box]}")
@@ -25,9 +25,18 @@ signal.signal(signal.SIGHUP, dont_quit)
 signal.signal(signal.SIGINT, dont_quit)  # Handle SIGINT (Ctrl + C)
 signal.signal(signal.SIGTERM, dont_quit)  # Handle termination signals
 
-from rpi_vision.agent.capturev2 import PiCameraStream
 from rpi_vision.models.mobilenet_v2 import MobileNetV2Base
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Working_YOLO8_Pi5"))
+from scene_gate import SceneGate
+
+# Replay images or a video instead of the Pi camera when CAMERA_SOURCE is set
+CAMERA_SOURCE = os.environ.get("CAMERA_SOURCE")
+if CAMERA_SOURCE:
+    from camera_source import ReplayStream
+else:
+    from rpi_vision.agent.capturev2 import PiCameraStream
+
 logging.basicConfig()
 logging.getLogger().setLevel(logging.INFO)
 
@@ -58,7 +67,10 @@ last_spoken = None
 def main(args):
     global last_spoken, capture_manager, screen  # Declare screen as global
 
-    capture_manager = PiCameraStream(preview=False)
+    if CAMERA_SOURCE:
+        capture_manager = ReplayStream(CAMERA_SOURCE)
+    else:
+        capture_manager = PiCameraStream(preview=False)
 
     # Initialize screen buffer for rendering
     if args.rotation in (0, 180):
@@ -90,6 +102,9 @@ def main(args):
     capture_manager.start()
     is_fullscreen = False  # Track fullscreen state
 
+    # Skip classification while the view is unchanged, reusing the last prediction for up to a second
+    gate = SceneGate(threshold=4.0, max_stale_seconds=1.0)
+
     while not capture_manager.stopped:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
@@ -127,14 +142,16 @@ def main(args):
 
         buffer.blit(img, (0, 0), cropped_region)
 
-        timestamp = time.monotonic()
-        if args.tflite:
-            prediction = model.tflite_predict(frame)[0]
-        else:
-            prediction = model.predict(frame)[0]
+        if gate.should_run(frame):
+            timestamp = time.monotonic()
+            if args.tflite:
+                prediction = model.tflite_predict(frame)[0]
+            else:
+                prediction = model.predict(frame)[0]
 
-        delta = time.monotonic() - timestamp
-        logging.info("%s inference took %d ms, %0.1f FPS" % ("TFLite" if args.tflite else "TF", delta * 1000, 1 / delta))
+            delta = time.monotonic() - timestamp
+            logging.info("%s inference took %d ms, %0.1f FPS, %.0f%% of frames skipped" % (
+                "TFLite" if args.tflite else "TF", delta * 1000, 1 / delta, gate.skip_rate * 100))
 
         for p in prediction:
             label, name, conf = p